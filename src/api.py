@@ -1,16 +1,33 @@
+import atexit
+import base64
 import datetime
 import hashlib
+import json
 import logging
+import math
 import os
+import threading
+import time
 import uuid
 from functools import wraps
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-import jwt
-import mysql.connector
-from flask import Flask, g, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 
-from encryption_utils import aes_decrypt, aes_encrypt, hash_password, verify_password
+import audit
+import batch_ops
+import search
+from db_pool import ConnectionPool, PoolTimeout
+from masking import mask_email, mask_name
+from metrics import REGISTRY, phase, set_scope
+from password_pool import PasswordWorkerPool, PoolSaturated
+from rate_limit import AdmissionController, Overloaded, RateLimited, TokenBuckets, parse_limit
+from response_cache import CachedResponse, ResponseCache
+from token_cache import TokenCache
+from encryption_utils import aes_decrypt, aes_decrypt_many, aes_encrypt, email_blind_index, password_needs_rehash, warm_keys
+
+# jwt and mysql.connector are imported where first used: together they are most
+# of this module's import time. prefork.py calls warm_up() to pay it once up front.
 
 # Basic config
 logging.basicConfig(
@@ -25,39 +42,114 @@ DB_CONFIG = {
     "database": os.getenv("DB_NAME"),
 }
 
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+DB_POOL_HEALTH_INTERVAL = float(os.getenv("DB_POOL_HEALTH_INTERVAL", "30"))
+
 JWT_SECRET = os.getenv("JWT_SECRET", "change-me")
 JWT_ALGORITHM = "HS256"
 JWT_EXP_MINUTES = int(os.getenv("JWT_EXP_MINUTES", "60"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(os.cpu_count() or 2)))
+BCRYPT_MAX_QUEUE = int(os.getenv("BCRYPT_MAX_QUEUE", "16"))
+BCRYPT_POOL_KIND = os.getenv("BCRYPT_POOL_KIND", "thread")  # thread | process
+BCRYPT_BATCH_WORKERS = int(os.getenv("BCRYPT_BATCH_WORKERS", "0")) or None  # batch hashing; default half of BCRYPT_WORKERS
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "30"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+JWT_REVOCATION_FILE = os.getenv("JWT_REVOCATION_FILE")  # one sha256(token) hex digest per line
+
+DEFAULT_PAGE_LIMIT = int(os.getenv("DEFAULT_PAGE_LIMIT", "100"))
+MAX_PAGE_LIMIT = int(os.getenv("MAX_PAGE_LIMIT", "1000"))
+STREAM_FETCH_SIZE = int(os.getenv("STREAM_FETCH_SIZE", "500"))
+PII_DECRYPT_WORKERS = int(os.getenv("PII_DECRYPT_WORKERS", "0"))
+
+# Token-bucket limits as "N/period" (see rate_limit.parse_limit); "off" disables one.
+RATE_LIMITS = {
+    "ip": parse_limit(os.getenv("RATE_LIMIT_IP", "off")),  # every request, per client IP
+    "login_ip": parse_limit(os.getenv("RATE_LIMIT_LOGIN_IP", "20/minute")),
+    "login_account": parse_limit(os.getenv("RATE_LIMIT_LOGIN_ACCOUNT", "10/minute")),  # per user_id / email tried
+    "write_ip": parse_limit(os.getenv("RATE_LIMIT_WRITE_IP", "300/minute")),  # POST/PUT/DELETE, per IP and route
+    "write_user": parse_limit(os.getenv("RATE_LIMIT_WRITE_USER", "120/minute")),  # per token `sub` and route
+}
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))  # proxies that append to X-Forwarded-For
+# Requests in progress per process before new ones are shed with 503 (0 disables).
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", str(DB_POOL_SIZE * 2)))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "0.05"))
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+ADMISSION_EXEMPT = {"/health", "/metrics"}
 
 PII_FIELDS = {"email", "full_name", "password"}
 
 app = Flask(__name__)
 
+token_cache = TokenCache(max_entries=TOKEN_CACHE_SIZE, max_ttl=TOKEN_CACHE_TTL)
+if JWT_REVOCATION_FILE and os.path.exists(JWT_REVOCATION_FILE):
+    with open(JWT_REVOCATION_FILE) as _f:
+        token_cache.load_revocations(_f)
+
+response_cache = ResponseCache(max_bytes=RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL)
+password_pool = PasswordWorkerPool(
+    workers=BCRYPT_WORKERS, max_queue=BCRYPT_MAX_QUEUE, kind=BCRYPT_POOL_KIND, batch_workers=BCRYPT_BATCH_WORKERS
+)
+# Replaced by shared_state stand-ins under prefork (use_shared_state), so every
+# worker sees the same cached pages, revocations and rate-limit buckets.
+rate_limits = TokenBuckets()
+admission = AdmissionController(ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_WAIT)
+# Write-behind: handlers queue events, a background thread writes them in batches.
+audit_log = audit.AuditLog(
+    audit.make_sink(audit.AUDIT_SINK, lambda: connect_mysql()),  # connect_mysql is defined below
+    fallback=audit.FileSink(audit.AUDIT_FILE) if audit.AUDIT_SINK == "table" else None,
+)
+atexit.register(audit_log.close)
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.RLock()
+
+# Per-route request metrics; per-phase timings (auth, db, crypto, ...) go to
+# metrics.PHASE_SECONDS with the route as scope. Both are served on /metrics.
+HTTP_REQUESTS = REGISTRY.counter("http_requests_total", "HTTP requests completed", ("method", "route", "status"))
+HTTP_LATENCY = REGISTRY.histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "HTTP requests currently being handled")
+REGISTRY.register_stats("db_pool", "DB connection pool", lambda: _pool.stats() if _pool is not None else None)
+REGISTRY.register_stats("token_cache", "Verified-token cache", token_cache.stats)
+REGISTRY.register_stats("password_pool", "bcrypt worker pool", password_pool.stats)
+REGISTRY.register_stats("response_cache", "GET response cache", lambda: response_cache.stats())
+REGISTRY.register_stats("rate_limits", "Rate-limit buckets", lambda: rate_limits.stats())
+REGISTRY.register_stats("admission", "Admission control", admission.stats)
+REGISTRY.register_stats("audit", "Audit log queue", audit_log.stats)
+HTTP_RATE_LIMITED = REGISTRY.counter("http_rate_limited_total", "Requests rejected by a rate limit", ("rule",))
+
 
 # ------------------------------
 # Helpers
 # ------------------------------
-def mask_email(email: Optional[str]) -> str:
-    if not email or "@" not in email:
-        return "***"
-    local, domain = email.split("@", 1)
-    return f"{local[:1]}***@{domain}"
-
-
-def mask_name(name: Optional[str]) -> str:
-    if not name:
-        return "***"
-    parts = name.split()
-    masked_parts = [p[0] + "***" if p else "***" for p in parts]
-    return " ".join(masked_parts)
-
-
 def hash_for_log(value: Optional[str]) -> str:
     if not value:
         return ""
     return hashlib.sha256(value.encode()).hexdigest()[:10]
 
 
+def request_audit_event(action: str, resource: str, resource_id: Optional[str] = None, **detail: Any) -> Dict[str, Any]:
+    # Actor and request_id from the current request; ids hashed as in log lines.
+    user = g.get("current_user") or {}
+    return audit.make_event(
+        action,
+        resource,
+        hash_for_log(str(resource_id)) if resource_id is not None else None,
+        actor=hash_for_log(user.get("sub")),
+        role=user.get("role"),
+        request_id=g.get("request_id"),
+        **detail,
+    )
+
+
+def audit_event(action: str, resource: str, resource_id: Optional[str] = None, **detail: Any) -> None:
+    # Queued for the audit log after the change is committed.
+    audit_log.record_many([request_audit_event(action, resource, resource_id, **detail)])
+
+
 def safe_decrypt(value: Optional[str]) -> Optional[str]:
     if not value:
         return value
@@ -67,24 +159,188 @@ def safe_decrypt(value: Optional[str]) -> Optional[str]:
         return None
 
 
-def get_db():
+def connect_mysql():
     if not all(DB_CONFIG.values()):
         raise RuntimeError("Database credentials missing (DB_USER, DB_PASSWORD, DB_NAME required).")
+    import mysql.connector
+
+    return mysql.connector.connect(**DB_CONFIG)
+
+
+def configure_pool(factory=connect_mysql, **options) -> ConnectionPool:
+    # Tests and local runs can swap in e.g. factory=lambda: sqlite3.connect(...)
+    global _pool
+    options.setdefault("size", DB_POOL_SIZE)
+    options.setdefault("max_lifetime", DB_POOL_MAX_LIFETIME)
+    options.setdefault("wait_timeout", DB_POOL_TIMEOUT)
+    options.setdefault("health_check_interval", DB_POOL_HEALTH_INTERVAL)
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(factory, **options)
+    return _pool
+
+
+def warm_up() -> None:
+    # Work each worker would otherwise repeat on its first requests; safe before fork.
+    import jwt  # noqa: F401
+    import mysql.connector  # noqa: F401
+
+    warm_keys()
+
+
+def shared_state_objects() -> Dict[str, Any]:
+    # What the shared_state server holds on behalf of all workers.
+    revocations = TokenCache(max_entries=0)
+    if JWT_REVOCATION_FILE and os.path.exists(JWT_REVOCATION_FILE):
+        with open(JWT_REVOCATION_FILE) as f:
+            revocations.load_revocations(f)
+    return {
+        "response_cache": ResponseCache(max_bytes=RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL),
+        "revocations": revocations,
+        "rate_limits": TokenBuckets(),
+    }
+
+
+def use_shared_state(client) -> None:
+    global response_cache, rate_limits
+    import shared_state
+
+    response_cache = shared_state.SharedResponseCache(client, ttl=RESPONSE_CACHE_TTL)
+    rate_limits = shared_state.SharedTokenBuckets(client)
+    token_cache.shared = shared_state.SharedRevocations(client)
+
+
+def init_worker(shared_address: Optional[str] = None, shared_authkey: Optional[bytes] = None) -> None:
+    # Call in every worker after fork. Connections and executor threads must not be
+    # shared across processes, so drop the inherited ones without closing them.
+    # With a shared state address (or SHARED_STATE_SOCKET) caches go cross-process.
+    global _pool
+    with _pool_lock:
+        inherited, _pool = _pool, None
+    password_pool.reset()
+    audit_log.reset()
+    if inherited is not None:
+        configure_pool(
+            inherited._factory,
+            size=inherited.size,
+            max_lifetime=inherited.max_lifetime,
+            wait_timeout=inherited.wait_timeout,
+            health_check=inherited._health_check,
+            health_check_interval=inherited.health_check_interval,
+        )
+
+    import shared_state
+
+    address = shared_address or shared_state.SHARED_STATE_SOCKET
+    if address:
+        use_shared_state(shared_state.Client(address, shared_authkey or shared_state.SHARED_STATE_AUTHKEY.encode()))
+
+
+def shutdown_worker() -> None:
+    # Call when a worker stops serving (after in-flight requests finish):
+    # writes out queued audit events. os._exit() skips atexit handlers.
+    audit_log.close()
+
+
+def get_pool() -> ConnectionPool:
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                configure_pool()
+    return _pool
+
+
+def get_db():
     if "db" not in g:
-        g.db = mysql.connector.connect(**DB_CONFIG)
+        with phase("db_acquire"):
+            g.db = get_pool().acquire()
     return g.db
 
 
+def route_label() -> str:
+    # The URL rule, not the path, so ids don't explode label cardinality.
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
 @app.before_request
 def add_request_id():
     g.request_id = str(uuid.uuid4())
 
 
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+    set_scope(route_label())
+
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed bodies are timed to the first byte; the rest is sent after this hook.
+    route = route_label()
+    HTTP_LATENCY.labels(request.method, route).observe(time.perf_counter() - g.request_start)
+    HTTP_REQUESTS.labels(request.method, route, response.status_code).inc()
+    return response
+
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    if g.pop("request_start", None) is not None:
+        HTTP_IN_FLIGHT.dec()
+
+
+@app.before_request
+def admit_request():
+    # Cheap rejections first: per-IP limits, then the in-flight cap, all before
+    # auth, bcrypt or a DB connection is spent on the request.
+    route = route_label()
+    g.client_ip = client_ip(request.remote_addr, request.headers.get("X-Forwarded-For"))
+    if route in ADMISSION_EXEMPT:
+        return
+    enforce_rate_limit("ip", g.client_ip)
+    if is_limited_write(request.method, route):
+        enforce_rate_limit("write_ip", g.client_ip, route)
+    admission.acquire()
+    g.admitted = True
+
+
+@app.teardown_request
+def release_admission(error=None):
+    if g.pop("admitted", False):
+        admission.release()
+
+
+def client_ip(remote_addr: Optional[str], forwarded_for: Optional[str]) -> str:
+    # Behind N trusted proxies the client is the N-th X-Forwarded-For entry from
+    # the right; anything further left is client-supplied and can be forged.
+    if TRUSTED_PROXY_HOPS and forwarded_for:
+        hops = [addr.strip() for addr in forwarded_for.split(",")]
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return hops[-TRUSTED_PROXY_HOPS]
+    return remote_addr or "unknown"
+
+
+def is_limited_write(method: str, route: str) -> bool:
+    # /auth/* have their own limits (login) or none worth having (logout).
+    return method in WRITE_METHODS and not route.startswith("/auth/")
+
+
+def enforce_rate_limit(rule: str, *key: Any) -> None:
+    limit = RATE_LIMITS.get(rule)
+    if limit is None:
+        return
+    allowed, retry_after = rate_limits.take(rule + ":" + ":".join(map(str, key)), limit.rate, limit.burst)
+    if not allowed:
+        HTTP_RATE_LIMITED.labels(rule).inc()
+        raise RateLimited(rule, retry_after)
+
+
 @app.teardown_appcontext
 def close_db(error=None):
     db = g.pop("db", None)
     if db is not None:
-        db.close()
+        get_pool().release(db)
 
 
 def generate_token(user_id: str, role: str) -> str:
@@ -94,6 +350,8 @@ def generate_token(user_id: str, role: str) -> str:
         "exp": datetime.datetime.utcnow() + datetime.timedelta(minutes=JWT_EXP_MINUTES),
         "iat": datetime.datetime.utcnow(),
     }
+    import jwt
+
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 
@@ -105,18 +363,34 @@ def require_auth(roles: Optional[List[str]] = None):
             token = auth_header.split(" ", 1)[1] if auth_header.startswith("Bearer ") else None
             if not token:
                 return jsonify({"error": "missing or invalid Authorization header", "request_id": g.request_id}), 401
-            try:
-                payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-            except jwt.ExpiredSignatureError:
-                return jsonify({"error": "token expired", "request_id": g.request_id}), 401
-            except jwt.InvalidTokenError:
-                return jsonify({"error": "invalid token", "request_id": g.request_id}), 401
+
+            with phase("auth"):
+                revoked = token_cache.is_revoked(token)
+                payload = None if revoked else token_cache.get(token)
+                error = None
+                if not revoked and payload is None:
+                    import jwt
+
+                    try:
+                        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+                        token_cache.put(token, payload)
+                    except jwt.ExpiredSignatureError:
+                        error = "token expired"
+                    except jwt.InvalidTokenError:
+                        error = "invalid token"
+            if revoked:
+                return jsonify({"error": "token revoked", "request_id": g.request_id}), 401
+            if error:
+                return jsonify({"error": error, "request_id": g.request_id}), 401
 
             role = payload.get("role", "user")
             if roles and role not in roles:
                 return jsonify({"error": "forbidden for role", "request_id": g.request_id}), 403
 
             g.current_user = payload
+            g.auth_token = token
+            if is_limited_write(request.method, route_label()):
+                enforce_rate_limit("write_user", payload.get("sub"), route_label())
             return fn(*args, **kwargs)
 
         return wrapper
@@ -125,23 +399,237 @@ def require_auth(roles: Optional[List[str]] = None):
 
 
 def sanitized_user_row(row: Dict[str, Any]) -> Dict[str, Any]:
-    email_plain = safe_decrypt(row.get("email"))
-    full_name_plain = safe_decrypt(row.get("full_name"))
-    return {
-        "id": row.get("id"),
-        "email": mask_email(email_plain),
-        "full_name": mask_name(full_name_plain),
-        "role": row.get("role", "user"),
-    }
+    return sanitized_user_rows([row])[0]
+
+
+def sanitized_user_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Decrypt whole columns at once; one batch per page instead of two calls per row.
+    with phase("crypto"):
+        emails = aes_decrypt_many([row.get("email") for row in rows], workers=PII_DECRYPT_WORKERS, strict=False)
+        names = aes_decrypt_many([row.get("full_name") for row in rows], workers=PII_DECRYPT_WORKERS, strict=False)
+    return [
+        {
+            "id": row.get("id"),
+            "email": mask_email(email_plain),
+            "full_name": mask_name(full_name_plain),
+            "role": row.get("role", "user"),
+        }
+        for row, email_plain, full_name_plain in zip(rows, emails, names)
+    ]
 
 
 def bad_request(message: str):
     return jsonify({"error": message, "request_id": g.request_id}), 400
 
 
+# ------------------------------
+# Pagination / streaming
+# ------------------------------
+RowTransform = Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]
+
+
+def encode_cursor(last_id: str) -> str:
+    raw = json.dumps({"after": last_id}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[str]:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return str(json.loads(raw)["after"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("invalid cursor")
+
+
+def page_args(args, streaming: bool = False) -> Tuple[Optional[str], Optional[int]]:
+    after = decode_cursor(args.get("after"))
+    raw_limit = args.get("limit")
+    if raw_limit is None:
+        # Streams are bounded by the server-side cursor, not by a page size.
+        return after, None if streaming else DEFAULT_PAGE_LIMIT
+    try:
+        limit = int(raw_limit)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1 or limit > MAX_PAGE_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_LIMIT}")
+    return after, limit
+
+
+def keyset_query(
+    select_sql: str,
+    where: Optional[List[str]],
+    params: Optional[List[Any]],
+    after: Optional[str],
+    limit: Optional[int],
+) -> Tuple[str, List[Any]]:
+    clauses = list(where or [])
+    sql_params = list(params or [])
+    if after is not None:
+        clauses.append("id > %s")
+        sql_params.append(after)
+    sql = select_sql
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY id"
+    if limit is not None:
+        sql += " LIMIT %s"
+        sql_params.append(limit)
+    return sql, sql_params
+
+
+def stream_rows(key: str, sql: str, params: List[Any], fmt: str, transform: Optional[RowTransform] = None):
+    db = get_db()
+    request_id = g.request_id
+
+    def generate():
+        # Unbuffered cursor: rows are pulled from the server as the client reads.
+        cursor = db.cursor(dictionary=True, buffered=False)
+        first = True
+        try:
+            cursor.execute(sql, params)
+            if fmt == "json":
+                yield f'{{"{key}": ['
+            while True:
+                rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+                if not rows:
+                    break
+                if transform:
+                    rows = transform(rows)
+                if fmt == "json":
+                    chunk = ",".join(json.dumps(row, default=str) for row in rows)
+                    yield chunk if first else "," + chunk
+                else:
+                    yield "".join(json.dumps(row, default=str) + "\n" for row in rows)
+                first = False
+            if fmt == "json":
+                yield f'], "request_id": {json.dumps(request_id)}}}'
+        finally:
+            try:
+                cursor.close()
+            except Exception:
+                # Client went away mid-stream; the pool discards the connection.
+                pass
+
+    mimetype = "application/json" if fmt == "json" else "application/x-ndjson"
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={"X-Request-ID": request_id})
+
+
+def cached_json(entry: CachedResponse, hit: bool):
+    if entry.etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        # Cached bodies are stored without request_id; splice it in instead of re-serializing.
+        body = entry.body[:-1] + b', "request_id": ' + json.dumps(g.request_id).encode() + b"}"
+        response = Response(body, mimetype="application/json")
+    response.set_etag(entry.etag)
+    response.headers["X-Cache"] = "HIT" if hit else "MISS"
+    return response
+
+
+def list_rows(
+    key: str,
+    select_sql: str,
+    where: Optional[List[str]] = None,
+    params: Optional[List[Any]] = None,
+    transform: Optional[RowTransform] = None,
+    cache_tags: Tuple[str, ...] = (),
+    count_table: Optional[str] = None,
+):
+    stream_fmt = request.args.get("stream")
+    if stream_fmt is None and request.accept_mimetypes.best == "application/x-ndjson":
+        stream_fmt = "ndjson"
+    if stream_fmt not in (None, "ndjson", "json"):
+        return bad_request("stream must be 'ndjson' or 'json'")
+
+    try:
+        after, limit = page_args(request.args, streaming=stream_fmt is not None)
+    except ValueError as err:
+        return bad_request(str(err))
+
+    if stream_fmt:
+        sql, sql_params = keyset_query(select_sql, where, params, after, limit)
+        return stream_rows(key, sql, sql_params, stream_fmt, transform)
+
+    if cache_tags:
+        cache_key = request.full_path
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached_json(cached, hit=True)
+        generation = response_cache.generation(cache_tags)
+
+    # Fetch one extra row to learn whether another page exists.
+    sql, sql_params = keyset_query(select_sql, where, params, after, limit + 1)
+    db = get_db()
+    payload: Dict[str, Any] = {}
+    with phase("db"):
+        cursor = db.cursor(dictionary=True)
+        cursor.execute(sql, sql_params)
+        rows = cursor.fetchall()
+        cursor.close()
+
+        if count_table:
+            # Total matching rows across all pages (the filter only, not the cursor).
+            count_sql = f"SELECT COUNT(*) AS total FROM {count_table}"
+            if where:
+                count_sql += " WHERE " + " AND ".join(where)
+            cursor = db.cursor(dictionary=True)
+            cursor.execute(count_sql, list(params or []))
+            payload["total"] = cursor.fetchone()["total"]
+            cursor.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["id"])
+    if transform:
+        rows = transform(rows)
+    payload.update({key: rows, "next_cursor": next_cursor})
+
+    with phase("serialize"):
+        if cache_tags:
+            body = json.dumps(payload, default=str).encode()
+            return cached_json(response_cache.put(cache_key, body, cache_tags, generation), hit=False)
+
+        payload["request_id"] = g.request_id
+        return jsonify(payload)
+
+
 # ------------------------------
 # Error handling
 # ------------------------------
+@app.errorhandler(PoolTimeout)
+def handle_pool_timeout(err):
+    logging.warning("Request %s waited too long for a DB connection: %s", g.get("request_id"), err)
+    return jsonify({"error": "service busy, try again", "request_id": g.get("request_id")}), 503
+
+
+@app.errorhandler(PoolSaturated)
+def handle_password_pool_saturated(err):
+    logging.warning("Request %s rejected: %s", g.get("request_id"), err)
+    response = jsonify({"error": "too many requests, try again", "request_id": g.get("request_id")})
+    response.headers["Retry-After"] = "1"
+    return response, 429
+
+
+@app.errorhandler(RateLimited)
+def handle_rate_limited(err):
+    logging.warning("Request %s rejected: %s", g.get("request_id"), err)
+    response = jsonify({"error": "rate limit exceeded, try again later", "request_id": g.get("request_id")})
+    response.headers["Retry-After"] = str(max(1, math.ceil(err.retry_after)))
+    return response, 429
+
+
+@app.errorhandler(Overloaded)
+def handle_overloaded(err):
+    logging.warning("Request %s shed: %s", g.get("request_id"), err)
+    response = jsonify({"error": "service busy, try again", "request_id": g.get("request_id")})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+
 @app.errorhandler(Exception)
 def handle_exception(err):
     logging.exception("Request %s failed: %s", g.get("request_id"), err)
@@ -153,31 +641,76 @@ def handle_exception(err):
 # ------------------------------
 @app.route("/health", methods=["GET"])
 def health():
-    return jsonify({"status": "ok", "request_id": g.request_id})
+    pool_stats = _pool.stats() if _pool is not None else None
+    return jsonify(
+        {
+            "status": "ok",
+            "db_pool": pool_stats,
+            "token_cache": token_cache.stats(),
+            "password_pool": password_pool.stats(),
+            "response_cache": response_cache.stats(),
+            "rate_limits": rate_limits.stats(),
+            "admission": admission.stats(),
+            "audit": audit_log.stats(),
+            "request_id": g.request_id,
+        }
+    )
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/auth/login", methods=["POST"])
 def login():
     body = request.get_json(force=True, silent=True) or {}
     user_id = body.get("user_id")
+    email = body.get("email")
     password = body.get("password")
 
-    if not user_id or not password:
-        return bad_request("user_id and password are required")
+    enforce_rate_limit("login_ip", g.client_ip)
+    if not (user_id or email) or not password:
+        return bad_request("user_id (or email) and password are required")
+    # Per targeted account, so spreading guesses over many IPs doesn't help.
+    enforce_rate_limit("login_account", hash_for_log(str(user_id or email).strip().lower()))
 
     db = get_db()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute(
-        "SELECT id, password_hash, role, email, full_name FROM users WHERE id = %s",
-        (user_id,),
-    )
-    row = cursor.fetchone()
-    cursor.close()
-
-    if not row or not verify_password(password, row["password_hash"]):
-        logging.warning("Invalid login for user %s (hash=%s)", user_id, hash_for_log(user_id))
+    with phase("db"):
+        cursor = db.cursor(dictionary=True)
+        if user_id:
+            cursor.execute(
+                "SELECT id, password_hash, role, email, full_name FROM users WHERE id = %s",
+                (user_id,),
+            )
+        else:
+            cursor.execute(
+                "SELECT id, password_hash, role, email, full_name FROM users WHERE email_bidx = %s LIMIT 1",
+                (email_blind_index(email),),
+            )
+        row = cursor.fetchone()
+        cursor.close()
+    user_id = user_id or email
+
+    if not row or not password_pool.verify(password, row["password_hash"]):
+        logging.warning("Invalid login (hash=%s)", hash_for_log(user_id))
         return jsonify({"error": "invalid credentials", "request_id": g.request_id}), 401
 
+    if password_needs_rehash(row["password_hash"]):
+        # Cost factor changed since this hash was made; upgrade it while we have the password.
+        # Optional work: a busy bcrypt pool skips it rather than failing a valid login.
+        try:
+            new_hash = password_pool.hash(password)
+        except PoolSaturated:
+            new_hash = None
+            logging.info("Skipped rehash for user %s: bcrypt pool busy", hash_for_log(user_id))
+        if new_hash is not None:
+            cursor = db.cursor()
+            cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s", (new_hash, row["id"]))
+            db.commit()
+            cursor.close()
+            logging.info("Rehashed password for user %s", hash_for_log(user_id))
+
     role = row.get("role") or "user"
     token = generate_token(user_id=row["id"], role=role)
 
@@ -192,20 +725,48 @@ def login():
     )
 
 
+@app.route("/auth/logout", methods=["POST"])
+@require_auth(roles=["admin", "user"])
+def logout():
+    token_cache.revoke(g.auth_token, expires_at=g.current_user.get("exp"))
+    logging.info("User %s logged out", hash_for_log(g.current_user.get("sub")))
+    return jsonify({"status": "logged out", "request_id": g.request_id})
+
+
 # ------------------------------
 # Users
 # ------------------------------
 @app.route("/users", methods=["GET"])
 @require_auth(roles=["admin", "user"])
 def get_users():
-    db = get_db()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT id, email, full_name, role FROM users")
-    rows = cursor.fetchall()
-    cursor.close()
+    email = request.args.get("email")
+    if email is not None:
+        # Indexed equality match on the HMAC blind index; no table-wide decrypt.
+        return list_rows(
+            "users",
+            "SELECT id, email, full_name, role FROM users",
+            where=["email_bidx = %s"],
+            params=[email_blind_index(email)],
+            transform=sanitized_user_rows,
+        )
+    return list_rows(
+        "users",
+        "SELECT id, email, full_name, role FROM users",
+        transform=sanitized_user_rows,
+    )
 
-    users = [sanitized_user_row(row) for row in rows]
-    return jsonify({"users": users, "request_id": g.request_id})
+
+@app.route("/users/<user_id>/feature_requests", methods=["GET"])
+@require_auth(roles=["admin", "user"])
+def list_user_feature_requests(user_id):
+    return list_rows(
+        "feature_requests",
+        "SELECT id, title, content, user_id FROM feature_requests",
+        where=["user_id = %s"],
+        params=[user_id],
+        cache_tags=("feature_requests",),
+        count_table="feature_requests",
+    )
 
 
 @app.route("/users", methods=["POST"])
@@ -219,21 +780,22 @@ def create_user():
 
     email_encrypted = aes_encrypt(body["email"])
     full_name_encrypted = aes_encrypt(body["full_name"])
-    password_hash = hash_password(body["password"])
+    password_hash = password_pool.hash(body["password"])
     role = body.get("role", "user")
 
     db = get_db()
     cursor = db.cursor()
     cursor.execute(
         """
-        INSERT INTO users (id, email, password_hash, full_name, role)
-        VALUES (%s, %s, %s, %s, %s)
+        INSERT INTO users (id, email, email_bidx, password_hash, full_name, role)
+        VALUES (%s, %s, %s, %s, %s, %s)
         """,
-        (body["id"], email_encrypted, password_hash, full_name_encrypted, role),
+        (body["id"], email_encrypted, email_blind_index(body["email"]), password_hash, full_name_encrypted, role),
     )
     db.commit()
     cursor.close()
 
+    audit_event("create", "users", body["id"], new_role=role)
     logging.info("Created user id=%s email_hash=%s", body["id"], hash_for_log(body["email"]))
     return jsonify(
         {
@@ -264,12 +826,14 @@ def update_user(user_id):
         if field == "email":
             updates.append("email = %s")
             params.append(aes_encrypt(body[field]))
+            updates.append("email_bidx = %s")
+            params.append(email_blind_index(body[field]))
         elif field == "full_name":
             updates.append("full_name = %s")
             params.append(aes_encrypt(body[field]))
         elif field == "password":
             updates.append("password_hash = %s")
-            params.append(hash_password(body[field]))
+            params.append(password_pool.hash(body[field]))
         elif field == "role":
             updates.append("role = %s")
             params.append(body[field])
@@ -284,6 +848,7 @@ def update_user(user_id):
     db.commit()
     cursor.close()
 
+    audit_event("update", "users", user_id, fields=sorted(allowed & body.keys()))
     logging.info("Updated user %s", hash_for_log(user_id))
     return jsonify({"status": "updated", "request_id": g.request_id})
 
@@ -296,7 +861,9 @@ def delete_user(user_id):
     cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
     db.commit()
     cursor.close()
+    response_cache.invalidate("feature_requests", "comments")
 
+    audit_event("delete", "users", user_id)
     logging.info("Deleted user %s", hash_for_log(user_id))
     return jsonify({"status": "deleted", "request_id": g.request_id})
 
@@ -307,13 +874,78 @@ def delete_user(user_id):
 @app.route("/feature_requests", methods=["GET"])
 @require_auth(roles=["admin", "user"])
 def list_feature_requests():
-    db = get_db()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT id, title, content, user_id FROM feature_requests")
-    rows = cursor.fetchall()
-    cursor.close()
+    return list_rows(
+        "feature_requests",
+        "SELECT id, title, content, user_id FROM feature_requests",
+        cache_tags=("feature_requests",),
+    )
 
-    return jsonify({"feature_requests": rows, "request_id": g.request_id})
+
+@app.route("/feature_requests/<fr_id>", methods=["GET"])
+@require_auth(roles=["admin", "user"])
+def get_feature_request(fr_id):
+    embed = request.args.get("embed")
+    if embed not in (None, "comments"):
+        return bad_request("embed must be 'comments'")
+
+    db = get_db()
+    with phase("db"):
+        cursor = db.cursor(dictionary=True)
+        if embed:
+            # One joined query instead of a request per comment list.
+            cursor.execute(
+                """
+                SELECT fr.id, fr.title, fr.content, fr.user_id,
+                       c.id AS comment_id, c.content AS comment_content, c.user_id AS comment_user_id
+                FROM feature_requests fr
+                LEFT JOIN comments c ON c.feature_request_id = fr.id
+                WHERE fr.id = %s
+                ORDER BY c.id
+                LIMIT %s
+                """,
+                (fr_id, MAX_PAGE_LIMIT + 1),
+            )
+            rows = cursor.fetchall()
+        else:
+            cursor.execute("SELECT id, title, content, user_id FROM feature_requests WHERE id = %s", (fr_id,))
+            row = cursor.fetchone()
+            rows = [row] if row else []
+        cursor.close()
+
+    if not rows:
+        return jsonify({"error": "feature request not found", "request_id": g.request_id}), 404
+
+    first = rows[0]
+    feature_request = {k: first[k] for k in ("id", "title", "content", "user_id")}
+    if embed:
+        comments = [
+            {
+                "id": r["comment_id"],
+                "content": r["comment_content"],
+                "user_id": r["comment_user_id"],
+                "feature_request_id": first["id"],
+            }
+            for r in rows[:MAX_PAGE_LIMIT]
+            if r["comment_id"] is not None
+        ]
+        feature_request["comments"] = comments
+        # More than MAX_PAGE_LIMIT comments: page the rest via /feature_requests/<id>/comments
+        feature_request["comments_truncated"] = len(rows) > MAX_PAGE_LIMIT
+
+    return jsonify({"feature_request": feature_request, "request_id": g.request_id})
+
+
+@app.route("/feature_requests/<fr_id>/comments", methods=["GET"])
+@require_auth(roles=["admin", "user"])
+def list_feature_request_comments(fr_id):
+    return list_rows(
+        "comments",
+        "SELECT id, content, user_id, feature_request_id FROM comments",
+        where=["feature_request_id = %s"],
+        params=[fr_id],
+        cache_tags=("comments",),
+        count_table="comments",
+    )
 
 
 @app.route("/feature_requests", methods=["POST"])
@@ -336,7 +968,9 @@ def create_feature_request():
     )
     db.commit()
     cursor.close()
+    response_cache.invalidate("feature_requests")
 
+    audit_event("create", "feature_requests", body["id"])
     logging.info("Feature request %s created by %s", body["id"], hash_for_log(body["user_id"]))
     return jsonify({"status": "created", "id": body["id"], "request_id": g.request_id}), 201
 
@@ -363,7 +997,9 @@ def update_feature_request(fr_id):
     cursor.execute(f"UPDATE feature_requests SET {', '.join(updates)} WHERE id = %s", params)
     db.commit()
     cursor.close()
+    response_cache.invalidate("feature_requests")
 
+    audit_event("update", "feature_requests", fr_id, fields=sorted(allowed & body.keys()))
     logging.info("Feature request %s updated", fr_id)
     return jsonify({"status": "updated", "request_id": g.request_id})
 
@@ -376,7 +1012,9 @@ def delete_feature_request(fr_id):
     cursor.execute("DELETE FROM feature_requests WHERE id = %s", (fr_id,))
     db.commit()
     cursor.close()
+    response_cache.invalidate("feature_requests")
 
+    audit_event("delete", "feature_requests", fr_id)
     logging.info("Feature request %s deleted", fr_id)
     return jsonify({"status": "deleted", "request_id": g.request_id})
 
@@ -387,13 +1025,11 @@ def delete_feature_request(fr_id):
 @app.route("/comments", methods=["GET"])
 @require_auth(roles=["admin", "user"])
 def list_comments():
-    db = get_db()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT id, content, user_id, feature_request_id FROM comments")
-    rows = cursor.fetchall()
-    cursor.close()
-
-    return jsonify({"comments": rows, "request_id": g.request_id})
+    return list_rows(
+        "comments",
+        "SELECT id, content, user_id, feature_request_id FROM comments",
+        cache_tags=("comments",),
+    )
 
 
 @app.route("/comments", methods=["POST"])
@@ -416,7 +1052,9 @@ def create_comment():
     )
     db.commit()
     cursor.close()
+    response_cache.invalidate("comments")
 
+    audit_event("create", "comments", body["id"])
     logging.info("Comment %s created by %s", body["id"], hash_for_log(body["user_id"]))
     return jsonify({"status": "created", "id": body["id"], "request_id": g.request_id}), 201
 
@@ -443,7 +1081,9 @@ def update_comment(comment_id):
     cursor.execute(f"UPDATE comments SET {', '.join(updates)} WHERE id = %s", params)
     db.commit()
     cursor.close()
+    response_cache.invalidate("comments")
 
+    audit_event("update", "comments", comment_id, fields=sorted(allowed & body.keys()))
     logging.info("Comment %s updated", comment_id)
     return jsonify({"status": "updated", "request_id": g.request_id})
 
@@ -456,10 +1096,151 @@ def delete_comment(comment_id):
     cursor.execute("DELETE FROM comments WHERE id = %s", (comment_id,))
     db.commit()
     cursor.close()
+    response_cache.invalidate("comments")
 
+    audit_event("delete", "comments", comment_id)
     logging.info("Comment %s deleted", comment_id)
     return jsonify({"status": "deleted", "request_id": g.request_id})
 
 
+# ------------------------------
+# Search
+# ------------------------------
+@app.route("/search", methods=["GET"])
+@require_auth(roles=["admin", "user"])
+def search_text():
+    terms = search.query_terms(request.args.get("q", ""))
+    if not terms:
+        return bad_request(f"q has no searchable words ({search.MIN_TERM_LENGTH}+ letters, not a stopword)")
+    kind = request.args.get("type")
+    if kind not in (None, *search.SEARCH_SOURCES):
+        return bad_request(f"type must be one of: {', '.join(search.SEARCH_SOURCES)}")
+    try:
+        # Ranked results have no stable key to page by, so the cursor holds an offset.
+        offset = int(decode_cursor(request.args.get("after")) or 0)
+        limit = int(request.args.get("limit", search.SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        return bad_request("invalid cursor or limit")
+    if limit < 1 or limit > search.SEARCH_MAX_LIMIT:
+        return bad_request(f"limit must be between 1 and {search.SEARCH_MAX_LIMIT}")
+    if offset < 0 or offset + limit > search.SEARCH_MAX_RESULTS:
+        return bad_request(f"only the first {search.SEARCH_MAX_RESULTS} results can be paged; refine the query")
+
+    cache_tags = ("feature_requests", "comments")
+    cache_key = request.full_path
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached_json(cached, hit=True)
+    generation = response_cache.generation(cache_tags)
+
+    types = [kind] if kind else list(search.SEARCH_SOURCES)
+    # One extra row tells whether another page exists.
+    sql, params = search.search_sql(types, search.boolean_query(terms), offset, limit + 1)
+    db = get_db()
+    with phase("db"):
+        cursor = db.cursor(dictionary=True)
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        cursor.close()
+
+    next_cursor = None
+    if len(rows) > limit and offset + limit < search.SEARCH_MAX_RESULTS:
+        next_cursor = encode_cursor(str(offset + limit))
+    with phase("serialize"):
+        results = [search.format_hit(row, terms) for row in rows[:limit]]
+        body = json.dumps({"results": results, "next_cursor": next_cursor}, default=str).encode()
+        return cached_json(response_cache.put(cache_key, body, cache_tags, generation), hit=False)
+
+
+# ------------------------------
+# Batch endpoints (one transaction per request)
+# ------------------------------
+BATCH_ACTIONS = {"POST": "create", "PUT": "update", "DELETE": "delete"}
+# Cached tables a batch can change (users cascade-delete their requests and comments).
+BATCH_INVALIDATES = {("users", "delete"): ("feature_requests", "comments")}
+
+
+def run_batch(table: str, action: str):
+    import mysql.connector
+
+    body = request.get_json(force=True, silent=True) or {}
+    try:
+        if action == "delete":
+            valid, results = batch_ops.validate_ids(body.get("ids"))
+        else:
+            valid, results = batch_ops.validate_items(table, body.get("items"), for_update=action == "update")
+    except ValueError as err:
+        return bad_request(str(err))
+
+    if valid:
+        items = [item for _, item in valid]
+        db = get_db()
+        cursor = db.cursor()
+        try:
+            if action == "create":
+                rows = batch_ops.prepare_insert_rows(table, items, hash_many=password_pool.hash_many)
+                with phase("db"):
+                    batch_ops.insert_rows(cursor, table, rows)
+            elif action == "update":
+                groups = batch_ops.prepare_updates(table, items, hash_many=password_pool.hash_many)
+                with phase("db"):
+                    batch_ops.update_rows(cursor, table, groups)
+            else:
+                with phase("db"):
+                    batch_ops.delete_rows(cursor, table, items)
+            with phase("db"):
+                db.commit()
+            response_cache.invalidate(*BATCH_INVALIDATES.get((table, action), (table,)))
+        except mysql.connector.IntegrityError as err:
+            db.rollback()
+            logging.warning("Batch %s on %s rolled back: %s", action, table, err.msg)
+            return jsonify({"error": "batch violates a uniqueness or reference constraint; nothing was written",
+                            "request_id": g.request_id}), 409
+        finally:
+            cursor.close()
+
+        status = {"create": "created", "update": "updated", "delete": "deleted"}[action]
+        events = []
+        for index, item in valid:
+            results[index]["status"] = status
+            if action == "update":
+                fields = sorted(item.keys() & set(batch_ops.BATCH_SPECS[table]["updatable"]))
+                events.append(request_audit_event(action, table, item["id"], batch=True, fields=fields))
+            else:
+                events.append(request_audit_event(action, table, item if action == "delete" else item["id"], batch=True))
+        # One enqueue for the whole batch: waits at most AUDIT_PUT_TIMEOUT in total.
+        audit_log.record_many(events)
+
+    failed = sum(1 for r in results if r["status"] == "error")
+    logging.info("Batch %s on %s: %d ok, %d failed", action, table, len(results) - failed, failed)
+    return jsonify(
+        {
+            "results": results,
+            "succeeded": len(results) - failed,
+            "failed": failed,
+            "request_id": g.request_id,
+        }
+    )
+
+
+@app.route("/users:batch", methods=["POST", "PUT", "DELETE"])
+@require_auth(roles=["admin"])
+def batch_users():
+    return run_batch("users", BATCH_ACTIONS[request.method])
+
+
+@app.route("/feature_requests:batch", methods=["POST", "PUT", "DELETE"])
+@require_auth(roles=["admin"])
+def batch_feature_requests():
+    return run_batch("feature_requests", BATCH_ACTIONS[request.method])
+
+
+@app.route("/comments:batch", methods=["POST", "PUT", "DELETE"])
+@require_auth(roles=["admin"])
+def batch_comments():
+    return run_batch("comments", BATCH_ACTIONS[request.method])
+
+
 if __name__ == "__main__":
+    # Development server (one process). For production use prefork.py.
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=False)
@@ -0,0 +1,623 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from functools import wraps
+from typing import Any, Dict, List, Optional
+
+import aiomysql
+import jwt
+from quart import Quart, Response, g, jsonify, request
+
+from api import (
+    ADMISSION_EXEMPT,
+    DB_CONFIG,
+    DB_POOL_SIZE,
+    HTTP_IN_FLIGHT,
+    HTTP_LATENCY,
+    HTTP_REQUESTS,
+    JWT_ALGORITHM,
+    JWT_SECRET,
+    RowTransform,
+    STREAM_FETCH_SIZE,
+    audit_log,
+    client_ip,
+    encode_cursor,
+    enforce_rate_limit,
+    generate_token,
+    hash_for_log,
+    is_limited_write,
+    keyset_query,
+    page_args,
+    password_pool,
+    sanitized_user_row,
+    sanitized_user_rows,
+    token_cache,
+)
+from encryption_utils import aes_encrypt, email_blind_index, password_needs_rehash
+from metrics import REGISTRY, set_scope
+from password_pool import PoolSaturated
+from rate_limit import RateLimited
+
+# The core of api.py served over ASGI, with the same auth rules, response
+# shapes and request_id handling for the routes it has:
+#   hypercorn api_async:app --bind 0.0.0.0:5001
+# Served: /health, /metrics, /auth/login, /auth/logout, and list / create /
+# update / delete of users, feature_requests and comments.
+# Not served (api.py only): /search, the :batch routes, GET
+# /feature_requests/<fr_id>, /feature_requests/<fr_id>/comments and
+# /users/<user_id>/feature_requests. There is no response cache either; every
+# list request goes to the database.
+# Rate limits, token revocation/caching (a socket round trip once shared state
+# is on), PII decryption of list pages and the audit drain on shutdown are
+# blocking, so they run in worker threads via asyncio.to_thread.
+
+app = Quart(__name__)
+
+
+# ------------------------------
+# Helpers
+# ------------------------------
+@app.before_serving
+async def open_pool():
+    if not all(DB_CONFIG.values()):
+        raise RuntimeError("Database credentials missing (DB_USER, DB_PASSWORD, DB_NAME required).")
+    app.db_pool = await aiomysql.create_pool(
+        host=DB_CONFIG["host"],
+        user=DB_CONFIG["user"],
+        password=DB_CONFIG["password"],
+        db=DB_CONFIG["database"],
+        minsize=1,
+        maxsize=DB_POOL_SIZE,
+        autocommit=False,
+    )
+
+
+@app.after_serving
+async def close_pool():
+    await asyncio.to_thread(audit_log.close)
+    app.db_pool.close()
+    await app.db_pool.wait_closed()
+
+
+@asynccontextmanager
+async def db_cursor(cursor_class=aiomysql.DictCursor):
+    async with app.db_pool.acquire() as conn:
+        async with conn.cursor(cursor_class) as cursor:
+            yield conn, cursor
+
+
+async def execute_write(sql: str, params) -> None:
+    async with db_cursor(aiomysql.Cursor) as (conn, cursor):
+        await cursor.execute(sql, params)
+        await conn.commit()
+
+
+@app.before_request
+async def add_request_id():
+    g.request_id = str(uuid.uuid4())
+
+
+def route_label() -> str:
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+@app.before_request
+async def start_request_metrics():
+    g.request_start = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+    set_scope(route_label())
+
+
+@app.after_request
+async def record_request_metrics(response):
+    route = route_label()
+    HTTP_LATENCY.labels(request.method, route).observe(time.perf_counter() - g.request_start)
+    HTTP_REQUESTS.labels(request.method, route, response.status_code).inc()
+    return response
+
+
+@app.teardown_request
+async def finish_request_metrics(error=None):
+    if g.pop("request_start", None) is not None:
+        HTTP_IN_FLIGHT.dec()
+
+
+@app.before_request
+async def limit_request():
+    # Same rate limits as api.py. No admission cap here: waiting requests are
+    # coroutines, and aiomysql bounds the DB side.
+    route = route_label()
+    g.client_ip = client_ip(request.remote_addr, request.headers.get("X-Forwarded-For"))
+    if route in ADMISSION_EXEMPT:
+        return
+    await asyncio.to_thread(enforce_request_limits, g.client_ip, request.method, route)
+
+
+def enforce_request_limits(ip: str, method: str, route: str) -> None:
+    enforce_rate_limit("ip", ip)
+    if is_limited_write(method, route):
+        enforce_rate_limit("write_ip", ip, route)
+
+
+def check_token(token: str):
+    # Returns (payload, None) or (None, error). Runs in a worker thread: the
+    # revocation list and token cache may live in the shared-state process.
+    if token_cache.is_revoked(token):
+        return None, "token revoked"
+    payload = token_cache.get(token)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            return None, "token expired"
+        except jwt.InvalidTokenError:
+            return None, "invalid token"
+        token_cache.put(token, payload)
+    return payload, None
+
+
+def require_auth(roles: Optional[List[str]] = None):
+    def decorator(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            auth_header = request.headers.get("Authorization", "")
+            token = auth_header.split(" ", 1)[1] if auth_header.startswith("Bearer ") else None
+            if not token:
+                return jsonify({"error": "missing or invalid Authorization header", "request_id": g.request_id}), 401
+            payload, error = await asyncio.to_thread(check_token, token)
+            if error:
+                return jsonify({"error": error, "request_id": g.request_id}), 401
+
+            role = payload.get("role", "user")
+            if roles and role not in roles:
+                return jsonify({"error": "forbidden for role", "request_id": g.request_id}), 403
+
+            g.current_user = payload
+            g.auth_token = token
+            if is_limited_write(request.method, route_label()):
+                await asyncio.to_thread(enforce_rate_limit, "write_user", payload.get("sub"), route_label())
+            return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def audit_event(action: str, resource: str, resource_id: Optional[str] = None, **detail: Any) -> None:
+    # As api.audit_event, but never waits on a full queue: that would stall the
+    # event loop for every request. Dropped events are counted in audit stats.
+    user = g.get("current_user") or {}
+    audit_log.record(
+        action,
+        resource,
+        hash_for_log(str(resource_id)) if resource_id is not None else None,
+        actor=hash_for_log(user.get("sub")),
+        role=user.get("role"),
+        request_id=g.get("request_id"),
+        block=False,
+        **detail,
+    )
+
+
+def bad_request(message: str):
+    return jsonify({"error": message, "request_id": g.request_id}), 400
+
+
+async def json_body() -> Dict[str, Any]:
+    return await request.get_json(force=True, silent=True) or {}
+
+
+async def list_rows(
+    key: str,
+    select_sql: str,
+    where: Optional[List[str]] = None,
+    params: Optional[List[Any]] = None,
+    transform: Optional[RowTransform] = None,
+):
+    stream_fmt = request.args.get("stream")
+    if stream_fmt is None and request.accept_mimetypes.best == "application/x-ndjson":
+        stream_fmt = "ndjson"
+    if stream_fmt not in (None, "ndjson", "json"):
+        return bad_request("stream must be 'ndjson' or 'json'")
+
+    try:
+        after, limit = page_args(request.args, streaming=stream_fmt is not None)
+    except ValueError as err:
+        return bad_request(str(err))
+
+    if stream_fmt:
+        sql, sql_params = keyset_query(select_sql, where, params, after, limit)
+        return stream_rows(key, sql, sql_params, stream_fmt, transform)
+
+    sql, sql_params = keyset_query(select_sql, where, params, after, limit + 1)
+    async with db_cursor() as (_, cursor):
+        await cursor.execute(sql, sql_params)
+        rows = list(await cursor.fetchall())
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["id"])
+    if transform:
+        rows = await asyncio.to_thread(transform, rows)
+
+    return jsonify({key: rows, "next_cursor": next_cursor, "request_id": g.request_id})
+
+
+def stream_rows(key: str, sql: str, params: List[Any], fmt: str, transform: Optional[RowTransform] = None):
+    request_id = g.request_id
+
+    async def generate():
+        async with db_cursor(aiomysql.SSDictCursor) as (_, cursor):
+            await cursor.execute(sql, params)
+            first = True
+            if fmt == "json":
+                yield f'{{"{key}": ['.encode()
+            while True:
+                rows = await cursor.fetchmany(STREAM_FETCH_SIZE)
+                if not rows:
+                    break
+                if transform:
+                    rows = await asyncio.to_thread(transform, list(rows))
+                if fmt == "json":
+                    chunk = ",".join(json.dumps(row, default=str) for row in rows)
+                    yield (chunk if first else "," + chunk).encode()
+                else:
+                    yield "".join(json.dumps(row, default=str) + "\n" for row in rows).encode()
+                first = False
+            if fmt == "json":
+                yield f'], "request_id": {json.dumps(request_id)}}}'.encode()
+
+    mimetype = "application/json" if fmt == "json" else "application/x-ndjson"
+    return generate(), 200, {"Content-Type": mimetype, "X-Request-ID": request_id}
+
+
+async def update_fields(table: str, row_id: str, updates: List[str], params: List[Any]):
+    params.append(row_id)
+    await execute_write(f"UPDATE {table} SET {', '.join(updates)} WHERE id = %s", params)
+
+
+# ------------------------------
+# Error handling
+# ------------------------------
+@app.errorhandler(PoolSaturated)
+async def handle_password_pool_saturated(err):
+    logging.warning("Request %s rejected: %s", g.get("request_id"), err)
+    response = jsonify({"error": "too many requests, try again", "request_id": g.get("request_id")})
+    response.headers["Retry-After"] = "1"
+    return response, 429
+
+
+@app.errorhandler(RateLimited)
+async def handle_rate_limited(err):
+    logging.warning("Request %s rejected: %s", g.get("request_id"), err)
+    response = jsonify({"error": "rate limit exceeded, try again later", "request_id": g.get("request_id")})
+    response.headers["Retry-After"] = str(max(1, math.ceil(err.retry_after)))
+    return response, 429
+
+
+@app.errorhandler(Exception)
+async def handle_exception(err):
+    logging.exception("Request %s failed: %s", g.get("request_id"), err)
+    return jsonify({"error": "Internal server error", "request_id": g.get("request_id")}), 500
+
+
+# ------------------------------
+# Auth endpoints
+# ------------------------------
+@app.route("/health", methods=["GET"])
+async def health():
+    pool = getattr(app, "db_pool", None)
+    pool_stats = {"size": pool.size, "free": pool.freesize, "max": pool.maxsize} if pool else None
+    return jsonify(
+        {
+            "status": "ok",
+            "db_pool": pool_stats,
+            "token_cache": token_cache.stats(),
+            "password_pool": password_pool.stats(),
+            "request_id": g.request_id,
+        }
+    )
+
+
+@app.route("/metrics", methods=["GET"])
+async def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/auth/login", methods=["POST"])
+async def login():
+    body = await json_body()
+    user_id = body.get("user_id")
+    email = body.get("email")
+    password = body.get("password")
+
+    await asyncio.to_thread(enforce_rate_limit, "login_ip", g.client_ip)
+    if not (user_id or email) or not password:
+        return bad_request("user_id (or email) and password are required")
+    await asyncio.to_thread(enforce_rate_limit, "login_account", hash_for_log(str(user_id or email).strip().lower()))
+
+    async with db_cursor() as (_, cursor):
+        if user_id:
+            await cursor.execute(
+                "SELECT id, password_hash, role, email, full_name FROM users WHERE id = %s",
+                (user_id,),
+            )
+        else:
+            await cursor.execute(
+                "SELECT id, password_hash, role, email, full_name FROM users WHERE email_bidx = %s LIMIT 1",
+                (email_blind_index(email),),
+            )
+        row = await cursor.fetchone()
+    user_id = user_id or email
+
+    if not row or not await password_pool.verify_async(password, row["password_hash"]):
+        logging.warning("Invalid login (hash=%s)", hash_for_log(user_id))
+        return jsonify({"error": "invalid credentials", "request_id": g.request_id}), 401
+
+    if password_needs_rehash(row["password_hash"]):
+        # Optional work: a busy bcrypt pool skips it rather than failing a valid login.
+        try:
+            new_hash = await password_pool.hash_async(password)
+        except PoolSaturated:
+            new_hash = None
+            logging.info("Skipped rehash for user %s: bcrypt pool busy", hash_for_log(user_id))
+        if new_hash is not None:
+            await execute_write("UPDATE users SET password_hash = %s WHERE id = %s", (new_hash, row["id"]))
+            logging.info("Rehashed password for user %s", hash_for_log(user_id))
+
+    role = row.get("role") or "user"
+    token = generate_token(user_id=row["id"], role=role)
+
+    logging.info("User %s logged in (role=%s)", hash_for_log(user_id), role)
+    return jsonify(
+        {
+            "token": token,
+            "role": role,
+            "user": sanitized_user_row(row),
+            "request_id": g.request_id,
+        }
+    )
+
+
+@app.route("/auth/logout", methods=["POST"])
+@require_auth(roles=["admin", "user"])
+async def logout():
+    await asyncio.to_thread(token_cache.revoke, g.auth_token, expires_at=g.current_user.get("exp"))
+    logging.info("User %s logged out", hash_for_log(g.current_user.get("sub")))
+    return jsonify({"status": "logged out", "request_id": g.request_id})
+
+
+# ------------------------------
+# Users
+# ------------------------------
+@app.route("/users", methods=["GET"])
+@require_auth(roles=["admin", "user"])
+async def get_users():
+    email = request.args.get("email")
+    if email is not None:
+        return await list_rows(
+            "users",
+            "SELECT id, email, full_name, role FROM users",
+            where=["email_bidx = %s"],
+            params=[email_blind_index(email)],
+            transform=sanitized_user_rows,
+        )
+    return await list_rows("users", "SELECT id, email, full_name, role FROM users", transform=sanitized_user_rows)
+
+
+@app.route("/users", methods=["POST"])
+@require_auth(roles=["admin"])
+async def create_user():
+    body = await json_body()
+    required_fields = {"id", "email", "password", "full_name"}
+    missing = required_fields - body.keys()
+    if missing:
+        return bad_request(f"Missing fields: {', '.join(sorted(missing))}")
+
+    email_encrypted = aes_encrypt(body["email"])
+    full_name_encrypted = aes_encrypt(body["full_name"])
+    password_hash = await password_pool.hash_async(body["password"])
+    role = body.get("role", "user")
+
+    await execute_write(
+        """
+        INSERT INTO users (id, email, email_bidx, password_hash, full_name, role)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        """,
+        (body["id"], email_encrypted, email_blind_index(body["email"]), password_hash, full_name_encrypted, role),
+    )
+
+    audit_event("create", "users", body["id"], new_role=role)
+    logging.info("Created user id=%s email_hash=%s", body["id"], hash_for_log(body["email"]))
+    return jsonify(
+        {
+            "user": sanitized_user_row(
+                {
+                    "id": body["id"],
+                    "email": email_encrypted,
+                    "full_name": full_name_encrypted,
+                    "role": role,
+                }
+            ),
+            "request_id": g.request_id,
+        }
+    ), 201
+
+
+@app.route("/users/<user_id>", methods=["PUT"])
+@require_auth(roles=["admin"])
+async def update_user(user_id):
+    body = await json_body()
+    updates = []
+    params = []
+
+    if "email" in body:
+        updates.append("email = %s")
+        params.append(aes_encrypt(body["email"]))
+        updates.append("email_bidx = %s")
+        params.append(email_blind_index(body["email"]))
+    if "full_name" in body:
+        updates.append("full_name = %s")
+        params.append(aes_encrypt(body["full_name"]))
+    if "password" in body:
+        updates.append("password_hash = %s")
+        params.append(await password_pool.hash_async(body["password"]))
+    if "role" in body:
+        updates.append("role = %s")
+        params.append(body["role"])
+
+    if not updates:
+        return bad_request("No valid fields to update.")
+
+    await update_fields("users", user_id, updates, params)
+
+    audit_event("update", "users", user_id, fields=sorted(body.keys() & {"email", "password", "full_name", "role"}))
+    logging.info("Updated user %s", hash_for_log(user_id))
+    return jsonify({"status": "updated", "request_id": g.request_id})
+
+
+@app.route("/users/<user_id>", methods=["DELETE"])
+@require_auth(roles=["admin"])
+async def delete_user(user_id):
+    await execute_write("DELETE FROM users WHERE id = %s", (user_id,))
+
+    audit_event("delete", "users", user_id)
+    logging.info("Deleted user %s", hash_for_log(user_id))
+    return jsonify({"status": "deleted", "request_id": g.request_id})
+
+
+# ------------------------------
+# Feature Requests
+# ------------------------------
+@app.route("/feature_requests", methods=["GET"])
+@require_auth(roles=["admin", "user"])
+async def list_feature_requests():
+    return await list_rows("feature_requests", "SELECT id, title, content, user_id FROM feature_requests")
+
+
+@app.route("/feature_requests", methods=["POST"])
+@require_auth(roles=["admin"])
+async def create_feature_request():
+    body = await json_body()
+    required = {"id", "title", "content", "user_id"}
+    missing = required - body.keys()
+    if missing:
+        return bad_request(f"Missing fields: {', '.join(sorted(missing))}")
+
+    await execute_write(
+        """
+        INSERT INTO feature_requests (id, title, content, user_id)
+        VALUES (%s, %s, %s, %s)
+        """,
+        (body["id"], body["title"], body["content"], body["user_id"]),
+    )
+
+    audit_event("create", "feature_requests", body["id"])
+    logging.info("Feature request %s created by %s", body["id"], hash_for_log(body["user_id"]))
+    return jsonify({"status": "created", "id": body["id"], "request_id": g.request_id}), 201
+
+
+@app.route("/feature_requests/<fr_id>", methods=["PUT"])
+@require_auth(roles=["admin"])
+async def update_feature_request(fr_id):
+    body = await json_body()
+    updates = []
+    params = []
+
+    for field in ("title", "content", "user_id"):
+        if field in body:
+            updates.append(f"{field} = %s")
+            params.append(body[field])
+
+    if not updates:
+        return bad_request("No valid fields to update.")
+
+    await update_fields("feature_requests", fr_id, updates, params)
+
+    audit_event("update", "feature_requests", fr_id, fields=sorted(body.keys() & {"title", "content", "user_id"}))
+    logging.info("Feature request %s updated", fr_id)
+    return jsonify({"status": "updated", "request_id": g.request_id})
+
+
+@app.route("/feature_requests/<fr_id>", methods=["DELETE"])
+@require_auth(roles=["admin"])
+async def delete_feature_request(fr_id):
+    await execute_write("DELETE FROM feature_requests WHERE id = %s", (fr_id,))
+
+    audit_event("delete", "feature_requests", fr_id)
+    logging.info("Feature request %s deleted", fr_id)
+    return jsonify({"status": "deleted", "request_id": g.request_id})
+
+
+# ------------------------------
+# Comments
+# ------------------------------
+@app.route("/comments", methods=["GET"])
+@require_auth(roles=["admin", "user"])
+async def list_comments():
+    return await list_rows("comments", "SELECT id, content, user_id, feature_request_id FROM comments")
+
+
+@app.route("/comments", methods=["POST"])
+@require_auth(roles=["admin"])
+async def create_comment():
+    body = await json_body()
+    required = {"id", "content", "user_id", "feature_request_id"}
+    missing = required - body.keys()
+    if missing:
+        return bad_request(f"Missing fields: {', '.join(sorted(missing))}")
+
+    await execute_write(
+        """
+        INSERT INTO comments (id, content, user_id, feature_request_id)
+        VALUES (%s, %s, %s, %s)
+        """,
+        (body["id"], body["content"], body["user_id"], body["feature_request_id"]),
+    )
+
+    audit_event("create", "comments", body["id"])
+    logging.info("Comment %s created by %s", body["id"], hash_for_log(body["user_id"]))
+    return jsonify({"status": "created", "id": body["id"], "request_id": g.request_id}), 201
+
+
+@app.route("/comments/<comment_id>", methods=["PUT"])
+@require_auth(roles=["admin"])
+async def update_comment(comment_id):
+    body = await json_body()
+    updates = []
+    params = []
+
+    for field in ("content", "user_id", "feature_request_id"):
+        if field in body:
+            updates.append(f"{field} = %s")
+            params.append(body[field])
+
+    if not updates:
+        return bad_request("No valid fields to update.")
+
+    await update_fields("comments", comment_id, updates, params)
+
+    audit_event("update", "comments", comment_id,
+                fields=sorted(body.keys() & {"content", "user_id", "feature_request_id"}))
+    logging.info("Comment %s updated", comment_id)
+    return jsonify({"status": "updated", "request_id": g.request_id})
+
+
+@app.route("/comments/<comment_id>", methods=["DELETE"])
+@require_auth(roles=["admin"])
+async def delete_comment(comment_id):
+    await execute_write("DELETE FROM comments WHERE id = %s", (comment_id,))
+
+    audit_event("delete", "comments", comment_id)
+    logging.info("Comment %s deleted", comment_id)
+    return jsonify({"status": "deleted", "request_id": g.request_id})
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5001")), debug=False)
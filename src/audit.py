@@ -0,0 +1,307 @@
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# Write-behind audit trail of who changed what. Handlers call
+# AuditLog.record() after their commit; the event goes onto a bounded
+# in-memory queue and a background thread writes queued events in batches
+# (one write + fsync, or one executemany + commit, per batch), so a request
+# never waits on the audit store.
+#  - Backpressure: when the queue is full, record() / record_many() block up
+#    to `put_timeout` seconds per call (not per event), slowing writers to the
+#    flusher's pace; past that the remaining events are dropped, counted and
+#    logged. block=False (api_async.py) drops without waiting.
+#  - A failed batch is retried every `retry_interval` seconds and is not lost
+#    while the process lives. On close() a batch the sink still refuses is
+#    spilled to the fallback file.
+#  - close() drains the queue; api.py calls it at exit and prefork.py when a
+#    worker stops. Only events still queued when the process is killed outright
+#    (at most `flush_interval` seconds' worth under normal load) are lost.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+AUDIT_SINK = os.getenv("AUDIT_SINK", "file")  # file | table | off
+AUDIT_FILE = os.getenv("AUDIT_FILE", os.path.join(BASE_DIR, "audit.log"))
+AUDIT_FSYNC = os.getenv("AUDIT_FSYNC", "1") != "0"
+AUDIT_MAX_QUEUE = int(os.getenv("AUDIT_MAX_QUEUE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.5"))
+AUDIT_PUT_TIMEOUT = float(os.getenv("AUDIT_PUT_TIMEOUT", "1"))
+AUDIT_CLOSE_TIMEOUT = float(os.getenv("AUDIT_CLOSE_TIMEOUT", "10"))
+
+AUDIT_FIELDS = ("at", "request_id", "actor", "role", "action", "resource", "resource_id", "detail")
+_STOP = object()
+
+
+# ============================================================
+# Sinks
+# ============================================================
+class FileSink:
+    # Append-only NDJSON, one line per event.
+    def __init__(self, path: str, fsync: bool = AUDIT_FSYNC):
+        self.path = path
+        self.fsync = fsync
+        self._file = None
+
+    def write(self, events: List[Dict[str, Any]]) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write("".join(json.dumps(e, default=str, separators=(",", ":")) + "\n" for e in events))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class TableSink:
+    # Rows in audit_log (schema.py 0007), on a connection of its own so the
+    # flusher never takes one from the request pool.
+    def __init__(self, connect: Callable):
+        self.connect = connect
+        self._db = None
+
+    def write(self, events: List[Dict[str, Any]]) -> None:
+        if self._db is None:
+            self._db = self.connect()
+        rows = [
+            tuple(json.dumps(e[f], default=str) if f == "detail" else e[f] for f in AUDIT_FIELDS)
+            for e in events
+        ]
+        try:
+            cursor = self._db.cursor()
+            cursor.executemany(
+                f"INSERT INTO audit_log ({', '.join(AUDIT_FIELDS)}) VALUES ({', '.join(['%s'] * len(AUDIT_FIELDS))})",
+                rows,
+            )
+            self._db.commit()
+            cursor.close()
+        except Exception:
+            # Reconnect on the retry; an uncommitted batch is rolled back with the connection.
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self._db is not None:
+            try:
+                self._db.close()
+            except Exception:
+                pass
+            self._db = None
+
+
+def make_sink(kind: str, connect: Optional[Callable] = None):
+    if kind == "off":
+        return None
+    if kind == "file":
+        return FileSink(AUDIT_FILE)
+    if kind == "table":
+        return TableSink(connect)
+    raise ValueError(f"unknown audit sink '{kind}'")
+
+
+def make_event(action: str, resource: str, resource_id: Optional[str] = None, actor: Optional[str] = None,
+               role: Optional[str] = None, request_id: Optional[str] = None, **detail: Any) -> Dict[str, Any]:
+    return {
+        "at": datetime.datetime.utcnow(),
+        "request_id": request_id,
+        "actor": actor,
+        "role": role,
+        "action": action,
+        "resource": resource,
+        "resource_id": resource_id,
+        "detail": detail or None,
+    }
+
+
+# ============================================================
+# Queue and background flusher
+# ============================================================
+class AuditLog:
+    def __init__(
+        self,
+        sink,
+        fallback: Optional[FileSink] = None,
+        max_queue: int = AUDIT_MAX_QUEUE,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL,
+        put_timeout: float = AUDIT_PUT_TIMEOUT,
+        retry_interval: float = 1.0,
+    ):
+        self.sink = sink
+        self.fallback = fallback
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.retry_interval = retry_interval
+        self.reset()
+
+    def reset(self) -> None:
+        # Fresh queue, flusher and counters; used after fork, where the
+        # parent's flusher thread does not exist.
+        self._queue: "queue.Queue" = queue.Queue(self.max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # flusher vs. inline writes after close
+        self._closing = False
+        self._closing_event = threading.Event()  # cuts a retry wait short on close()
+        self._closed = False
+        self.recorded = 0
+        self.written = 0
+        self.batches = 0
+        self.blocked = 0
+        self.dropped = 0
+        self.failures = 0
+        self.spilled = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sink is not None
+
+    def record(self, action: str, resource: str, resource_id: Optional[str] = None, actor: Optional[str] = None,
+               role: Optional[str] = None, request_id: Optional[str] = None, block: bool = True,
+               **detail: Any) -> bool:
+        event = make_event(action, resource, resource_id, actor, role, request_id, **detail)
+        return self.record_many([event], block=block) == 1
+
+    def record_many(self, events: List[Dict[str, Any]], block: bool = True) -> int:
+        # Queues one request's events (make_event dicts); returns how many were queued.
+        # All of them share a single `put_timeout` deadline, so a large batch
+        # request waits no longer than a single write. block=False never waits
+        # (event loops): whatever does not fit is dropped.
+        if self.sink is None or not events:
+            return 0
+        if self._closed:
+            # Stragglers after shutdown (a request outliving the drain) are written inline.
+            self._write(events)
+            return len(events)
+        self._start()
+        deadline = time.monotonic() + self.put_timeout
+        queued = 0
+        waited = False
+        for event in events:
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                remaining = deadline - time.monotonic()
+                if not block or remaining <= 0:
+                    break
+                waited = True
+                try:
+                    self._queue.put(event, timeout=remaining)
+                except queue.Full:
+                    break
+            queued += 1
+        dropped = len(events) - queued
+        with self._lock:
+            self.recorded += queued
+            self.blocked += int(waited)
+            self.dropped += dropped
+        if dropped:
+            first = events[queued]
+            logging.error("Audit queue full, dropped %d event(s) starting with %s %s",
+                          dropped, first["action"], first["resource"])
+        return queued
+
+    def _start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audit-flusher", daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        # Blocks for the first event, then gathers more for up to flush_interval.
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while batch[-1] is not _STOP and len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1] is _STOP
+            events = batch[:-1] if stop else batch
+            if events:
+                self._write(events)
+            if stop:
+                return
+
+    def _write(self, events: List[Dict[str, Any]]) -> None:
+        while True:
+            try:
+                with self._write_lock:
+                    self.sink.write(events)
+                with self._lock:
+                    self.written += len(events)
+                    self.batches += 1
+                return
+            except Exception as err:
+                with self._lock:
+                    self.failures += 1
+                if self._closing:
+                    self._spill(events, err)
+                    return
+                logging.warning("Audit write of %d events failed, retrying: %s", len(events), err)
+                self._closing_event.wait(self.retry_interval)
+
+    def _spill(self, events: List[Dict[str, Any]], err: Exception) -> None:
+        if self.fallback is not None and self.fallback is not self.sink:
+            try:
+                self.fallback.write(events)
+                with self._lock:
+                    self.spilled += len(events)
+                logging.error("Audit sink failed at shutdown (%s); %d events written to %s",
+                              err, len(events), self.fallback.path)
+                return
+            except Exception as spill_err:
+                err = spill_err
+        logging.error("Audit sink failed at shutdown (%s); %d events lost", err, len(events))
+
+    def close(self, timeout: float = AUDIT_CLOSE_TIMEOUT) -> None:
+        # Writes everything queued so far, then closes the sink. Safe to call twice.
+        if self._closed or self.sink is None:
+            return
+        self._closing = True
+        self._closing_event.set()
+        thread = self._thread
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+            if thread.is_alive():
+                logging.error("Audit flusher still busy after %.0fs; %d events not written",
+                              timeout, self._queue.qsize())
+                return
+        self._closed = True
+        self.sink.close()
+        if self.fallback is not None:
+            self.fallback.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sink": type(self.sink).__name__ if self.sink is not None else None,
+                "queued": self._queue.qsize(),
+                "max_queue": self.max_queue,
+                "recorded": self.recorded,
+                "written": self.written,
+                "batches": self.batches,
+                "blocked": self.blocked,
+                "dropped": self.dropped,
+                "failures": self.failures,
+                "spilled": self.spilled,
+            }
@@ -1,46 +1,183 @@
+import io
+import mmap
 import os
-from encryption_utils import rsa_encrypt_key, rsa_decrypt_key, load_or_create_aes_key
+import struct
+from encryption_utils import RSA_KEYS, rsa_encrypt_key, rsa_decrypt_key
+from key_manager import DEFAULT_KEY_ID
+from metrics import timed
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives import padding
 import hashlib
 
 
+CHUNK_SIZE = 1024 * 1024
+# Granularity of the per-region hashes recorded in the backup manifest.
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Container header: magic and format version, then
+#   v1: length of the RSA-wrapped key (wrapped with the "default" RSA key)
+#   v2: length of the RSA key id, length of the wrapped key, the key id
+# followed by the wrapped key, a 16-byte IV and the AES-CBC ciphertext.
+BACKUP_MAGIC = b"A5BK"
+BACKUP_VERSION = 2
+_PREFIX = struct.Struct(">4sB")
+_HEADER_V1 = struct.Struct(">H")
+_HEADER_V2 = struct.Struct(">BH")
+
+# Pre-container backups were written as <rsa key> + b"---" + iv + data.
+_LEGACY_SEPARATOR = b"---"
+
+
+class BackupFormatError(Exception):
+    pass
+
+
 # ============================================================
-# Encrypt SQL Backup using Hybrid Encryption (AES + RSA)
+# Streaming writer / reader (bounded memory)
 # ============================================================
-def encrypt_backup(input_sql_file, output_enc_file):
-    aes_key = load_or_create_aes_key()
-    iv = os.urandom(16)
+class EncryptedWriter:
+    def __init__(self, dst):
+        self._dst = dst
+        # Fresh session key per backup; only the RSA-wrapped copy is stored.
+        aes_key = os.urandom(32)
+        iv = os.urandom(16)
+        self.kid = RSA_KEYS.current_kid()
+        kid = self.kid.encode()
+        encrypted_key = rsa_encrypt_key(aes_key, self.kid)
 
-    with open(input_sql_file, "rb") as f:
-        data = f.read()
+        self._encryptor = Cipher(algorithms.AES(aes_key), modes.CBC(iv)).encryptor()
+        self._padder = padding.PKCS7(128).padder()
+        self._closed = False
 
-    # AES Encrypt data
-    cipher = Cipher(algorithms.AES(aes_key), modes.CBC(iv))
-    encryptor = cipher.encryptor()
+        dst.write(_PREFIX.pack(BACKUP_MAGIC, BACKUP_VERSION))
+        dst.write(_HEADER_V2.pack(len(kid), len(encrypted_key)))
+        dst.write(kid)
+        dst.write(encrypted_key)
+        dst.write(iv)
+
+    def write(self, data) -> int:
+        self._dst.write(self._encryptor.update(self._padder.update(data)))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        # Finalizes the ciphertext; the destination stays open for the caller.
+        if self._closed:
+            return
+        self._closed = True
+        self._dst.write(self._encryptor.update(self._padder.finalize()) + self._encryptor.finalize())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EncryptedReader:
+    def __init__(self, src):
+        self._src = src
+        magic, version = _PREFIX.unpack(_read_exact(src, _PREFIX.size))
+        if magic != BACKUP_MAGIC:
+            raise BackupFormatError("not a versioned backup container")
+        if version == 1:
+            (key_len,) = _HEADER_V1.unpack(_read_exact(src, _HEADER_V1.size))
+            self.kid = DEFAULT_KEY_ID
+        elif version == 2:
+            kid_len, key_len = _HEADER_V2.unpack(_read_exact(src, _HEADER_V2.size))
+            self.kid = _read_exact(src, kid_len).decode()
+        else:
+            raise BackupFormatError(f"unsupported backup format version {version}")
+
+        aes_key = rsa_decrypt_key(_read_exact(src, key_len), self.kid)
+        iv = _read_exact(src, 16)
+
+        self._decryptor = Cipher(algorithms.AES(aes_key), modes.CBC(iv)).decryptor()
+        self._unpadder = padding.PKCS7(128).unpadder()
+        self._buffer = bytearray()
+        self._eof = False
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self._src.read(CHUNK_SIZE)
+            if chunk:
+                self._buffer += self._unpadder.update(self._decryptor.update(chunk))
+            else:
+                self._buffer += self._unpadder.update(self._decryptor.finalize()) + self._unpadder.finalize()
+                self._eof = True
+
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def close(self):
+        pass
+
+
+def _read_exact(src, n):
+    data = src.read(n)
+    if len(data) != n:
+        raise BackupFormatError("truncated backup header")
+    return data
 
-    padder = padding.PKCS7(128).padder()
-    padded = padder.update(data) + padder.finalize()
 
-    encrypted_data = encryptor.update(padded) + encryptor.finalize()
+def copy_stream(src, dst, chunk_size=CHUNK_SIZE):
+    while True:
+        chunk = src.read(chunk_size)
+        if not chunk:
+            break
+        dst.write(chunk)
 
-    # RSA Encrypt AES key
-    encrypted_key = rsa_encrypt_key(aes_key)
 
-    with open(output_enc_file, "wb") as f:
-        f.write(encrypted_key + b"---" + iv + encrypted_data)
+@timed("backup_encrypt")
+def encrypt_stream(src, dst, chunk_size=CHUNK_SIZE):
+    # Returns the integrity manifest of the ciphertext, hashed as it is written.
+    hashing = HashingWriter(dst)
+    with EncryptedWriter(hashing) as writer:
+        copy_stream(src, writer, chunk_size)
+    return {**hashing.finish(), "kid": writer.kid}
+
+
+@timed("backup_decrypt")
+def decrypt_stream(src, dst, chunk_size=CHUNK_SIZE):
+    # The format is told apart by its magic, so src must be peekable; a raw
+    # stream gets a buffer for the duration of the call.
+    buffered = src if hasattr(src, "peek") else io.BufferedReader(src)
+    try:
+        if buffered.peek(len(BACKUP_MAGIC))[:len(BACKUP_MAGIC)] != BACKUP_MAGIC:
+            # Old single-shot backups are small enough to read whole.
+            dst.write(_decrypt_legacy_blob(buffered.read()))
+            return
+        copy_stream(EncryptedReader(buffered), dst, chunk_size)
+    finally:
+        if buffered is not src:
+            buffered.detach()  # src stays open; the caller owns it
+
+
+# ============================================================
+# Encrypt SQL Backup using Hybrid Encryption (AES + RSA)
+# ============================================================
+def encrypt_backup(input_sql_file, output_enc_file):
+    with open(input_sql_file, "rb") as src, open(output_enc_file, "wb") as dst:
+        return encrypt_stream(src, dst)
 
 
 # ============================================================
 # Decrypt Encrypted Backup (RSA + AES)
 # ============================================================
 def decrypt_backup(input_enc_file, output_sql_file):
-    with open(input_enc_file, "rb") as f:
-        blob = f.read()
+    with open(input_enc_file, "rb") as src, open(output_sql_file, "wb") as dst:
+        decrypt_stream(src, dst)
+
 
-    encrypted_key, payload = blob.split(b"---", 1)
+def _decrypt_legacy_blob(blob):
+    encrypted_key, payload = blob.split(_LEGACY_SEPARATOR, 1)
 
-    aes_key = rsa_decrypt_key(encrypted_key)
+    aes_key = rsa_decrypt_key(encrypted_key, DEFAULT_KEY_ID)
     iv = payload[:16]
     encrypted_data = payload[16:]
 
@@ -50,18 +187,106 @@ def decrypt_backup(input_enc_file, output_sql_file):
     decrypted_padded = decryptor.update(encrypted_data) + decryptor.finalize()
 
     unpadder = padding.PKCS7(128).unpadder()
-    decrypted = unpadder.update(decrypted_padded) + unpadder.finalize()
-
-    with open(output_sql_file, "wb") as f:
-        f.write(decrypted)
+    return unpadder.update(decrypted_padded) + unpadder.finalize()
 
 
 # ============================================================
 # Generate SHA-256 integrity hash for backup file
 # ============================================================
-def sha256_file(path):
-    with open(path, "rb") as f:
-        return hashlib.sha256(f.read()).hexdigest()
+class HashingWriter:
+    # Pass-through writer that hashes the whole stream plus each fixed-size region.
+    def __init__(self, dst, chunk_size=HASH_CHUNK_SIZE):
+        self._dst = dst
+        self.chunk_size = chunk_size
+        self.size = 0
+        self.chunk_hashes = []
+        self._total = hashlib.sha256()
+        self._chunk = hashlib.sha256()
+        self._chunk_fill = 0
+
+    def write(self, data) -> int:
+        if self._dst is not None:
+            self._dst.write(data)
+        self._update(data)
+        return len(data)
+
+    def flush(self):
+        if self._dst is not None:
+            self._dst.flush()
+
+    def _update(self, data):
+        self._total.update(data)
+        self.size += len(data)
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.chunk_size - self._chunk_fill)
+            self._chunk.update(view[:take])
+            self._chunk_fill += take
+            view = view[take:]
+            if self._chunk_fill == self.chunk_size:
+                self._end_chunk()
+
+    def _end_chunk(self):
+        self.chunk_hashes.append(self._chunk.hexdigest())
+        self._chunk = hashlib.sha256()
+        self._chunk_fill = 0
+
+    def finish(self):
+        if self._chunk_fill:
+            self._end_chunk()
+        return {
+            "sha256": self._total.hexdigest(),
+            "size": self.size,
+            "chunk_size": self.chunk_size,
+            "chunks": self.chunk_hashes,
+            "merkle_root": merkle_root(self.chunk_hashes),
+        }
+
+
+def merkle_root(leaf_hashes):
+    level = [bytes.fromhex(h) for h in leaf_hashes]
+    if not level:
+        return hashlib.sha256(b"").hexdigest()
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [hashlib.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+    return level[0].hex()
+
+
+@timed("backup_scan")
+def scan_backup(path, chunk_size=HASH_CHUNK_SIZE, progress=None):
+    # Single mmap pass producing the same manifest encrypt_stream records.
+    # progress(bytes_done, total_bytes) is called after every region.
+    hashing = HashingWriter(None, chunk_size)
+    total = os.path.getsize(path)
+    if total:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for offset in range(0, total, chunk_size):
+                    hashing.write(view[offset:offset + chunk_size])
+                    if progress:
+                        progress(min(offset + chunk_size, total), total)
+            finally:
+                view.release()
+    return hashing.finish()
+
+
+def corrupted_regions(manifest, scanned):
+    # (offset, length) of every region whose hash differs from the manifest.
+    chunk_size = manifest["chunk_size"]
+    expected = manifest["chunks"]
+    actual = scanned["chunks"]
+    regions = []
+    for i in range(max(len(expected), len(actual))):
+        if i >= len(expected) or i >= len(actual) or expected[i] != actual[i]:
+            regions.append((i * chunk_size, chunk_size))
+    return regions
+
+
+def sha256_file(path, progress=None):
+    return scan_backup(path, progress=progress)["sha256"]
 
 
 def verify_backup_hash(file_path, stored_hash):
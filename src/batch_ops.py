@@ -0,0 +1,239 @@
+import csv
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from encryption_utils import aes_encrypt_many, email_blind_index, hash_password
+from metrics import phase
+
+MAX_BATCH_SIZE = 1000
+# Rows per multi-row INSERT statement; keeps packets well under max_allowed_packet.
+INSERT_CHUNK_SIZE = 500
+
+BATCH_SPECS: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    "users": {
+        "required": ("id", "email", "password", "full_name"),
+        "columns": ("id", "email", "email_bidx", "password_hash", "full_name", "role"),
+        "updatable": ("email", "password", "full_name", "role"),
+    },
+    "feature_requests": {
+        "required": ("id", "title", "content", "user_id"),
+        "columns": ("id", "title", "content", "user_id"),
+        "updatable": ("title", "content", "user_id"),
+    },
+    "comments": {
+        "required": ("id", "content", "user_id", "feature_request_id"),
+        "columns": ("id", "content", "user_id", "feature_request_id"),
+        "updatable": ("content", "user_id", "feature_request_id"),
+    },
+}
+
+# Maps request fields to stored columns where they differ.
+STORED_COLUMN = {"password": "password_hash"}
+
+HashMany = Callable[[List[str]], List[str]]
+
+
+def _hash_serial(passwords: List[str]) -> List[str]:
+    return [hash_password(p) for p in passwords]
+
+
+# ------------------------------
+# Validation (one pass, per-item results)
+# ------------------------------
+def id_error(value: Any) -> Optional[str]:
+    # Ids are used as dict/set keys here, so anything else must be rejected first.
+    if not isinstance(value, str) or not value.strip():
+        return "id must be a non-empty string"
+    return None
+
+
+def field_error(table: str, item: Dict[str, Any]) -> Optional[str]:
+    # Every stored field is text; anything else would fail later in encryption,
+    # hashing or the INSERT and take the whole batch down with it.
+    spec = BATCH_SPECS[table]
+    for field in dict.fromkeys(spec["required"] + spec["updatable"]):
+        if field != "id" and field in item and not isinstance(item[field], str):
+            return f"{field} must be a string"
+    return None
+
+
+def validate_ids(ids: Any):
+    # For delete batches. Returns (valid [(index, id)], results); a repeated id is deleted once.
+    if not isinstance(ids, list) or not ids:
+        raise ValueError("ids must be a non-empty list")
+    if len(ids) > MAX_BATCH_SIZE:
+        raise ValueError(f"at most {MAX_BATCH_SIZE} ids per batch")
+
+    valid = []
+    results: List[Dict[str, Any]] = []
+    seen = set()
+    for index, item_id in enumerate(ids):
+        result: Dict[str, Any] = {"index": index, "id": item_id}
+        results.append(result)
+        error = id_error(item_id)
+        if error:
+            result.update(status="error", error=error)
+        elif item_id in seen:
+            result["status"] = "deleted"
+        else:
+            seen.add(item_id)
+            valid.append((index, item_id))
+    return valid, results
+
+
+def validate_items(table: str, items: Any, for_update: bool = False):
+    # Returns (valid [(index, item)], results [per-item dict, errors filled in]).
+    spec = BATCH_SPECS[table]
+    if not isinstance(items, list):
+        raise ValueError("items must be a list")
+    if not items:
+        raise ValueError("items must not be empty")
+    if len(items) > MAX_BATCH_SIZE:
+        raise ValueError(f"at most {MAX_BATCH_SIZE} items per batch")
+
+    valid = []
+    results: List[Dict[str, Any]] = []
+    seen = set()
+    for index, item in enumerate(items):
+        result: Dict[str, Any] = {"index": index, "id": item.get("id") if isinstance(item, dict) else None}
+        results.append(result)
+        if not isinstance(item, dict):
+            result.update(status="error", error="item must be an object")
+            continue
+
+        if for_update:
+            fields = [f for f in spec["updatable"] if f in item]
+            error = None if "id" in item else "Missing fields: id"
+            if error is None and not fields:
+                error = "No valid fields to update."
+        else:
+            missing = set(spec["required"]) - item.keys()
+            error = f"Missing fields: {', '.join(sorted(missing))}" if missing else None
+
+        if error is None:
+            error = id_error(item["id"]) or field_error(table, item)
+        if error is None and item["id"] in seen:
+            error = "duplicate id in batch"
+        if error:
+            result.update(status="error", error=error)
+            continue
+
+        seen.add(item["id"])
+        valid.append((index, item))
+    return valid, results
+
+
+# ------------------------------
+# Row preparation (bulk PII encryption / hashing)
+# ------------------------------
+def prepare_insert_rows(table: str, items: List[Dict[str, Any]], hash_many: Optional[HashMany] = None) -> List[tuple]:
+    if table != "users":
+        columns = BATCH_SPECS[table]["columns"]
+        return [tuple(item[c] for c in columns) for item in items]
+
+    with phase("crypto"):
+        emails = aes_encrypt_many([item["email"] for item in items])
+        names = aes_encrypt_many([item["full_name"] for item in items])
+    hashes = (hash_many or _hash_serial)([item["password"] for item in items])
+    return [
+        (item["id"], email, email_blind_index(item["email"]), password_hash, name, item.get("role", "user"))
+        for item, email, password_hash, name in zip(items, emails, hashes, names)
+    ]
+
+
+def prepare_updates(table: str, items: List[Dict[str, Any]], hash_many: Optional[HashMany] = None):
+    # Groups updates by the set of fields they touch so each group is one executemany.
+    updatable = BATCH_SPECS[table]["updatable"]
+    values = {field: [item[field] for item in items if field in item] for field in updatable}
+    if table == "users":
+        if values["email"]:
+            values["email_bidx"] = [email_blind_index(e) for e in values["email"]]
+            values["email"] = aes_encrypt_many(values["email"])
+        if values["full_name"]:
+            values["full_name"] = aes_encrypt_many(values["full_name"])
+        if values["password"]:
+            values["password"] = (hash_many or _hash_serial)(values["password"])
+
+    cursors = {field: iter(column) for field, column in values.items()}
+    groups: Dict[Tuple[str, ...], List[tuple]] = {}
+    for item in items:
+        fields = tuple(f for f in updatable if f in item)
+        if "email" in fields:
+            fields += ("email_bidx",)
+        groups.setdefault(fields, []).append(tuple(next(cursors[f]) for f in fields) + (item["id"],))
+    return groups
+
+
+# ------------------------------
+# Writes (caller owns the transaction)
+# ------------------------------
+def insert_rows(cursor, table: str, rows: List[tuple], chunk_size: int = INSERT_CHUNK_SIZE) -> int:
+    columns = BATCH_SPECS[table]["columns"]
+    placeholder = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ", ".join([placeholder] * len(chunk)),
+            [value for row in chunk for value in row],
+        )
+    return len(rows)
+
+
+def update_rows(cursor, table: str, groups) -> int:
+    count = 0
+    for fields, params in groups.items():
+        assignments = ", ".join(f"{STORED_COLUMN.get(f, f)} = %s" for f in fields)
+        cursor.executemany(f"UPDATE {table} SET {assignments} WHERE id = %s", params)
+        count += len(params)
+    return count
+
+
+def delete_rows(cursor, table: str, ids: List[Any], chunk_size: int = INSERT_CHUNK_SIZE) -> int:
+    deleted = 0
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        cursor.execute(f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+        deleted += cursor.rowcount
+    return deleted
+
+
+# ------------------------------
+# File input for CLI imports
+# ------------------------------
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    fmt = "csv" if path.endswith(".csv") else "ndjson"
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from read_stream(f, fmt)
+
+
+def read_stream(f, fmt: str) -> Iterator[Dict[str, Any]]:
+    # f: an open text stream (a file or sys.stdin); fmt: "csv" or "ndjson".
+    # Unparseable input raises ValueError naming the line.
+    if fmt == "csv":
+        reader = csv.DictReader(f)
+        try:
+            for row in reader:
+                # Short rows yield None for missing columns; treat those as absent.
+                yield {key: value for key, value in row.items() if value is not None}
+        except csv.Error as err:
+            raise ValueError(f"line {reader.line_num}: {err}") from err
+        return
+    for number, line in enumerate(f, 1):
+        line = line.strip()
+        if line:
+            try:
+                record = json.loads(line)
+            except ValueError as err:
+                raise ValueError(f"line {number}: invalid JSON ({err})") from err
+            yield record
+
+
+def batched(records: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,87 @@
+# Side-by-side load test of the Flask (api.py) and ASGI (api_async.py) servers.
+# Start both against the same database, e.g.
+#   python api.py                                   (port 5000)
+#   hypercorn api_async:app --bind 0.0.0.0:5001
+# then:
+#   python benchmarks/bench_api_load.py --token <jwt> --concurrency 64 --requests 2000
+import argparse
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def hit(url, token, method="GET", body=None):
+    headers = {"Authorization": f"Bearer {token}"}
+    data = None
+    if body is not None:
+        data = json.dumps(body).encode()
+        headers["Content-Type"] = "application/json"
+    req = urllib.request.Request(url, data=data, headers=headers, method=method)
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as err:
+        status = err.code
+    except OSError:
+        status = 0
+    return status, time.perf_counter() - start
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_load(base_url, path, token, concurrency, total, method="GET", body=None):
+    url = base_url.rstrip("/") + path
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: hit(url, token, method, body), range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for _, latency in results)
+    errors = sum(1 for status, _ in results if status < 200 or status >= 400)
+    return {
+        "url": url,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 1) if elapsed else None,
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flask-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--async-url", default="http://127.0.0.1:5001")
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--paths", nargs="+", default=["/users?limit=50", "/feature_requests?limit=50", "/comments?limit=50"])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=1000)
+    args = parser.parse_args()
+
+    report = []
+    for path in args.paths:
+        for name, base in (("flask", args.flask_url), ("async", args.async_url)):
+            result = run_load(base, path, args.token, args.concurrency, args.requests)
+            result["server"] = name
+            report.append(result)
+            print(f"{name:<6} {path:<28} {result['rps']:>9} req/s  p50 {result['p50_ms']:>8} ms  "
+                  f"p99 {result['p99_ms']:>8} ms  errors {result['errors']}")
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Backup pipeline throughput (MB/s) on a synthetic dump: stream encryption,
+# decryption and integrity hashing, using the same code paths as connect.py.
+# Run from src/:  python benchmarks/bench_backup.py --size-mb 64
+import argparse
+import json
+import os
+import random
+import tempfile
+
+from common import measure, print_results  # also puts src/ on sys.path
+
+from backup_utils import decrypt_stream, encrypt_stream, scan_backup
+
+
+def write_synthetic_dump(path, size_mb, seed=1234):
+    # INSERT statements with random-ish values: compresses and hashes like a real dump.
+    rng = random.Random(seed)
+    target = size_mb * 1024 * 1024
+    written = 0
+    with open(path, "w") as f:
+        while written < target:
+            values = ",".join(
+                f"('u{rng.randrange(10 ** 9)}','{rng.getrandbits(256):064x}','comment {rng.random():.12f}')"
+                for _ in range(100)
+            )
+            line = f"INSERT INTO `comments` VALUES {values};\n"
+            f.write(line)
+            written += len(line)
+    return os.path.getsize(path)
+
+
+def add_arguments(parser):
+    parser.add_argument("--size-mb", type=int, default=32, help="size of the synthetic dump")
+    parser.add_argument("--repeat", type=int, default=3)
+
+
+def run(args):
+    with tempfile.TemporaryDirectory(prefix="bench_backup_") as tmp:
+        plain = os.path.join(tmp, "dump.sql")
+        encrypted = os.path.join(tmp, "dump.bin")
+        restored = os.path.join(tmp, "restored.sql")
+        size_mb = write_synthetic_dump(plain, args.size_mb) / 1e6
+
+        def encrypt():
+            with open(plain, "rb") as src, open(encrypted, "wb") as dst:
+                encrypt_stream(src, dst)
+
+        def decrypt():
+            with open(encrypted, "rb") as src, open(restored, "wb") as dst:
+                decrypt_stream(src, dst)
+
+        results = [measure("backup_encrypt_stream", encrypt, repeat=args.repeat, work=size_mb, unit="MB/s")]
+        encrypted_mb = os.path.getsize(encrypted) / 1e6
+        results.append(measure("backup_decrypt_stream", decrypt, repeat=args.repeat, work=encrypted_mb, unit="MB/s"))
+        results.append(
+            measure("backup_scan_hash", lambda: scan_backup(encrypted), repeat=args.repeat, work=encrypted_mb, unit="MB/s")
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Micro-benchmarks for the encryption_utils primitives and bcrypt cost factors.
+# Run from src/:  python benchmarks/bench_crypto.py --rows 5000 --bcrypt-costs 4 10 12
+import argparse
+import json
+
+from common import measure, print_results  # also puts src/ on sys.path
+
+from encryption_utils import (
+    aes_decrypt,
+    aes_decrypt_many,
+    aes_encrypt,
+    aes_encrypt_many,
+    email_blind_index,
+    hash_password,
+    rsa_decrypt_key,
+    rsa_encrypt_key,
+    verify_password,
+)
+
+
+def add_arguments(parser):
+    parser.add_argument("--rows", type=int, default=5000, help="values per batch for the AES benchmarks")
+    parser.add_argument("--workers", type=int, default=4, help="thread count for the threaded batch variant")
+    parser.add_argument("--bcrypt-costs", type=int, nargs="+", default=[4, 8, 10, 12])
+    parser.add_argument("--repeat", type=int, default=5)
+
+
+def run(args):
+    # Deterministic inputs so runs on different commits measure the same work.
+    emails = [f"user{i}@example.com" for i in range(args.rows)]
+    encrypted = aes_encrypt_many(emails)
+    rows = [{"id": f"u{i}", "email": e, "full_name": e, "role": "user"} for i, e in enumerate(encrypted)]
+    n = args.rows
+    repeat = args.repeat
+
+    results = [
+        measure("aes_encrypt", lambda: [aes_encrypt(e) for e in emails], repeat=repeat, work=n),
+        measure("aes_decrypt", lambda: [aes_decrypt(e) for e in encrypted], repeat=repeat, work=n),
+        measure("aes_encrypt_many", lambda: aes_encrypt_many(emails), repeat=repeat, work=n),
+        measure("aes_decrypt_many", lambda: aes_decrypt_many(encrypted), repeat=repeat, work=n),
+        measure(
+            f"aes_decrypt_many_{args.workers}_threads",
+            lambda: aes_decrypt_many(encrypted, workers=args.workers),
+            repeat=repeat,
+            work=n,
+        ),
+        measure("email_blind_index", lambda: [email_blind_index(e) for e in emails], repeat=repeat, work=n),
+    ]
+
+    try:
+        # Needs api's dependencies (Flask, PyJWT, mysql-connector) importable.
+        from api import sanitized_user_rows
+    except ImportError:
+        sanitized_user_rows = None
+    if sanitized_user_rows is not None:
+        results.append(measure("sanitized_user_rows", lambda: sanitized_user_rows(rows), repeat=repeat, work=n))
+
+    session_key = bytes(32)
+    wrapped = rsa_encrypt_key(session_key)
+    results.append(measure("rsa_encrypt_key", lambda: rsa_encrypt_key(session_key), number=20, repeat=repeat))
+    results.append(measure("rsa_decrypt_key", lambda: rsa_decrypt_key(wrapped), number=5, repeat=repeat))
+
+    for cost in args.bcrypt_costs:
+        hashed = hash_password("benchmark-password", rounds=cost)
+        # Each hash doubles per cost step; fewer rounds keep high costs affordable.
+        number = max(1, 2 ** max(0, 10 - cost))
+        rounds = max(2, min(repeat, 3 if cost >= 12 else repeat))
+        results.append(
+            measure(f"bcrypt_hash_cost_{cost}", lambda: hash_password("benchmark-password", rounds=cost),
+                    number=number, repeat=rounds, cost=cost)
+        )
+        results.append(
+            measure(f"bcrypt_verify_cost_{cost}", lambda: verify_password("benchmark-password", hashed),
+                    number=number, repeat=rounds, cost=cost)
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+
+
+if __name__ == "__main__":
+    main()
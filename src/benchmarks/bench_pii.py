@@ -0,0 +1,74 @@
+# Compare per-row PII decryption (old sanitized_user_row path) with the
+# column-batch API.  Run from src/:  python benchmarks/bench_pii.py --rows 100000
+# The baseline is a copy of the original aes_decrypt (a Cipher and a PKCS7
+# unpadder built for every value); "per_row" is today's aes_decrypt, which
+# already reuses the cached key schedule.
+import argparse
+import base64
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.hazmat.primitives import padding  # noqa: E402
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes  # noqa: E402
+
+from encryption_utils import aes_decrypt, aes_decrypt_many, aes_encrypt_many, aes_key_path  # noqa: E402
+from key_manager import DEFAULT_KEY_ID  # noqa: E402
+
+
+def original_aes_decrypt(encrypted_text: str, key: bytes) -> str:
+    # encryption_utils.aes_decrypt as it was before batching, kept for comparison.
+    raw = base64.b64decode(encrypted_text)
+    iv = raw[:16]
+    ciphertext = raw[16:]
+
+    cipher = Cipher(algorithms.AES(key), modes.CBC(iv))
+    decryptor = cipher.decryptor()
+
+    decrypted_padded = decryptor.update(ciphertext) + decryptor.finalize()
+
+    unpadder = padding.PKCS7(128).unpadder()
+    decrypted = unpadder.update(decrypted_padded) + unpadder.finalize()
+
+    return decrypted.decode()
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    # The original code only knew the unprefixed default key.
+    emails = aes_encrypt_many([f"user{i}@example.com" for i in range(args.rows)], kid=DEFAULT_KEY_ID)
+    names = aes_encrypt_many([f"User Number {i}" for i in range(args.rows)], kid=DEFAULT_KEY_ID)
+    with open(aes_key_path(DEFAULT_KEY_ID), "rb") as f:
+        key = f.read()
+
+    results = {
+        "original_per_row": timed(
+            lambda: [(original_aes_decrypt(e, key), original_aes_decrypt(n, key)) for e, n in zip(emails, names)]
+        ),
+        "per_row": timed(lambda: [(aes_decrypt(e), aes_decrypt(n)) for e, n in zip(emails, names)]),
+        "batch": timed(lambda: (aes_decrypt_many(emails), aes_decrypt_many(names))),
+        f"batch_{args.workers}_threads": timed(
+            lambda: (aes_decrypt_many(emails, workers=args.workers), aes_decrypt_many(names, workers=args.workers))
+        ),
+    }
+
+    baseline = results["original_per_row"]
+    for name, seconds in results.items():
+        rate = args.rows / seconds if seconds else float("inf")
+        print(f"{name:<20} {seconds * 1000:9.1f} ms  {rate:12,.0f} rows/s  x{baseline / seconds:.2f}")
+
+
+if __name__ == "__main__":
+    main()
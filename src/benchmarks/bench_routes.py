@@ -0,0 +1,193 @@
+# End-to-end load for each read route plus login, against a seeded database.
+# Seeding writes rows with ids prefixed "bench-" into the DB_* database, so
+# point it at a scratch schema:
+#   python schema.py && python benchmarks/bench_routes.py --seed --users 2000
+# Without --url the Flask app is served in-process on an ephemeral port;
+# pass --url to load an already running server (e.g. api_async under hypercorn).
+# Search routes need the FULLTEXT indexes (schema.py 0005/0006). Repeated GETs are
+# served from the response cache; --no-response-cache measures the query itself,
+# e.g. for search on a large table:
+#   python benchmarks/bench_routes.py --seed --feature-requests 1000000 \
+#       --comments-per-request 0 --routes search --no-response-cache
+import argparse
+import json
+import threading
+
+from common import print_results  # also puts src/ on sys.path
+
+import batch_ops
+from bench_api_load import run_load
+from encryption_utils import hash_password
+
+BENCH_PASSWORD = "bench-password"
+SEED_BCRYPT_ROUNDS = 4  # seeding cost only; the login user gets the configured cost
+SEED_CHUNK_ROWS = 50000  # rows built and inserted at a time, so large seeds stay in bounded memory
+
+# Seeded titles, content and comments draw from these, so searches match a
+# spread of rows: from "export" in half of them down to a few percent for the
+# last words.
+SEARCH_WORDS = (
+    "export", "dashboard", "notification", "mobile", "calendar", "invoice", "webhook", "theme",
+    "keyboard", "offline", "archive", "timezone", "translation", "accessibility", "sandbox", "quota",
+)
+
+
+def seed_text(i, limit=None):
+    words = [word for k, word in enumerate(SEARCH_WORDS) if i % (k + 2) == 0] or [SEARCH_WORDS[i % len(SEARCH_WORDS)]]
+    return " ".join(words[:limit])
+
+
+def seed_database(db, users=1000, feature_requests=500, comments_per_request=10):
+    cursor = db.cursor()
+    for table in ("comments", "feature_requests", "users"):
+        cursor.execute(f"DELETE FROM {table} WHERE id LIKE %s", ("bench-%",))
+
+    user_items = [
+        {"id": f"bench-u{i:06d}", "email": f"bench{i}@example.com", "password": BENCH_PASSWORD,
+         "full_name": f"Bench User {i}", "role": "admin" if i == 0 else "user"}
+        for i in range(users)
+    ]
+    rows = batch_ops.prepare_insert_rows(
+        "users", user_items, hash_many=lambda pws: [hash_password(p, rounds=SEED_BCRYPT_ROUNDS) for p in pws]
+    )
+    # Logins against bench-u000000 must not trigger a rehash on every request.
+    rows[0] = rows[0][:3] + (hash_password(BENCH_PASSWORD),) + rows[0][4:]
+    batch_ops.insert_rows(cursor, "users", rows)
+
+    for start in range(0, feature_requests, SEED_CHUNK_ROWS):
+        ids = range(start, min(start + SEED_CHUNK_ROWS, feature_requests))
+        fr_rows = [
+            (f"bench-fr{i:07d}", f"Feature {i}: {seed_text(i, 2)}",
+             f"Details for feature {i}. Users asked for {seed_text(i)} support in the next release.",
+             f"bench-u{i % users:06d}")
+            for i in ids
+        ]
+        batch_ops.insert_rows(cursor, "feature_requests", fr_rows)
+        comment_rows = [
+            (f"bench-c{i:07d}-{j:03d}", f"Comment {j} on {i}: {seed_text(i + j, 2)} would help us",
+             f"bench-u{(i + j) % users:06d}", f"bench-fr{i:07d}")
+            for i in ids
+            for j in range(comments_per_request)
+        ]
+        batch_ops.insert_rows(cursor, "comments", comment_rows)
+        db.commit()
+    cursor.close()
+
+
+def encode_offset(offset):
+    from api import encode_cursor  # search cursors hold an offset
+
+    return encode_cursor(str(offset))
+
+
+def route_plan():
+    # (name, method, path, body)
+    return [
+        ("GET /health", "GET", "/health", None),
+        ("GET /users", "GET", "/users?limit=50", None),
+        ("GET /users?email", "GET", "/users?email=bench1@example.com", None),
+        ("GET /users/<id>/feature_requests", "GET", "/users/bench-u000001/feature_requests?limit=50", None),
+        ("GET /feature_requests", "GET", "/feature_requests?limit=50", None),
+        ("GET /feature_requests/<id>", "GET", "/feature_requests/bench-fr0000001", None),
+        ("GET /feature_requests/<id>?embed", "GET", "/feature_requests/bench-fr0000001?embed=comments", None),
+        ("GET /feature_requests/<id>/comments", "GET", "/feature_requests/bench-fr0000001/comments?limit=50", None),
+        ("GET /comments", "GET", "/comments?limit=50", None),
+        ("GET /users?stream=ndjson", "GET", "/users?stream=ndjson&limit=1000", None),
+        ("GET /search", "GET", "/search?q=export", None),
+        ("GET /search two words", "GET", "/search?q=dashboard+notification", None),
+        ("GET /search prefix", "GET", "/search?q=export+dash", None),
+        ("GET /search rare", "GET", "/search?q=quota", None),
+        ("GET /search?type=comment", "GET", "/search?q=export&type=comment", None),
+        ("GET /search page 5", "GET", "/search?q=export&limit=20&after=" + encode_offset(80), None),
+        ("POST /auth/login", "POST", "/auth/login", {"user_id": "bench-u000000", "password": BENCH_PASSWORD}),
+    ]
+
+
+def serve_app(app):
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def add_arguments(parser):
+    parser.add_argument("--url", help="load an already running server instead of serving api.py in-process")
+    parser.add_argument("--token", help="bearer token (default: one minted for bench-u000000)")
+    parser.add_argument("--seed", action="store_true", help="(re)create the bench-* rows first")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--feature-requests", type=int, default=500)
+    parser.add_argument("--comments-per-request", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="requests per route")
+    parser.add_argument("--login-requests", type=int, default=50, help="login is bcrypt-bound; keep it small")
+    parser.add_argument("--routes", nargs="*", help="only run routes whose name contains one of these")
+    parser.add_argument("--no-response-cache", action="store_true",
+                        help="in-process only: disable the GET response cache so every request hits the DB")
+
+
+def run(args):
+    import api
+
+    if args.seed:
+        db = api.connect_mysql()
+        try:
+            seed_database(db, args.users, args.feature_requests, args.comments_per_request)
+        finally:
+            db.close()
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        # Measure the routes, not the limiter: with the default login limits most
+        # of --login-requests would be cheap 429s counted in req/s. With --url,
+        # start the server with RATE_LIMIT_*=off for the same reason.
+        api.RATE_LIMITS.update(dict.fromkeys(api.RATE_LIMITS))
+        if args.no_response_cache:
+            api.response_cache.ttl = 0
+        server, base_url = serve_app(api.app)
+    token = args.token or api.generate_token("bench-u000000", "admin")
+
+    results = []
+    try:
+        for name, method, path, body in route_plan():
+            if args.routes and not any(r in name for r in args.routes):
+                continue
+            total = args.login_requests if name == "POST /auth/login" else args.requests
+            load = run_load(base_url, path, token, args.concurrency, total, method, body)
+            results.append(
+                {
+                    "name": f"route {name}",
+                    "value": load["rps"],
+                    "unit": "req/s",
+                    "p50_ms": load["p50_ms"],
+                    "p95_ms": load["p95_ms"],
+                    "p99_ms": load["p99_ms"],
+                    "errors": load["errors"],
+                    "requests": total,
+                    "concurrency": args.concurrency,
+                }
+            )
+    finally:
+        if server is not None:
+            server.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+        for r in results:
+            if r["errors"]:
+                print(f"WARNING: {r['name']} had {r['errors']} failed requests")
+
+
+if __name__ == "__main__":
+    main()
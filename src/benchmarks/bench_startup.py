@@ -0,0 +1,48 @@
+# Cold-start cost: a fresh interpreter importing each entry module, which is
+# what every CLI run, cron job and (non-forked) server worker pays.
+# Run from src/:  python benchmarks/bench_startup.py --modules api connect --repeat 10
+import argparse
+import json
+import subprocess
+import sys
+
+from common import SRC_DIR, measure, print_results
+
+DEFAULT_MODULES = ["encryption_utils", "connect", "api"]
+
+
+def import_once(module):
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=SRC_DIR, check=True)
+
+
+def add_arguments(parser):
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES, help="modules to import cold")
+    parser.add_argument("--startup-repeat", type=int, default=7)
+
+
+def run(args):
+    # "sys" is already loaded at startup, so that row is the bare interpreter
+    # baseline and the module rows read as "start + import".
+    results = []
+    for module in ["sys"] + args.modules:
+        name = "startup python" if module == "sys" else f"startup import {module}"
+        result = measure(name, lambda: import_once(module), repeat=args.startup_repeat, unit="starts/s")
+        result["ms"] = round(result["seconds_per_call"] * 1000, 1)
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+
+
+if __name__ == "__main__":
+    main()
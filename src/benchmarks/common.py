@@ -0,0 +1,114 @@
+# Shared timing, reporting and comparison helpers for the benchmark scripts.
+# Every benchmark yields result dicts:
+#   {"name": ..., "value": <rate>, "unit": "ops/s" | "MB/s" | "req/s", ...extra}
+# where a higher value is always better, so comparisons need no per-metric rules.
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+DEFAULT_THRESHOLD = 0.10  # flag a metric that got more than 10% slower
+
+
+def measure(name, fn, number=1, repeat=5, work=1, unit="ops/s", **extra):
+    # Calls fn() `number` times per round after one warm-up call. `work` is the
+    # amount processed per call (items, MB, ...), so value = work / seconds-per-call.
+    fn()
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - start) / number)
+    median = statistics.median(rounds)
+    result = {
+        "name": name,
+        "value": round(work / median, 3) if median else None,
+        "unit": unit,
+        "best": round(work / min(rounds), 3) if min(rounds) else None,
+        "seconds_per_call": round(median, 6),
+        "spread": round((max(rounds) - min(rounds)) / median, 3) if median else 0.0,
+    }
+    result.update(extra)
+    return result
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment():
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "git": _git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    for module in ("cryptography", "bcrypt", "flask"):
+        try:
+            info[module] = __import__(module).__version__
+        except (ImportError, AttributeError):
+            pass
+    return info
+
+
+def write_report(path, results, args=None):
+    report = {"environment": environment(), "args": args or {}, "results": results}
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    # Returns one row per metric present in both reports; `regressed` marks
+    # metrics whose value dropped by more than `threshold` (a fraction).
+    old = {r["name"]: r for r in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        before = old.get(result["name"])
+        if not before or not before.get("value") or result.get("value") is None:
+            continue
+        change = result["value"] / before["value"] - 1
+        rows.append(
+            {
+                "name": result["name"],
+                "unit": result["unit"],
+                "baseline": before["value"],
+                "current": result["value"],
+                "change": round(change, 4),
+                "regressed": change < -threshold,
+            }
+        )
+    return rows
+
+
+def print_results(results):
+    for r in results:
+        spread = f"(±{r['spread'] * 100:.0f}%)" if "spread" in r else ""
+        print(f"{r['name']:<44} {r['value']:>14,.1f} {r['unit']:<6} {spread}")
+
+
+def print_comparison(rows):
+    for row in rows:
+        flag = "REGRESSION" if row["regressed"] else ""
+        print(f"{row['name']:<44} {row['baseline']:>12,.1f} -> {row['current']:>12,.1f} {row['unit']:<6} "
+              f"{row['change'] * 100:+6.1f}%  {flag}")
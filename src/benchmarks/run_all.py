@@ -0,0 +1,53 @@
+# Runs the benchmark suites and writes one JSON report; optionally compares it
+# with an earlier report and exits non-zero on regressions. Run from src/:
+#   python benchmarks/run_all.py --output before.json
+#   ... change code ...
+#   python benchmarks/run_all.py --output after.json --compare before.json
+# The routes suite needs a database (see bench_routes.py); enable it with
+#   --suites crypto backup routes --seed
+import argparse
+import sys
+
+import bench_backup
+import bench_crypto
+import bench_routes
+import bench_startup
+from common import DEFAULT_THRESHOLD, compare, load_report, print_comparison, print_results, write_report
+
+SUITES = {"crypto": bench_crypto, "backup": bench_backup, "routes": bench_routes, "startup": bench_startup}
+
+
+def main():
+    parser = argparse.ArgumentParser(conflict_handler="resolve")
+    parser.add_argument("--suites", nargs="+", choices=sorted(SUITES), default=["crypto", "backup", "startup"])
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier report to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="fractional slowdown that counts as a regression (default 0.10)")
+    for module in SUITES.values():
+        module.add_arguments(parser)
+    args = parser.parse_args()
+
+    results = []
+    for name in args.suites:
+        print(f"== {name}")
+        suite_results = SUITES[name].run(args)
+        print_results(suite_results)
+        results.extend(suite_results)
+
+    report = write_report(args.output, results, vars(args))
+    print(f"\nWrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        rows = compare(load_report(args.compare), report, args.threshold)
+        print(f"\nCompared with {args.compare} (threshold {args.threshold:.0%}):")
+        print_comparison(rows)
+        regressions = [row for row in rows if row["regressed"]]
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) found.")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
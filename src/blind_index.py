@@ -0,0 +1,68 @@
+import logging
+import os
+import sys
+import time
+
+from encryption_utils import aes_decrypt_many, email_blind_index
+
+# Populates users.email_bidx for rows written before the blind index existed.
+# Walks the table in id order, one committed batch at a time, so it can be
+# stopped and re-run safely:
+#   python blind_index.py [batch_size]
+
+BACKFILL_BATCH_SIZE = 500
+
+
+def backfill_email_blind_index(db, batch_size=BACKFILL_BATCH_SIZE, progress=None):
+    cursor = db.cursor()
+    last_id = ""
+    updated = skipped = 0
+    while True:
+        cursor.execute(
+            "SELECT id, email FROM users WHERE email_bidx IS NULL AND id > %s ORDER BY id LIMIT %s",
+            (last_id, batch_size),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        emails = aes_decrypt_many([row[1] for row in rows], strict=False)
+        params = [(email_blind_index(email), row[0]) for row, email in zip(rows, emails) if email]
+        skipped += len(rows) - len(params)
+        if params:
+            cursor.executemany("UPDATE users SET email_bidx = %s WHERE id = %s", params)
+        db.commit()
+        updated += len(params)
+        if progress:
+            progress(updated, skipped)
+    cursor.close()
+    return updated, skipped
+
+
+def main(argv):
+    import mysql.connector
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    batch_size = int(argv[0]) if argv else BACKFILL_BATCH_SIZE
+    db = mysql.connector.connect(
+        host=os.getenv("DB_HOST", "localhost"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        database=os.getenv("DB_NAME"),
+    )
+    start = time.perf_counter()
+    try:
+        updated, skipped = backfill_email_blind_index(
+            db,
+            batch_size,
+            progress=lambda done, bad: logging.info("Backfilled %d rows (%d undecryptable)", done, bad),
+        )
+    finally:
+        db.close()
+    logging.info("Done: %d rows indexed, %d skipped in %.1fs", updated, skipped, time.perf_counter() - start)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
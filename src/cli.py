@@ -0,0 +1,219 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+
+import connect
+
+# Non-interactive counterpart to connect.py's menu, for cron and shell pipelines:
+#   python cli.py users import users.csv
+#   cat users.ndjson | python cli.py users import -
+#   python cli.py features export --format csv > features.csv
+#   python cli.py backup run && python cli.py backup verify
+# Credentials come from DB_HOST / DB_USER / DB_PASSWORD / DB_NAME. A run opens
+# at most one connection and reuses it for every batch. Data goes to stdout;
+# progress and throughput go to stderr. Exit status is 0 on success, 1 when a
+# backup step failed or any input row was skipped.
+
+CLI_BATCH_SIZE = int(os.getenv("CLI_BATCH_SIZE", "1000"))
+
+# CLI resource name -> (table, exported columns)
+RESOURCES = {
+    "users": ("users", ("id", "email", "full_name", "role")),
+    "features": ("feature_requests", ("id", "title", "content", "user_id")),
+    "comments": ("comments", ("id", "content", "user_id", "feature_request_id")),
+}
+
+# backup subcommand -> (connect.py action, needs a DB connection)
+BACKUP_ACTIONS = {
+    "run": (connect.backup_database, False),
+    "restore": (connect.restore_backup, False),
+    "verify": (connect.verify_backup, False),
+    "sharded": (connect.sharded_backup, True),
+    "sharded-restore": (connect.sharded_restore, False),
+    "incremental": (connect.incremental_backup, True),
+    "incremental-restore": (connect.incremental_restore, False),
+}
+
+
+def stream_format(path, fmt):
+    if fmt:
+        return fmt
+    return "csv" if path.endswith(".csv") else "ndjson"
+
+
+def open_input(path):
+    if path == "-":
+        return sys.stdin
+    return open(path, newline="", encoding="utf-8")
+
+
+def open_output(path):
+    if path in (None, "-"):
+        return sys.stdout
+    return open(path, "w", newline="", encoding="utf-8")
+
+
+def report(verb, count, table, seconds, extra=""):
+    rate = count / seconds if seconds else 0.0
+    print(f"{verb} {count} rows {table} in {seconds:.2f}s, {rate:.0f} rows/s{extra}.", file=sys.stderr)
+
+
+# -------------------------------
+#  EXPORT
+# -------------------------------
+def export_batches(db, table, columns, batch_size=CLI_BATCH_SIZE):
+    # Keyset pages by id, so each query stays cheap however deep the export goes.
+    # PII is written decrypted; undecryptable values are exported as null
+    # rather than aborting the run.
+    from export import protect_pii
+
+    cursor = db.cursor()
+    last_id = ""
+    while True:
+        cursor.execute(
+            f"SELECT {', '.join(columns)} FROM {table} WHERE id > %s ORDER BY id LIMIT %s",
+            (last_id, batch_size),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        rows = protect_pii(table, columns, rows, "decrypt")
+        yield rows
+        last_id = rows[-1][0]
+    cursor.close()
+
+
+def write_batches(f, fmt, columns, batches):
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for rows in batches:
+            writer.writerows(rows)
+            count += len(rows)
+        return count
+    for rows in batches:
+        f.write("".join(json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in rows))
+        count += len(rows)
+    return count
+
+
+def cmd_export(args, db):
+    table, columns = RESOURCES[args.resource]
+    fmt = stream_format(args.output or "", args.format)
+    out = open_output(args.output)
+    start = time.perf_counter()
+    try:
+        count = write_batches(out, fmt, columns, export_batches(db, table, columns, args.batch_size))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        else:
+            out.flush()
+    report("Exported", count, f"from {table}", time.perf_counter() - start)
+    return 0
+
+
+# -------------------------------
+#  IMPORT
+# -------------------------------
+def cmd_import(args, db):
+    import batch_ops
+    import mysql.connector
+
+    table = RESOURCES[args.resource][0]
+    fmt = stream_format(args.file, args.format)
+    f = open_input(args.file)
+    try:
+        imported, failed, seconds = connect.import_rows(
+            db, table, batch_ops.read_stream(f, fmt), args.batch_size
+        )
+    except mysql.connector.Error as err:
+        db.rollback()
+        print(f"ERROR: import stopped: {err.msg}", file=sys.stderr)
+        return 1
+    except ValueError as err:
+        # Unreadable input; batches before the bad line are already committed.
+        db.rollback()
+        print(f"ERROR: import stopped: {err}", file=sys.stderr)
+        return 1
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    report("Imported", imported, f"into {table}", seconds, f" ({failed} skipped)")
+    return 1 if failed else 0
+
+
+# -------------------------------
+#  BACKUP
+# -------------------------------
+def cmd_backup(args, db):
+    action, _ = BACKUP_ACTIONS[args.action]
+    ok = action(db) if db is not None else action()
+    return 0 if ok else 1
+
+
+def needs_db(args):
+    if args.group == "backup":
+        return BACKUP_ACTIONS[args.action][1]
+    return True
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Scriptable database, import/export and backup commands.")
+    groups = parser.add_subparsers(dest="group", required=True)
+
+    for resource, (table, _) in RESOURCES.items():
+        group = groups.add_parser(resource, help=f"{table} import / export")
+        actions = group.add_subparsers(dest="action", required=True)
+
+        imp = actions.add_parser("import", help=f"insert rows into {table} from CSV or NDJSON")
+        imp.add_argument("file", help="input path, or - for stdin")
+        imp.set_defaults(handler=cmd_import)
+
+        exp = actions.add_parser("export", help=f"write {table} as CSV or NDJSON")
+        exp.add_argument("-o", "--output", help="output path (default: stdout)")
+        exp.set_defaults(handler=cmd_export)
+
+        for sub in (imp, exp):
+            sub.set_defaults(resource=resource)
+            sub.add_argument("--format", choices=("csv", "ndjson"),
+                             help="default: from the file extension, else ndjson")
+            sub.add_argument("--batch-size", type=int, default=CLI_BATCH_SIZE)
+
+    backup = groups.add_parser("backup", help="encrypted backups (same as connect.py menu 7-13)")
+    actions = backup.add_subparsers(dest="action", required=True)
+    for name, (action, _) in BACKUP_ACTIONS.items():
+        actions.add_parser(name, help=action.__name__.replace("_", " ")).set_defaults(handler=cmd_backup)
+    return parser
+
+
+def main(argv):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s", stream=sys.stderr)
+
+    connect.DB_HOST = os.getenv("DB_HOST", "localhost")
+    connect.DB_USER = os.getenv("DB_USER")
+    connect.DB_PASSWORD = os.getenv("DB_PASSWORD")
+    connect.DB_NAME = os.getenv("DB_NAME")
+    if not (connect.DB_USER and connect.DB_PASSWORD and connect.DB_NAME):
+        print("ERROR: DB_USER, DB_PASSWORD and DB_NAME must be set.", file=sys.stderr)
+        return 2
+
+    db = connect.connect_db() if needs_db(args) else None
+    try:
+        return args.handler(args, db)
+    except OSError as err:
+        print(f"ERROR: {err}", file=sys.stderr)
+        return 1
+    finally:
+        if db is not None:
+            db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,15 +1,26 @@
+import json
 import os
+import subprocess
 import sys
-import mysql.connector
-from encryption_utils import aes_encrypt, aes_decrypt, hash_password
-from backup_utils import encrypt_backup, decrypt_backup, sha256_file, verify_backup_hash
+import time
+from metrics import phase, set_scope
 
-MYSQLDUMP = "C:\\Program Files\\MySQL\\MySQL Server 8.0\\bin\\mysqldump.exe"
-MYSQL = "C:\\Program Files\\MySQL\\MySQL Server 8.0\\bin\\mysql.exe"
+# mysql.connector, cryptography, bcrypt and the backup engines are imported by
+# the menu actions that use them, so the menu comes up without loading them all.
+
+MYSQLDUMP = os.getenv("MYSQLDUMP", "C:\\Program Files\\MySQL\\MySQL Server 8.0\\bin\\mysqldump.exe")
+MYSQL = os.getenv("MYSQL", "C:\\Program Files\\MySQL\\MySQL Server 8.0\\bin\\mysql.exe")
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SHARDED_BACKUP_DIR = os.path.join(BASE_DIR, "backups")
+INCREMENTAL_BACKUP_DIR = os.path.join(BASE_DIR, "backups", "incremental")
+
+BACKUP_WORKERS = int(os.getenv("BACKUP_WORKERS", "0")) or None  # default: one per CPU
+BACKUP_COMPRESSION = os.getenv("BACKUP_COMPRESSION")  # zstd | gzip | none
+BACKUP_COMPRESSION_LEVEL = int(os.getenv("BACKUP_COMPRESSION_LEVEL", "0")) or None  # default per algorithm
 
 
+DB_HOST = "localhost"
 DB_USER = None
 DB_PASSWORD = None
 DB_NAME = None
@@ -22,57 +33,205 @@ def login():
     return db_user, db_password, db_name
 
 def connect_db():
+    import mysql.connector
+
     return mysql.connector.connect(
-        host="localhost",
+        host=DB_HOST,
         user=DB_USER,
         password=DB_PASSWORD,
         database=DB_NAME
     )
 
 
-def backup_database():
-    sql_file = os.path.join(BASE_DIR, "backup.sql")
-    enc_file = os.path.join(BASE_DIR, "backup_encrypted.bin")
-    hash_file = os.path.join(BASE_DIR, "backup_hash.txt")
+def mysql_args(binary, options=()):
+    return [binary, "-h", DB_HOST, "-u", DB_USER, f"-p{DB_PASSWORD}", *options, DB_NAME]
 
-    print("Creating SQL dump...")
-    os.system(f"\"{MYSQLDUMP}\" -u {DB_USER} -p{DB_PASSWORD} {DB_NAME} > {sql_file}")
 
-    print("Encrypting backup...")
-    encrypt_backup(sql_file, enc_file)
+def format_rate(size, seconds):
+    return f"{size / 1e6:.1f} MB in {seconds:.1f}s, {size / 1e6 / max(seconds, 1e-9):.1f} MB/s"
 
-    # Generate integrity hash
-    backup_hash = sha256_file(enc_file)
+
+def backup_database():
+    from backup_utils import encrypt_stream
+
+    enc_file = os.path.join(BASE_DIR, "backup_encrypted.bin")
+    hash_file = os.path.join(BASE_DIR, "backup_hash.txt")
+    manifest_file = os.path.join(BASE_DIR, "backup_manifest.json")
+
+    # mysqldump stdout is encrypted as it streams in; no plaintext dump on disk.
+    print("Creating encrypted SQL dump...")
+    set_scope("backup")
+    dump = subprocess.Popen(mysql_args(MYSQLDUMP), stdout=subprocess.PIPE)
+    with phase("backup_total") as timer, open(enc_file + ".tmp", "wb") as f:
+        manifest = encrypt_stream(dump.stdout, f)
+    dump.stdout.close()
+    if dump.wait() != 0:
+        os.remove(enc_file + ".tmp")
+        print("ERROR: mysqldump failed, previous backup left untouched.\n")
+        return False
+    os.replace(enc_file + ".tmp", enc_file)
+
+    # Integrity hashes were computed while the ciphertext was written
     with open(hash_file, "w") as f:
-        f.write(backup_hash)
+        f.write(manifest["sha256"])
+    with open(manifest_file, "w") as f:
+        json.dump(manifest, f)
 
     print("\nBackup complete:")
-    print(f"Encrypted File: {enc_file}")
+    print(f"Encrypted File: {enc_file} ({format_rate(manifest['size'], timer.elapsed)})")
     print(f"Integrity Hash stored in {hash_file}\n")
+    return True
 
 def restore_backup():
-    enc_file = os.path.join(BASE_DIR, "backup_encrypted.bin")
-    restored_sql = os.path.join(BASE_DIR, "restored_backup.sql")
+    from backup_utils import decrypt_stream
 
-    print("Decrypting backup...")
-    decrypt_backup(enc_file, restored_sql)
-
-    print("Restoring DB...")
-    os.system(f"\"{MYSQL}\" -u {DB_USER} -p{DB_PASSWORD} {DB_NAME} < {restored_sql}")
+    enc_file = os.path.join(BASE_DIR, "backup_encrypted.bin")
 
-    print("Database restored successfully.\n")
+    print("Decrypting and restoring DB...")
+    set_scope("restore")
+    restore = subprocess.Popen(mysql_args(MYSQL), stdin=subprocess.PIPE)
+    with phase("restore_total") as timer:
+        try:
+            with open(enc_file, "rb") as f:
+                decrypt_stream(f, restore.stdin)
+        finally:
+            restore.stdin.close()
+        status = restore.wait()
+    if status != 0:
+        print("ERROR: mysql exited with an error during restore.\n")
+        return False
+
+    print(f"Database restored successfully ({format_rate(os.path.getsize(enc_file), timer.elapsed)}).\n")
+    return True
 
 def verify_backup():
+    from backup_utils import HASH_CHUNK_SIZE, corrupted_regions, scan_backup
+
     enc_file = os.path.join(BASE_DIR, "backup_encrypted.bin")
     hash_file = os.path.join(BASE_DIR, "backup_hash.txt")
+    manifest_file = os.path.join(BASE_DIR, "backup_manifest.json")
 
     with open(hash_file, "r") as f:
         stored_hash = f.read().strip()
 
-    if verify_backup_hash(enc_file, stored_hash):
+    manifest = None
+    if os.path.exists(manifest_file):
+        with open(manifest_file, "r") as f:
+            manifest = json.load(f)
+
+    def progress(done, total):
+        print(f"\rVerifying... {done * 100 // total}%", end="", flush=True)
+
+    chunk_size = manifest["chunk_size"] if manifest else HASH_CHUNK_SIZE
+    set_scope("verify")
+    with phase("verify_total") as timer:
+        scanned = scan_backup(enc_file, chunk_size, progress)
+    print(f" ({format_rate(scanned['size'], timer.elapsed)})")
+
+    if scanned["sha256"] == stored_hash:
         print("Backup integrity verified: OK")
-    else:
-        print("WARNING: Backup has been altered or corrupted!")
+        return True
+
+    print("WARNING: Backup has been altered or corrupted!")
+    if manifest and manifest["sha256"] == stored_hash:
+        for offset, length in corrupted_regions(manifest, scanned):
+            print(f"  corrupted region: bytes {offset}-{offset + length - 1}")
+    return False
+
+
+
+def list_tables(db=None):
+    conn = db or connect_db()
+    cursor = conn.cursor()
+    cursor.execute("SHOW TABLES")
+    tables = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    if db is None:
+        conn.close()
+    return tables
+
+
+def sharded_backup(db=None):
+    from backup_engine import BackupError, run_sharded_backup
+
+    tables = list_tables(db)
+    print(f"Dumping {len(tables)} tables in parallel...")
+    try:
+        out_dir, manifest = run_sharded_backup(
+            mysql_args(MYSQLDUMP),
+            tables,
+            SHARDED_BACKUP_DIR,
+            workers=BACKUP_WORKERS,
+            compression=BACKUP_COMPRESSION,
+            level=BACKUP_COMPRESSION_LEVEL,
+        )
+    except BackupError as err:
+        print(f"ERROR: {err}\n")
+        return False
+
+    total = sum(shard["size"] for shard in manifest["shards"])
+    print(f"\nSharded backup complete ({manifest['compression']}, {total} bytes):")
+    print(f"Backup directory: {out_dir}\n")
+    return True
+
+
+def sharded_restore():
+    from backup_engine import BackupError, latest_backup_dir, run_sharded_restore
+
+    backup_dir = latest_backup_dir(SHARDED_BACKUP_DIR)
+    if backup_dir is None:
+        print("No sharded backup found.\n")
+        return False
+
+    print(f"Restoring shards from {backup_dir}...")
+    try:
+        results = run_sharded_restore(mysql_args(MYSQL), backup_dir, workers=BACKUP_WORKERS)
+    except BackupError as err:
+        print(f"ERROR: {err}\n")
+        return False
+
+    for result in results:
+        print(f"  {result['table']}: {result['seconds']}s")
+    print("Database restored successfully.\n")
+    return True
+
+
+def incremental_backup(db=None):
+    from incremental_backup import IncrementalBackupError, run_incremental_backup
+
+    conn = db or connect_db()
+    try:
+        entry = run_incremental_backup(
+            lambda options: mysql_args(MYSQLDUMP, options),
+            conn,
+            INCREMENTAL_BACKUP_DIR,
+        )
+    except IncrementalBackupError as err:
+        print(f"ERROR: {err}\n")
+        return False
+    finally:
+        if db is None:
+            conn.close()
+
+    kind = "Increment" if "since" in entry else "Base backup"
+    print(f"\n{kind} written: {entry['file']} (changes up to {entry['watermark']})\n")
+    return True
+
+
+def incremental_restore():
+    from incremental_backup import IncrementalBackupError, run_incremental_restore
+
+    print("Replaying base backup and increments...")
+    try:
+        restored = run_incremental_restore(mysql_args(MYSQL), INCREMENTAL_BACKUP_DIR)
+    except IncrementalBackupError as err:
+        print(f"ERROR: {err}\n")
+        return False
+
+    for name in restored:
+        print(f"  applied {name}")
+    print("Database restored successfully.\n")
+    return True
 
 
 
@@ -80,18 +239,21 @@ def verify_backup():
 #  CREATE USER (WITH ENCRYPTION)
 # -------------------------------
 def create_user():
+    from encryption_utils import aes_encrypt, email_blind_index, hash_password
+
     db = connect_db()
     cursor = db.cursor()
 
     user_id = input("User ID: ")
-    email = aes_encrypt(input("Email: "))
+    email_plain = input("Email: ")
+    email = aes_encrypt(email_plain)
     full_name = aes_encrypt(input("Full Name: "))
     password_hash = hash_password(input("Password: "))
 
     cursor.execute("""
-        INSERT INTO users (id, email, password_hash, full_name)
-        VALUES (%s, %s, %s, %s)
-    """, (user_id, email, password_hash, full_name))
+        INSERT INTO users (id, email, email_bidx, password_hash, full_name)
+        VALUES (%s, %s, %s, %s, %s)
+    """, (user_id, email, email_blind_index(email_plain), password_hash, full_name))
 
     db.commit()
     cursor.close()
@@ -101,19 +263,22 @@ def create_user():
 
 
 def list_users():
+    from encryption_utils import aes_decrypt_many
+
     db = connect_db()
     cursor = db.cursor()
 
     cursor.execute("SELECT id, email, full_name FROM users")
     rows = cursor.fetchall()
 
+    emails = aes_decrypt_many([row[1] for row in rows], strict=False)
+    names = aes_decrypt_many([row[2] for row in rows], strict=False)
+
     print("\n--- USERS (DECRYPTED VIEW) ---")
-    for row in rows:
-        try:
-            email = aes_decrypt(row[1])
-            name = aes_decrypt(row[2])
-        except:
+    for row, email, name in zip(rows, emails, names):
+        if email is None:
             email = "<decrypt error>"
+        if name is None:
             name = "<decrypt error>"
 
         print(row[0], email, name)
@@ -204,6 +369,60 @@ def list_comments():
     print()
 
 
+# -------------------------------
+#  BULK IMPORT (CSV / NDJSON)
+# -------------------------------
+def import_rows(db, table, records, batch_size=None):
+    import batch_ops
+
+    batch_size = batch_size or batch_ops.MAX_BATCH_SIZE
+    # One connection, one transaction per batch; invalid rows are reported and skipped.
+    cursor = db.cursor()
+    imported = failed = 0
+    start = time.perf_counter()
+    for batch in batch_ops.batched(records, batch_size):
+        valid, results = batch_ops.validate_items(table, batch)
+        for result in results:
+            if result.get("status") == "error":
+                print(f"  skipped row {imported + failed + result['index'] + 1}: {result['error']}", file=sys.stderr)
+        rows = batch_ops.prepare_insert_rows(table, [item for _, item in valid])
+        batch_ops.insert_rows(cursor, table, rows)
+        db.commit()
+        imported += len(valid)
+        failed += len(batch) - len(valid)
+    cursor.close()
+    return imported, failed, time.perf_counter() - start
+
+
+def import_file():
+    import batch_ops
+    import mysql.connector
+
+    table = input(f"Table ({', '.join(batch_ops.BATCH_SPECS)}): ").strip()
+    if table not in batch_ops.BATCH_SPECS:
+        print("Unknown table.\n")
+        return
+    path = input("CSV or NDJSON file path: ").strip()
+
+    db = connect_db()
+    try:
+        imported, failed, seconds = import_rows(db, table, batch_ops.read_records(path))
+    except mysql.connector.Error as err:
+        db.rollback()
+        print(f"ERROR: import stopped: {err.msg}\n")
+        return
+    except ValueError as err:
+        # Unreadable input; batches before the bad line are already committed.
+        db.rollback()
+        print(f"ERROR: import stopped: {err}\n")
+        return
+    finally:
+        db.close()
+
+    rate = imported / seconds if seconds else 0
+    print(f"Imported {imported} rows into {table} ({failed} skipped) in {seconds:.2f}s, {rate:.0f} rows/s.\n")
+
+
 # -------------------------------
 #  MENU SYSTEM
 # -------------------------------
@@ -222,6 +441,11 @@ def main_menu():
 7. Backup Database (Encrypted)
 8. Restore Encrypted Backup
 9. Verify Backup Integrity
+10. Parallel Sharded Backup (Compressed + Encrypted)
+11. Restore Latest Sharded Backup
+12. Incremental Backup (changes since last run)
+13. Restore Base + Incremental Backups
+14. Import Rows From File (CSV / NDJSON)
 0. Exit
 """)
 
@@ -245,6 +469,16 @@ def main_menu():
             restore_backup()
         elif choice == "9":
             verify_backup()
+        elif choice == "10":
+            sharded_backup()
+        elif choice == "11":
+            sharded_restore()
+        elif choice == "12":
+            incremental_backup()
+        elif choice == "13":
+            incremental_restore()
+        elif choice == "14":
+            import_file()
         elif choice == "0":
             print("Exiting...")
             sys.exit()
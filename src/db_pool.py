@@ -0,0 +1,164 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def default_health_check(conn) -> bool:
+    try:
+        if hasattr(conn, "is_connected"):
+            # mysql.connector: pings the server
+            return conn.is_connected()
+        # sqlite3 / generic DB-API stand-in
+        conn.execute("SELECT 1")
+        return True
+    except Exception:
+        return False
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        size: int = 5,
+        max_lifetime: float = 1800.0,
+        wait_timeout: float = 5.0,
+        health_check: Optional[Callable[[Any], bool]] = None,
+        health_check_interval: float = 30.0,
+    ):
+        if size < 1:
+            raise ValueError("pool size must be >= 1")
+        self._factory = factory
+        self.size = size
+        self.max_lifetime = max_lifetime
+        self.wait_timeout = wait_timeout
+        self.health_check_interval = health_check_interval
+        self._health_check = health_check or default_health_check
+
+        self._cond = threading.Condition()
+        self._idle: List[Any] = []
+        self._created_at: Dict[int, float] = {}
+        self._last_used: Dict[int, float] = {}
+        self._open = 0
+
+        # metrics
+        self.checkouts = 0
+        self.waits = 0
+        self.misses = 0
+        self.timeouts = 0
+        self.discarded = 0
+
+    # ------------------------------
+    # Checkout / return
+    # ------------------------------
+    def acquire(self):
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            self.checkouts += 1
+
+        while True:
+            conn = self._take(deadline)
+            if conn is None:
+                return self._connect()
+            if self._usable(conn):
+                return conn
+            self._discard(conn)
+
+    def release(self, conn) -> None:
+        try:
+            # Never hand the next request a half-finished transaction.
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+
+        if self._expired(conn):
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._last_used[id(conn)] = time.monotonic()
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def close(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "size": self.size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "misses": self.misses,
+                "timeouts": self.timeouts,
+                "discarded": self.discarded,
+            }
+
+    # ------------------------------
+    # Internals
+    # ------------------------------
+    def _take(self, deadline: float):
+        # Returns an idle connection, or None when the caller may open a new one.
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._open < self.size:
+                    self._open += 1
+                    self.misses += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"no database connection available within {self.wait_timeout}s")
+                if not waited:
+                    self.waits += 1
+                    waited = True
+                self._cond.wait(remaining)
+
+    def _connect(self):
+        try:
+            conn = self._factory()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        now = time.monotonic()
+        self._created_at[id(conn)] = now
+        self._last_used[id(conn)] = now
+        return conn
+
+    def _expired(self, conn) -> bool:
+        created = self._created_at.get(id(conn), 0.0)
+        return self.max_lifetime > 0 and time.monotonic() - created > self.max_lifetime
+
+    def _usable(self, conn) -> bool:
+        if self._expired(conn):
+            return False
+        idle_for = time.monotonic() - self._last_used.get(id(conn), 0.0)
+        if idle_for < self.health_check_interval:
+            return True
+        return self._health_check(conn)
+
+    def _discard(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._created_at.pop(id(conn), None)
+            self._last_used.pop(id(conn), None)
+            self._open -= 1
+            self.discarded += 1
+            self._cond.notify()
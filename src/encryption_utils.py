@@ -1,9 +1,16 @@
 import os
 import base64
-import bcrypt
+import hashlib
+import hmac
+from typing import Iterable, List, Optional
+
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives import padding, serialization, hashes
-from cryptography.hazmat.primitives.asymmetric import rsa, padding as rsa_padding
+
+from key_manager import DEFAULT_KEY_ID, KeyManager, KeyNotFound
+
+# Nothing is read from disk at import time, and bcrypt / the RSA and thread-pool
+# modules are imported on first use, so short-lived CLI runs and freshly started
+# API workers only pay for what they touch. warm_keys() front-loads the work.
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -13,14 +20,16 @@ KEYS_DIR = os.path.join(BASE_DIR, "rsa_keys")
 # =====================================================
 #  LOADING RSA KEYS
 # =====================================================
-def load_public_key():
-    with open(os.path.join(KEYS_DIR, "public.pem"), "rb") as f:
-        return serialization.load_pem_public_key(f.read())
+# Parsed once per key id and file version; see key_manager.py for the layout.
+RSA_KEYS = KeyManager(KEYS_DIR)
+
 
+def load_public_key(kid: Optional[str] = None):
+    return RSA_KEYS.public_key(kid)
 
-def load_private_key():
-    with open(os.path.join(KEYS_DIR, "private.pem"), "rb") as f:
-        return serialization.load_pem_private_key(f.read(), password=None)
+
+def load_private_key(kid: Optional[str] = None):
+    return RSA_KEYS.private_key(kid)
 
 
 # =====================================================
@@ -39,74 +48,252 @@ def load_or_create_aes_key():
             f.write(key)
         return key
 
-AES_KEY = load_or_create_aes_key()
 
+# Key versions: ciphertexts are "<kid>:" + base64(iv + data). Values without a
+# prefix predate key ids and belong to kid "default" (aes.key); other kids live
+# in aes_keys/<kid>/aes.key. New values use $AES_KEY_ID, else aes_keys/CURRENT.
+AES_KEYS_DIR = os.path.join(BASE_DIR, "aes_keys")
+AES_KEYS = KeyManager(AES_KEYS_DIR, env_var="AES_KEY_ID")
 
-def aes_encrypt(plain_text: str) -> str:
-    iv = os.urandom(16)
 
-    cipher = Cipher(algorithms.AES(AES_KEY), modes.CBC(iv))
-    encryptor = cipher.encryptor()
+def aes_key_path(kid: str) -> str:
+    if kid == DEFAULT_KEY_ID:
+        return AES_KEY_FILE
+    return os.path.join(AES_KEYS.key_dir(kid), "aes.key")
+
 
-    padder = padding.PKCS7(128).padder()
-    padded = padder.update(plain_text.encode()) + padder.finalize()
+def create_aes_key(kid: str) -> str:
+    path = aes_key_path(kid)
+    if os.path.exists(path):
+        raise FileExistsError(f"AES key {kid} already exists")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(os.urandom(32))
+    return path
 
-    encrypted = encryptor.update(padded) + encryptor.finalize()
 
-    return base64.b64encode(iv + encrypted).decode()
+def ciphertext_kid(encrypted_text: str) -> str:
+    kid, sep, _ = encrypted_text.partition(":")
+    return kid if sep else DEFAULT_KEY_ID
+
+
+def aes_encrypt(plain_text: str, kid: Optional[str] = None) -> str:
+    return _encrypt_one(plain_text, kid or AES_KEYS.current_kid())
 
 
 def aes_decrypt(encrypted_text: str) -> str:
-    raw = base64.b64decode(encrypted_text)
-    iv = raw[:16]
-    ciphertext = raw[16:]
+    return _decrypt_one(encrypted_text)
+
+
+# =====================================================
+#  BULK AES (FOR COLUMN BATCHES)
+# =====================================================
+# One AES key schedule per key id shared by every row; CBC still needs a
+# fresh context per IV, but padding is done inline instead of building a
+# PKCS7 padder/unpadder object for each value.
+_BLOCK = 16
 
-    cipher = Cipher(algorithms.AES(AES_KEY), modes.CBC(iv))
-    decryptor = cipher.decryptor()
 
-    decrypted_padded = decryptor.update(ciphertext) + decryptor.finalize()
+def _aes_algorithm(kid: str):
+    try:
+        return AES_KEYS.load_file(aes_key_path(kid), algorithms.AES)
+    except KeyNotFound:
+        if kid != DEFAULT_KEY_ID:
+            raise
+        load_or_create_aes_key()
+        return AES_KEYS.load_file(AES_KEY_FILE, algorithms.AES)
 
-    unpadder = padding.PKCS7(128).unpadder()
-    decrypted = unpadder.update(decrypted_padded) + unpadder.finalize()
 
-    return decrypted.decode()
+def _pkcs7_pad(data: bytes) -> bytes:
+    n = _BLOCK - len(data) % _BLOCK
+    return data + bytes([n]) * n
+
+
+def _pkcs7_unpad(data: bytes) -> bytes:
+    if not data or len(data) % _BLOCK:
+        raise ValueError("Invalid padding bytes.")
+    n = data[-1]
+    if n < 1 or n > _BLOCK or data[-n:] != bytes([n]) * n:
+        raise ValueError("Invalid padding bytes.")
+    return data[:-n]
+
+
+def _encrypt_one(plain_text: str, kid: str, algorithm=None) -> str:
+    iv = os.urandom(16)
+    encryptor = Cipher(algorithm or _aes_algorithm(kid), modes.CBC(iv)).encryptor()
+    encrypted = encryptor.update(_pkcs7_pad(plain_text.encode())) + encryptor.finalize()
+    body = base64.b64encode(iv + encrypted).decode()
+    return body if kid == DEFAULT_KEY_ID else f"{kid}:{body}"
+
+
+def _decrypt_one(encrypted_text: str, resolve=_aes_algorithm) -> str:
+    kid, sep, body = encrypted_text.partition(":")
+    if not sep:
+        kid, body = DEFAULT_KEY_ID, encrypted_text
+    raw = base64.b64decode(body)
+    decryptor = Cipher(resolve(kid), modes.CBC(raw[:16])).decryptor()
+    return _pkcs7_unpad(decryptor.update(raw[16:]) + decryptor.finalize()).decode()
+
+
+def _map_batch(fn, values: List[Optional[str]], workers: int, strict: bool) -> List[Optional[str]]:
+    def run(value):
+        # NULL columns pass through untouched; "" is a value like any other.
+        if value is None:
+            return None
+        if strict:
+            return fn(value)
+        try:
+            return fn(value)
+        except Exception:
+            return None
+
+    if workers > 1 and len(values) > workers:
+        from concurrent.futures import ThreadPoolExecutor
+
+        chunk = (len(values) + workers - 1) // workers
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parts = pool.map(lambda i: [run(v) for v in values[i:i + chunk]], range(0, len(values), chunk))
+            return [item for part in parts for item in part]
+    return [run(v) for v in values]
+
+
+def aes_encrypt_many(values: Iterable[Optional[str]], workers: int = 0, kid: Optional[str] = None) -> List[Optional[str]]:
+    kid = kid or AES_KEYS.current_kid()
+    algorithm = _aes_algorithm(kid)
+    return _map_batch(lambda value: _encrypt_one(value, kid, algorithm), list(values), workers, strict=True)
+
+
+def aes_decrypt_many(values: Iterable[Optional[str]], workers: int = 0, strict: bool = True) -> List[Optional[str]]:
+    # strict=False maps undecryptable values to None instead of raising.
+    # Each value is decrypted with the key its prefix names, so mixed key versions
+    # are fine; keys are resolved once per batch.
+    keys = {}
+
+    def resolve(kid):
+        algorithm = keys.get(kid)
+        if algorithm is None:
+            algorithm = keys[kid] = _aes_algorithm(kid)
+        return algorithm
+
+    # "" is not ciphertext; it reads back as "", as in api.safe_decrypt (rows
+    # written before empty strings were encrypted hold it in clear).
+    return _map_batch(lambda value: _decrypt_one(value, resolve) if value else value, list(values), workers, strict)
+
+
+# =====================================================
+#  BLIND INDEX (EQUALITY LOOKUPS ON ENCRYPTED COLUMNS)
+# =====================================================
+# Keyed HMAC of the normalized value, stored next to the ciphertext so a
+# lookup is an indexed equality match instead of decrypting every row. Uses
+# its own key so the AES key never doubles as a MAC key.
+BLIND_INDEX_KEY_FILE = os.path.join(BASE_DIR, "blind_index.key")
+
+
+def load_or_create_blind_index_key():
+    if os.path.exists(BLIND_INDEX_KEY_FILE):
+        with open(BLIND_INDEX_KEY_FILE, "rb") as f:
+            return f.read()
+    else:
+        key = os.urandom(32)
+        with open(BLIND_INDEX_KEY_FILE, "wb") as f:
+            f.write(key)
+        return key
+
+
+def _blind_index_key() -> bytes:
+    try:
+        return AES_KEYS.load_file(BLIND_INDEX_KEY_FILE, bytes)
+    except KeyNotFound:
+        load_or_create_blind_index_key()
+        return AES_KEYS.load_file(BLIND_INDEX_KEY_FILE, bytes)
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def email_blind_index(email: str) -> str:
+    return hmac.new(_blind_index_key(), normalize_email(email).encode(), hashlib.sha256).hexdigest()
 
 
 # =====================================================
 #  RSA ENCRYPTION (FOR AES KEY SHARING)
 # =====================================================
-def rsa_encrypt_key(aes_key: bytes) -> bytes:
-    public_key = load_public_key()
+_OAEP = None
+
+
+def _oaep():
+    global _OAEP
+    if _OAEP is None:
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding as rsa_padding
 
-    return public_key.encrypt(
-        aes_key,
-        rsa_padding.OAEP(
+        _OAEP = rsa_padding.OAEP(
             mgf=rsa_padding.MGF1(algorithm=hashes.SHA256()),
             algorithm=hashes.SHA256(),
             label=None
         )
-    )
+    return _OAEP
 
 
-def rsa_decrypt_key(enc_key: bytes) -> bytes:
-    private_key = load_private_key()
+def rsa_encrypt_key(aes_key: bytes, kid: Optional[str] = None) -> bytes:
+    # kid=None wraps with the current key id (RSA_KEYS.current_kid()).
+    return load_public_key(kid).encrypt(aes_key, _oaep())
 
-    return private_key.decrypt(
-        enc_key,
-        rsa_padding.OAEP(
-            mgf=rsa_padding.MGF1(algorithm=hashes.SHA256()),
-            algorithm=hashes.SHA256(),
-            label=None
-        )
-    )
+
+def rsa_decrypt_key(enc_key: bytes, kid: Optional[str] = None) -> bytes:
+    return load_private_key(kid).decrypt(enc_key, _oaep())
 
 
 # =====================================================
 #  PASSWORD HASHING (BCRYPT)
 # =====================================================
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+
+def hash_password(password: str, rounds: Optional[int] = None) -> str:
+    import bcrypt
+
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds or BCRYPT_ROUNDS)).decode()
+
+
+def password_needs_rehash(hashed: str, rounds: Optional[int] = None) -> bool:
+    # bcrypt hashes look like $2b$<cost>$<salt+digest>
+    try:
+        cost = int(hashed.split("$")[2])
+    except (IndexError, ValueError):
+        return True
+    return cost != (rounds or BCRYPT_ROUNDS)
 
 
 def verify_password(password: str, hashed: str) -> bool:
+    import bcrypt
+
     return bcrypt.checkpw(password.encode(), hashed.encode())
+
+
+# =====================================================
+#  WARM-UP / BACKWARDS COMPATIBILITY
+# =====================================================
+def warm_keys(rsa: bool = False) -> List[str]:
+    # Loads the default and current AES keys and the blind-index key (and
+    # imports bcrypt) ahead of the first request, e.g. in a prefork master.
+    kids = sorted({DEFAULT_KEY_ID, AES_KEYS.current_kid()})
+    for kid in kids:
+        _aes_algorithm(kid)
+    _blind_index_key()
+    import bcrypt  # noqa: F401
+
+    if rsa:
+        load_public_key()
+        _oaep()
+    return kids
+
+
+def __getattr__(name):
+    # AES_KEY / BLIND_INDEX_KEY used to be read at import; they now load on first access.
+    if name == "AES_KEY":
+        return load_or_create_aes_key()
+    if name == "BLIND_INDEX_KEY":
+        return _blind_index_key()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
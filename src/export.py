@@ -0,0 +1,323 @@
+import argparse
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from encryption_utils import aes_decrypt_many
+from masking import mask_email, mask_name
+
+# Exports tables for analytics without loading them into memory:
+#   python export.py                                  all tables, masked PII, gzip NDJSON
+#   python export.py --tables users --pii decrypt --format parquet --workers 2
+# Each table is read by its own worker process through an unbuffered
+# (server-side) cursor in --batch-size rows, and PII columns are decrypted
+# one batch at a time, then either masked (same policy as the API) or written
+# in clear. Output goes to exports/<name>/<table>.part-NNNNN.<ext>. A part is
+# renamed into place only when complete, and <table>.state.json records the
+# last exported id, so re-running with the same --name resumes after the last
+# finished part. manifest.json is written once every table is done.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+EXPORT_DIR = os.path.join(BASE_DIR, "exports")
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+EXPORT_PART_ROWS = int(os.getenv("EXPORT_PART_ROWS", "500000"))
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "0")) or None  # default: one per table, up to CPU count
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+FORMAT_EXTENSIONS = {"ndjson": ".ndjson.gz", "parquet": ".parquet"}
+
+EXPORT_TABLES = {
+    "users": ("id", "email", "full_name", "role", "created_at"),
+    "feature_requests": ("id", "title", "content", "user_id", "created_at"),
+    "comments": ("id", "content", "user_id", "feature_request_id", "created_at"),
+}
+# Encrypted columns and how each is masked in --pii mask mode.
+PII_COLUMNS = {"users": {"email": mask_email, "full_name": mask_name}}
+TIMESTAMP_COLUMNS = ("created_at",)
+
+
+class ExportError(Exception):
+    pass
+
+
+def db_config_from_env():
+    return {
+        "host": os.getenv("DB_HOST", "localhost"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "database": os.getenv("DB_NAME"),
+    }
+
+
+def connect_db(db_config):
+    import mysql.connector
+
+    return mysql.connector.connect(**db_config)
+
+
+# ============================================================
+# Row transforms
+# ============================================================
+def protect_pii(table, columns, rows, pii):
+    # rows: list of tuples straight from the cursor -> list of lists, PII decrypted or masked.
+    rows = [list(row) for row in rows]
+    for column, mask in PII_COLUMNS.get(table, {}).items():
+        i = columns.index(column)
+        plain = aes_decrypt_many([row[i] for row in rows], strict=False)
+        if pii == "mask":
+            plain = [mask(value) for value in plain]
+        for row, value in zip(rows, plain):
+            row[i] = value
+    return rows
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+# ============================================================
+# Part writers (one open output file each)
+# ============================================================
+class NdjsonPart:
+    def __init__(self, path, columns, compresslevel=6):
+        self.columns = columns
+        self._file = gzip.open(path, "wt", encoding="utf-8", compresslevel=compresslevel)
+
+    def write(self, rows):
+        columns = self.columns
+        self._file.write("".join(
+            json.dumps(dict(zip(columns, row)), default=_json_default, separators=(",", ":")) + "\n"
+            for row in rows
+        ))
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetPart:
+    def __init__(self, path, columns):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:  # optional dependency
+            raise ExportError("parquet export requires the 'pyarrow' package") from None
+        self._pa = pyarrow
+        self.columns = columns
+        self.schema = pyarrow.schema([
+            (c, pyarrow.timestamp("us") if c in TIMESTAMP_COLUMNS else pyarrow.string()) for c in columns
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, rows):
+        # One row group per batch keeps memory at a single batch.
+        data = {c: [row[i] for row in rows] for i, c in enumerate(self.columns)}
+        self._writer.write_table(self._pa.Table.from_pydict(data, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+
+
+PART_WRITERS = {"ndjson": NdjsonPart, "parquet": ParquetPart}
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# ============================================================
+# Checkpoints
+# ============================================================
+def state_path(out_dir, table):
+    return os.path.join(out_dir, f"{table}.state.json")
+
+
+def load_state(out_dir, table, fmt, pii):
+    path = state_path(out_dir, table)
+    if os.path.exists(path):
+        with open(path) as f:
+            state = json.load(f)
+        if (state["format"], state["pii"]) != (fmt, pii):
+            raise ExportError(f"{out_dir} holds a {state['format']}/{state['pii']} export of {table}; use another --name")
+        return state
+    return {"table": table, "format": fmt, "pii": pii, "last_id": "", "rows": 0, "parts": [], "done": False}
+
+
+def save_state(out_dir, state):
+    path = state_path(out_dir, state["table"])
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+# ============================================================
+# Table export (runs in a worker process)
+# ============================================================
+def export_table(db, table, out_dir, fmt="ndjson", pii="mask",
+                 batch_size=EXPORT_BATCH_SIZE, part_rows=EXPORT_PART_ROWS):
+    state = load_state(out_dir, table, fmt, pii)
+    if state["done"]:
+        return state
+    columns = EXPORT_TABLES[table]
+    writer_cls = PART_WRITERS[fmt]
+    start = time.monotonic()
+    resumed_rows = state["rows"]
+
+    part = part_path = None
+    part_count = 0
+    # Unbuffered: the server streams the result and only one batch is held here.
+    cursor = db.cursor(buffered=False)
+    cursor.execute(
+        f"SELECT {', '.join(columns)} FROM {table} WHERE id > %s ORDER BY id",
+        (state["last_id"],),
+    )
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            rows = protect_pii(table, columns, rows, pii)
+            if part is None:
+                name = f"{table}.part-{len(state['parts']):05d}{FORMAT_EXTENSIONS[fmt]}"
+                part_path = os.path.join(out_dir, name)
+                part = writer_cls(part_path + ".tmp", columns)
+                part_count = 0
+            part.write(rows)
+            part_count += len(rows)
+            state["last_id"] = rows[-1][0]
+            if part_count >= part_rows:
+                _finish_part(out_dir, state, part, part_path, part_count)
+                part = None
+    except BaseException:
+        # Drop the unfinished part; a re-run starts again after the last finished one.
+        if part is not None:
+            part.close()
+            os.remove(part_path + ".tmp")
+        # The rest of the result is still unread, so cursor.close() would raise
+        # "Unread result found" over this error. Closing the connection
+        # discards it without reading it.
+        db.close()
+        raise
+    cursor.close()
+    if part is not None:
+        _finish_part(out_dir, state, part, part_path, part_count)
+
+    state["done"] = True
+    save_state(out_dir, state)
+    elapsed = time.monotonic() - start
+    exported = state["rows"] - resumed_rows
+    logging.info("%s: %d rows in %.1fs (%.0f rows/s)", table, exported, elapsed, exported / elapsed if elapsed else 0)
+    return state
+
+
+def _finish_part(out_dir, state, part, part_path, count):
+    part.close()
+    os.replace(part_path + ".tmp", part_path)
+    state["parts"].append({
+        "file": os.path.basename(part_path),
+        "rows": count,
+        "size": os.path.getsize(part_path),
+        "sha256": file_sha256(part_path),
+        "last_id": state["last_id"],
+    })
+    state["rows"] += count
+    # The checkpoint only ever points past rows that are in a finished part.
+    save_state(out_dir, state)
+
+
+def _export_worker(db_config, table, out_dir, fmt, pii, batch_size, part_rows):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    db = connect_db(db_config)
+    try:
+        return export_table(db, table, out_dir, fmt, pii, batch_size, part_rows)
+    finally:
+        db.close()
+
+
+# ============================================================
+# Parallel export
+# ============================================================
+def run_export(db_config, tables, out_dir, fmt="ndjson", pii="mask", workers=EXPORT_WORKERS,
+               batch_size=EXPORT_BATCH_SIZE, part_rows=EXPORT_PART_ROWS):
+    unknown = [t for t in tables if t not in EXPORT_TABLES]
+    if unknown:
+        raise ExportError(f"unknown table(s): {', '.join(unknown)}")
+    if fmt not in PART_WRITERS:
+        raise ExportError(f"unknown format '{fmt}'")
+    os.makedirs(out_dir, exist_ok=True)
+    # Leftovers from an interrupted run; their rows are exported again.
+    for name in os.listdir(out_dir):
+        if name.endswith(".tmp"):
+            os.remove(os.path.join(out_dir, name))
+
+    workers = workers or min(len(tables), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_export_worker, db_config, table, out_dir, fmt, pii, batch_size, part_rows)
+            for table in tables
+        ]
+        states = [future.result() for future in futures]
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "created_at": datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ"),
+        "format": fmt,
+        "pii": pii,
+        "tables": {
+            state["table"]: {"columns": list(EXPORT_TABLES[state["table"]]), "rows": state["rows"], "parts": state["parts"]}
+            for state in states
+        },
+    }
+    tmp_path = os.path.join(out_dir, MANIFEST_NAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST_NAME))
+    return manifest
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Export tables to compressed NDJSON or Parquet.")
+    parser.add_argument("--tables", nargs="+", choices=sorted(EXPORT_TABLES), default=list(EXPORT_TABLES))
+    parser.add_argument("--format", choices=sorted(PART_WRITERS), default="ndjson")
+    parser.add_argument("--pii", choices=("mask", "decrypt"), default="mask",
+                        help="mask PII like API responses (default) or write it decrypted")
+    parser.add_argument("--name", help="export directory under exports/; reuse it to resume (default: UTC timestamp)")
+    parser.add_argument("--out-dir", help="explicit output directory (overrides --name)")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    parser.add_argument("--part-rows", type=int, default=EXPORT_PART_ROWS, help="rows per output file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    out_dir = args.out_dir or os.path.join(
+        EXPORT_DIR, args.name or datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    )
+    start = time.monotonic()
+    try:
+        manifest = run_export(db_config_from_env(), args.tables, out_dir, args.format, args.pii,
+                              args.workers, args.batch_size, args.part_rows)
+    except ExportError as err:
+        print(f"ERROR: {err}", file=sys.stderr)
+        return 1
+    elapsed = time.monotonic() - start
+    total = sum(t["rows"] for t in manifest["tables"].values())
+    for table, info in manifest["tables"].items():
+        print(f"  {table}: {info['rows']} rows in {len(info['parts'])} file(s)")
+    print(f"Exported {total} rows to {out_dir} in {elapsed:.1f}s.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,252 @@
+import datetime
+import json
+import os
+import subprocess
+
+from backup_utils import EncryptedWriter, HashingWriter, copy_stream, decrypt_stream, scan_backup
+from schema import ROW_KEYS, TOMBSTONE_TABLE
+
+
+CHAIN_NAME = "chain.json"
+CHAIN_VERSION = 1
+
+# Every table is captured by increments, with `updated_at` (schema.py
+# 0008-0017) as the high-water mark: it moves on INSERT and UPDATE, so edits
+# are captured as well as new rows. created_at alone would miss edits and let
+# a restore bring back old row versions, so there is no fallback to it.
+# Deletes come from the tombstone table that the delete triggers fill
+# (0018-0023) and are replayed before the increment's rows. A table that is
+# not tracked, or lacks the column or trigger, stops the backup.
+TRACKED_TABLES = list(ROW_KEYS)
+# Not replayed: migrations re-create their own bookkeeping, and a schema
+# change needs a fresh base anyway.
+UNTRACKED_TABLES = {"schema_migrations", TOMBSTONE_TABLE}
+CHANGE_COLUMN = "updated_at"
+
+
+class IncrementalBackupError(Exception):
+    pass
+
+
+# ============================================================
+# Chain manifest
+# ============================================================
+def load_chain(backup_dir):
+    path = os.path.join(backup_dir, CHAIN_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        chain = json.load(f)
+    if chain.get("version") != CHAIN_VERSION:
+        raise IncrementalBackupError(f"unsupported chain version {chain.get('version')}")
+    return chain
+
+
+def save_chain(backup_dir, chain):
+    path = os.path.join(backup_dir, CHAIN_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(chain, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _last_entry(chain):
+    return chain["increments"][-1] if chain["increments"] else chain["base"]
+
+
+# ============================================================
+# Change tracking
+# ============================================================
+def change_columns(db, tables):
+    # -> {table: change column}; raises unless every table in the database is
+    # tracked and every tracked table has its column and delete trigger.
+    cursor = db.cursor()
+    try:
+        cursor.execute("SHOW FULL TABLES WHERE Table_type = 'BASE TABLE'")
+        untracked = sorted({row[0] for row in cursor.fetchall()} - set(tables) - UNTRACKED_TABLES)
+        if untracked:
+            raise IncrementalBackupError(
+                f"table(s) {', '.join(untracked)} not covered by incremental backups; "
+                "add them to schema.ROW_KEYS with an updated_at column and delete trigger"
+            )
+        cursor.execute(
+            """
+            SELECT event_object_table FROM information_schema.triggers
+            WHERE trigger_schema = DATABASE() AND event_manipulation = 'DELETE'
+            """
+        )
+        triggered = {row[0] for row in cursor.fetchall()}
+        columns = {}
+        for table in tables:
+            cursor.execute(f"SHOW COLUMNS FROM `{table}`")
+            names = {row[0] for row in cursor.fetchall()}
+            if CHANGE_COLUMN not in names:
+                raise IncrementalBackupError(
+                    f"table {table} has no {CHANGE_COLUMN} column; run `python schema.py` first"
+                )
+            if table not in triggered:
+                raise IncrementalBackupError(
+                    f"table {table} has no delete trigger, so deletes would be lost; run `python schema.py` first"
+                )
+            columns[table] = CHANGE_COLUMN
+    finally:
+        cursor.close()
+    return columns
+
+
+def sql_literal(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    escaped = (
+        str(value).replace("\\", "\\\\").replace("'", "\\'").replace("\0", "\\0")
+        .replace("\n", "\\n").replace("\r", "\\r").replace("\x1a", "\\Z")
+    )
+    return f"'{escaped}'"
+
+
+def delete_statements(db, since, watermark):
+    # DELETEs for the rows removed in (since, watermark], in the order they
+    # were deleted. Foreign key checks stay on, so ON DELETE CASCADE children
+    # (which fire no trigger) go with their parent on replay as they did live.
+    cursor = db.cursor()
+    cursor.execute(
+        f"SELECT table_name, row_key FROM {TOMBSTONE_TABLE} "
+        "WHERE deleted_at > %s AND deleted_at <= %s ORDER BY id",
+        (since, watermark),
+    )
+    statements = []
+    for table, row_key in cursor.fetchall():
+        key = json.loads(row_key) if isinstance(row_key, (str, bytes)) else row_key
+        where = " AND ".join(f"`{column}` = {sql_literal(key[column])}" for column in ROW_KEYS[table])
+        statements.append(f"DELETE FROM `{table}` WHERE {where};\n")
+    cursor.close()
+    return statements
+
+
+def current_watermark(db):
+    # Stop one second short of "now" so rows written during this second are
+    # left for the next increment instead of being skipped by `>`.
+    cursor = db.cursor()
+    cursor.execute("SELECT DATE_FORMAT(NOW() - INTERVAL 1 SECOND, '%Y-%m-%d %H:%i:%s')")
+    (watermark,) = cursor.fetchone()
+    cursor.close()
+    return watermark
+
+
+# ============================================================
+# Backup
+# ============================================================
+def _dump_into(writer, args):
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE)
+    try:
+        copy_stream(proc.stdout, writer)
+    finally:
+        proc.stdout.close()
+        returncode = proc.wait()
+    if returncode != 0:
+        raise IncrementalBackupError(f"mysqldump exited with {returncode}")
+
+
+def _write_encrypted(path, dump_commands, prefix=b""):
+    with open(path + ".tmp", "wb") as f:
+        hashing = HashingWriter(f)
+        with EncryptedWriter(hashing) as writer:
+            writer.write(prefix)
+            for args in dump_commands:
+                _dump_into(writer, args)
+        integrity = {**hashing.finish(), "kid": writer.kid}
+    os.replace(path + ".tmp", path)
+    return integrity
+
+
+def run_incremental_backup(dump_args, db, backup_dir, tables=None):
+    # dump_args(options) -> mysqldump argv with `options` placed before the
+    # database name; the caller owns credentials and binary paths.
+    tables = tables or TRACKED_TABLES
+    # Checked before the base too: a chain started without it could never continue.
+    columns = change_columns(db, tables)
+    os.makedirs(backup_dir, exist_ok=True)
+    chain = load_chain(backup_dir)
+    watermark = current_watermark(db)
+    stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+
+    if chain is None:
+        # One snapshot, taken after the watermark was read: every row the
+        # watermark covers is in it (later ones are replayed again, harmlessly).
+        name = f"base-{stamp}.sql.enc"
+        integrity = _write_encrypted(os.path.join(backup_dir, name), [dump_args(["--single-transaction"])])
+        chain = {
+            "version": CHAIN_VERSION,
+            "base": {"file": name, "created_at": stamp, "watermark": watermark, **integrity},
+            "increments": [],
+        }
+        save_chain(backup_dir, chain)
+        return chain["base"]
+
+    previous = _last_entry(chain)
+    commands = [
+        dump_args(
+            [
+                "--single-transaction",
+                "--no-create-info",
+                "--replace",
+                "--skip-triggers",
+                f"--where={columns[table]} > '{previous['watermark']}' AND {columns[table]} <= '{watermark}'",
+            ]
+        ) + [table]
+        for table in tables
+    ]
+
+    name = f"incr-{len(chain['increments']) + 1:05d}-{stamp}.sql.enc"
+    deletes = delete_statements(db, previous["watermark"], watermark)
+    prefix = ("SET NAMES utf8mb4;\n" + "".join(deletes)).encode() if deletes else b""
+    integrity = _write_encrypted(os.path.join(backup_dir, name), commands, prefix=prefix)
+    entry = {
+        "file": name,
+        "created_at": stamp,
+        "since": previous["watermark"],
+        "watermark": watermark,
+        "previous_sha256": previous["sha256"],
+        "tables": columns,
+        "deletes": len(deletes),
+        **integrity,
+    }
+    chain["increments"].append(entry)
+    save_chain(backup_dir, chain)
+    return entry
+
+
+# ============================================================
+# Restore (base, then every increment in order)
+# ============================================================
+def verify_chain(backup_dir, chain):
+    previous = None
+    for entry in [chain["base"]] + chain["increments"]:
+        if previous is not None and entry["previous_sha256"] != previous["sha256"]:
+            raise IncrementalBackupError(f"{entry['file']} is not linked to {previous['file']}")
+        scanned = scan_backup(os.path.join(backup_dir, entry["file"]), entry["chunk_size"])
+        if scanned["sha256"] != entry["sha256"]:
+            raise IncrementalBackupError(f"{entry['file']} failed integrity check")
+        previous = entry
+
+
+def run_incremental_restore(restore_args, backup_dir):
+    chain = load_chain(backup_dir)
+    if chain is None:
+        raise IncrementalBackupError("no incremental backup chain found")
+    verify_chain(backup_dir, chain)
+
+    restored = []
+    for entry in [chain["base"]] + chain["increments"]:
+        proc = subprocess.Popen(restore_args, stdin=subprocess.PIPE)
+        try:
+            with open(os.path.join(backup_dir, entry["file"]), "rb") as f:
+                decrypt_stream(f, proc.stdin)
+        finally:
+            proc.stdin.close()
+            returncode = proc.wait()
+        if returncode != 0:
+            raise IncrementalBackupError(f"mysql failed while replaying {entry['file']} (exit {returncode})")
+        restored.append(entry["file"])
+    return restored
@@ -0,0 +1,124 @@
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Keys by key id ("kid"). For RSA key pairs:
+#   rsa_keys/public.pem, rsa_keys/private.pem          kid "default" (original layout)
+#   rsa_keys/<kid>/public.pem, rsa_keys/<kid>/private.pem
+# New backups are wrapped with the current kid: $RSA_KEY_ID, else the contents
+# of rsa_keys/CURRENT, else "default". Older kids stay loadable for restores.
+# encryption_utils keeps its AES keys the same way under aes_keys/.
+DEFAULT_KEY_ID = "default"
+CURRENT_FILE = "CURRENT"
+
+_KID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$")
+
+
+class KeyNotFound(Exception):
+    pass
+
+
+class KeyManager:
+    # Parses each key file once and keeps the object. A lookup re-stats the
+    # file at most every `check_interval` seconds and reparses only when its
+    # mtime or size changed, so rotated keys are picked up without a restart.
+    def __init__(self, keys_dir: str, env_var: str = "RSA_KEY_ID", check_interval: float = 1.0):
+        self.keys_dir = keys_dir
+        self.env_var = env_var
+        self.check_interval = check_interval
+        # path -> (stamp, parsed value, monotonic time of the last stat)
+        self._cache: Dict[str, Tuple[Tuple[int, int], object, float]] = {}
+        self._lock = threading.Lock()
+        self._current = DEFAULT_KEY_ID
+        self._current_checked = float("-inf")
+        self.loads = 0
+        self.hits = 0
+
+    def load_file(self, path: str, parse: Callable[[bytes], object]):
+        now = time.monotonic()
+        cached = self._cache.get(path)
+        if cached is not None and now - cached[2] < self.check_interval:
+            self.hits += 1
+            return cached[1]
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            raise KeyNotFound(f"key file not found: {path}") from None
+        stamp = (st.st_mtime_ns, st.st_size)
+        if cached is not None and cached[0] == stamp:
+            self._cache[path] = (stamp, cached[1], now)
+            self.hits += 1
+            return cached[1]
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None and cached[0] == stamp:
+                return cached[1]
+            with open(path, "rb") as f:
+                value = parse(f.read())
+            self._cache[path] = (stamp, value, now)
+            self.loads += 1
+            return value
+
+    def key_dir(self, kid: str) -> str:
+        # kids arrive from backup headers; never let one escape keys_dir.
+        if kid == DEFAULT_KEY_ID:
+            return self.keys_dir
+        if not _KID_PATTERN.match(kid):
+            raise KeyNotFound(f"invalid key id {kid!r}")
+        return os.path.join(self.keys_dir, kid)
+
+    def current_kid(self) -> str:
+        kid = os.getenv(self.env_var)
+        if kid:
+            return kid
+        now = time.monotonic()
+        if now - self._current_checked < self.check_interval:
+            return self._current
+        try:
+            kid = self.load_file(os.path.join(self.keys_dir, CURRENT_FILE), lambda data: data.decode().strip())
+        except KeyNotFound:
+            kid = None
+        self._current, self._current_checked = kid or DEFAULT_KEY_ID, now
+        return self._current
+
+    def public_key(self, kid: Optional[str] = None):
+        from cryptography.hazmat.primitives import serialization
+
+        path = os.path.join(self.key_dir(kid or self.current_kid()), "public.pem")
+        return self.load_file(path, serialization.load_pem_public_key)
+
+    def private_key(self, kid: Optional[str] = None):
+        from cryptography.hazmat.primitives import serialization
+
+        path = os.path.join(self.key_dir(kid or self.current_kid()), "private.pem")
+        return self.load_file(path, lambda data: serialization.load_pem_private_key(data, password=None))
+
+    def key_ids(self, filename: str = "public.pem") -> List[str]:
+        kids = []
+        if os.path.exists(os.path.join(self.keys_dir, filename)):
+            kids.append(DEFAULT_KEY_ID)
+        if os.path.isdir(self.keys_dir):
+            for name in sorted(os.listdir(self.keys_dir)):
+                if _KID_PATTERN.match(name) and os.path.exists(os.path.join(self.keys_dir, name, filename)):
+                    kids.append(name)
+        return kids
+
+    def set_current(self, kid: str) -> None:
+        self.key_dir(kid)  # validates
+        os.makedirs(self.keys_dir, exist_ok=True)
+        path = os.path.join(self.keys_dir, CURRENT_FILE)
+        with open(path + ".tmp", "w") as f:
+            f.write(kid + "\n")
+        os.replace(path + ".tmp", path)
+        with self._lock:
+            self._cache.pop(path, None)
+        self._current_checked = float("-inf")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"cached": len(self._cache), "loads": self.loads, "hits": self.hits}
@@ -0,0 +1,197 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from encryption_utils import (
+    AES_KEYS,
+    aes_decrypt_many,
+    aes_encrypt_many,
+    aes_key_path,
+    ciphertext_kid,
+    create_aes_key,
+)
+
+# Re-encrypts users.email / users.full_name under a new AES key id while the
+# API keeps running (reads decrypt either version by the ciphertext prefix):
+#   python key_rotation.py new-key k2     create aes_keys/k2/aes.key, make it current
+#   python key_rotation.py run            rewrite rows still on an older key
+#   python key_rotation.py status         row counts per key id
+# `run` walks users in id order, commits each batch and records a checkpoint,
+# so it can be stopped at any point and resumed by running it again.
+
+ROTATION_BATCH_SIZE = 500
+CHECKPOINT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "key_rotation.checkpoint.json")
+
+
+def load_checkpoint(path, kid):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        state = json.load(f)
+    # A checkpoint for another target key is stale; start over.
+    return state if state.get("kid") == kid and not state.get("done") else None
+
+
+def save_checkpoint(path, state):
+    if not path:
+        return
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def reencrypt_rows(rows, kid, workers=0):
+    # rows: [(id, email, full_name)] -> ([(new_email, new_name, id, old_email, old_name)], failed ids)
+    emails = aes_decrypt_many([r[1] for r in rows], workers=workers, strict=False)
+    names = aes_decrypt_many([r[2] for r in rows], workers=workers, strict=False)
+    params, failed = [], []
+    keep = []
+    for row, email, name in zip(rows, emails, names):
+        # strict=False turned undecryptable values into None; leave those rows alone.
+        if (row[1] and email is None) or (row[2] and name is None):
+            failed.append(row[0])
+        else:
+            keep.append((row, email, name))
+    new_emails = aes_encrypt_many([email for _, email, _ in keep], workers=workers, kid=kid)
+    new_names = aes_encrypt_many([name for _, _, name in keep], workers=workers, kid=kid)
+    for (row, _, _), new_email, new_name in zip(keep, new_emails, new_names):
+        params.append((new_email, new_name, row[0], row[1], row[2]))
+    return params, failed
+
+
+def rotate_users(db, kid=None, batch_size=ROTATION_BATCH_SIZE, workers=0, max_rows_per_sec=0,
+                 checkpoint_path=CHECKPOINT_FILE, progress=None):
+    kid = kid or AES_KEYS.current_kid()
+    if not os.path.exists(aes_key_path(kid)):
+        raise FileNotFoundError(f"no AES key for key id {kid}")
+
+    state = load_checkpoint(checkpoint_path, kid) or {
+        "kid": kid, "last_id": "", "scanned": 0, "rotated": 0, "conflicts": 0, "failed": 0, "done": False,
+    }
+    cursor = db.cursor()
+    cursor.execute("SELECT COUNT(*) FROM users WHERE id > %s", (state["last_id"],))
+    remaining = cursor.fetchone()[0]
+    total = state["scanned"] + remaining
+    start = time.monotonic()
+    scanned_at_start = state["scanned"]
+
+    while True:
+        batch_start = time.monotonic()
+        cursor.execute(
+            "SELECT id, email, full_name FROM users WHERE id > %s ORDER BY id LIMIT %s",
+            (state["last_id"], batch_size),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+
+        stale = [row for row in rows if any(v and ciphertext_kid(v) != kid for v in row[1:])]
+        if stale:
+            params, failed = reencrypt_rows(stale, kid, workers)
+            if params:
+                # Only overwrite values nobody changed since we read them; a row the
+                # API rewrote meanwhile is already on the current key.
+                cursor.executemany(
+                    "UPDATE users SET email = %s, full_name = %s WHERE id = %s AND email <=> %s AND full_name <=> %s",
+                    params,
+                )
+                updated = max(cursor.rowcount, 0)
+                state["rotated"] += updated
+                state["conflicts"] += len(params) - updated
+            state["failed"] += len(failed)
+            for user_id in failed:
+                logging.warning("Could not decrypt user %s; left unchanged", user_id)
+        db.commit()
+
+        state["last_id"] = rows[-1][0]
+        state["scanned"] += len(rows)
+        save_checkpoint(checkpoint_path, state)
+        if progress:
+            elapsed = time.monotonic() - start
+            rate = (state["scanned"] - scanned_at_start) / elapsed if elapsed else 0.0
+            progress(state, total, rate)
+
+        if max_rows_per_sec:
+            # Throttle to keep replication lag and lock time on the primary low.
+            pause = len(rows) / max_rows_per_sec - (time.monotonic() - batch_start)
+            if pause > 0:
+                time.sleep(pause)
+
+    cursor.close()
+    state["done"] = True
+    save_checkpoint(checkpoint_path, state)
+    return state
+
+
+def key_status(db):
+    cursor = db.cursor()
+    cursor.execute(
+        """
+        SELECT IF(LOCATE(':', email) > 0, SUBSTRING_INDEX(email, ':', 1), 'default') AS kid, COUNT(*)
+        FROM users
+        GROUP BY kid
+        ORDER BY kid
+        """
+    )
+    counts = dict(cursor.fetchall())
+    cursor.close()
+    return counts
+
+
+def log_progress(state, total, rate):
+    left = max(total - state["scanned"], 0)
+    eta = f"{left / rate:.0f}s" if rate else "?"
+    logging.info(
+        "%d/%d rows scanned (%.0f rows/s, ETA %s): %d rotated, %d changed concurrently, %d undecryptable",
+        state["scanned"], total, rate, eta, state["rotated"], state["conflicts"], state["failed"],
+    )
+
+
+def main(argv):
+    import mysql.connector
+
+    parser = argparse.ArgumentParser(description="Rotate the AES key used for user PII.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    new_key = sub.add_parser("new-key", help="create an AES key and make it current for new writes")
+    new_key.add_argument("kid")
+    run = sub.add_parser("run", help="re-encrypt rows that are not on the target key")
+    run.add_argument("--kid", help="target key id (default: current)")
+    run.add_argument("--batch-size", type=int, default=ROTATION_BATCH_SIZE)
+    run.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="threads for decrypt/encrypt")
+    run.add_argument("--max-rows-per-sec", type=float, default=0, help="0 = unthrottled")
+    run.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    sub.add_parser("status", help="count users per key id")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    if args.command == "new-key":
+        print(f"Created {create_aes_key(args.kid)}")
+        AES_KEYS.set_current(args.kid)
+        print(f"New values are now encrypted with key id {args.kid}. Run `python key_rotation.py run` next.")
+        return 0
+
+    db = mysql.connector.connect(
+        host=os.getenv("DB_HOST", "localhost"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        database=os.getenv("DB_NAME"),
+    )
+    try:
+        if args.command == "status":
+            print(f"current key id: {AES_KEYS.current_kid()}")
+            for kid, count in key_status(db).items():
+                print(f"{kid:<20} {count}")
+            return 0
+        state = rotate_users(db, args.kid, args.batch_size, args.workers, args.max_rows_per_sec,
+                             args.checkpoint, log_progress)
+    finally:
+        db.close()
+    print(f"Done: {state['rotated']} rows rotated to {state['kid']}, {state['failed']} undecryptable.")
+    return 1 if state["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
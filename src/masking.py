@@ -0,0 +1,19 @@
+from typing import Optional
+
+# Masking policy for PII shown outside the database: API responses, logs and
+# masked exports. Values must already be decrypted.
+
+
+def mask_email(email: Optional[str]) -> str:
+    if not email or "@" not in email:
+        return "***"
+    local, domain = email.split("@", 1)
+    return f"{local[:1]}***@{domain}"
+
+
+def mask_name(name: Optional[str]) -> str:
+    if not name:
+        return "***"
+    parts = name.split()
+    masked_parts = [p[0] + "***" if p else "***" for p in parts]
+    return " ".join(masked_parts)
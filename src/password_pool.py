@@ -0,0 +1,172 @@
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Dict, List, Optional
+
+from encryption_utils import hash_password, verify_password
+from metrics import phase
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class PasswordWorkerPool:
+    # Runs bcrypt off the request thread with a hard cap on concurrent work.
+    # `max_queue` extra callers may wait for a worker; anyone beyond that is
+    # rejected immediately with PoolSaturated instead of piling up. A caller
+    # whose job outlives `timeout` also gets PoolSaturated (429).
+    # Batches (hash_many) run on a separate, smaller executor, `max_batches` at a
+    # time, so a bulk import can neither use every core nor queue ahead of logins.
+    def __init__(self, workers: int = 4, max_queue: int = 16, kind: str = "thread", timeout: float = 30.0,
+                 batch_workers: Optional[int] = None, max_batches: int = 1):
+        if kind not in ("process", "thread"):
+            raise ValueError(f"unknown pool kind '{kind}'")
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.batch_workers = batch_workers or max(1, workers // 2)
+        self.max_batches = max_batches
+        self.reset()
+
+    def reset(self) -> None:
+        # Fresh executor and counters; used after fork, where the parent's
+        # worker threads/processes do not exist.
+        if self.kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            self._batch_executor = ProcessPoolExecutor(max_workers=self.batch_workers)
+        else:
+            # bcrypt releases the GIL while hashing, so threads scale across cores.
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            self._batch_executor = ThreadPoolExecutor(max_workers=self.batch_workers, thread_name_prefix="bcrypt-batch")
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        self._batch_slots = threading.BoundedSemaphore(self.max_batches)
+        self.batches_in_flight = 0
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _acquire(self) -> None:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolSaturated("password hashing queue is full")
+        with self._lock:
+            self.in_flight += 1
+
+    def _release(self, _future=None) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def _submit(self, fn, *args) -> Future:
+        # The slot is released when the job itself finishes (or is cancelled),
+        # not when the caller stops waiting, so the cap holds after a timeout.
+        self._acquire()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _timed_out(self, future: Future) -> PoolSaturated:
+        future.cancel()  # drops it if still queued; a running hash finishes on its own
+        with self._lock:
+            self.timed_out += 1
+        return PoolSaturated(f"password hashing took longer than {self.timeout:g}s")
+
+    def _run(self, fn, *args):
+        # Timed from the caller's side: queueing for a worker plus the hash itself.
+        with phase("bcrypt"):
+            future = self._submit(fn, *args)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeout:
+                raise self._timed_out(future) from None
+
+    async def _run_async(self, fn, *args):
+        import asyncio  # only the ASGI app needs it
+
+        with phase("bcrypt"):
+            future = self._submit(fn, *args)
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+            except asyncio.TimeoutError:
+                raise self._timed_out(future) from None
+
+    def hash(self, password: str, rounds: Optional[int] = None) -> str:
+        return self._run(hash_password, password, rounds)
+
+    def verify(self, password: str, hashed: str) -> bool:
+        return self._run(verify_password, password, hashed)
+
+    def hash_many(self, passwords: List[str], rounds: Optional[int] = None) -> List[str]:
+        if not passwords:
+            return []
+        if not self._batch_slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolSaturated("too many password batches in progress")
+        with self._lock:
+            self.batches_in_flight += 1
+        pending = [len(passwords)]
+
+        def job_done(_future):
+            # The batch slot is held until its last job has finished or been cancelled.
+            with self._lock:
+                pending[0] -= 1
+                finished = pending[0] == 0
+                if finished:
+                    self.batches_in_flight -= 1
+            if finished:
+                self._batch_slots.release()
+
+        futures = []
+        try:
+            for password in passwords:
+                future = self._batch_executor.submit(hash_password, password, rounds)
+                future.add_done_callback(job_done)
+                futures.append(future)
+        finally:
+            for _ in range(len(passwords) - len(futures)):
+                job_done(None)
+
+        timeout = self.timeout * max(1.0, len(passwords) / self.batch_workers)
+        with phase("bcrypt"):
+            done, not_done = wait(futures, timeout=timeout)
+        if not_done:
+            for future in not_done:
+                future.cancel()
+            with self._lock:
+                self.timed_out += 1
+            raise PoolSaturated(f"password batch took longer than {timeout:g}s")
+        return [future.result() for future in futures]
+
+    async def hash_async(self, password: str, rounds: Optional[int] = None) -> str:
+        return await self._run_async(hash_password, password, rounds)
+
+    async def verify_async(self, password: str, hashed: str) -> bool:
+        return await self._run_async(verify_password, password, hashed)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+        self._batch_executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "batch_workers": self.batch_workers,
+                "batches_in_flight": self.batches_in_flight,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
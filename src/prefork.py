@@ -0,0 +1,266 @@
+import argparse
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Preforking server for api.py (POSIX only):
+#   python prefork.py --workers 4 --bind 0.0.0.0:5000
+# The master imports the app, warms imports and keys (api.warm_up) and binds the
+# listening socket once; forked workers inherit all of that. Each worker then
+# opens its own DB pool and bcrypt executor (api.init_worker) and accepts on the
+# shared socket. A shared_state server process, also forked by the master, holds
+# the response cache, token revocations and rate-limit buckets for all workers.
+#
+# Signals to the master:
+#   SIGTERM / SIGINT  stop: workers finish in-flight requests (up to
+#                     PREFORK_GRACEFUL_TIMEOUT seconds), then everything exits
+#   SIGHUP            reload: the new code is first loaded in a throwaway
+#                     child (`prefork.py --check`); if that works, the master
+#                     re-executes itself on the same socket, so new code and
+#                     settings load; new workers start before the old ones
+#                     drain. If it fails, the old code keeps serving. The
+#                     shared state server (and its caches) carries over.
+# A worker that dies is replaced.
+
+PREFORK_WORKERS = int(os.getenv("PREFORK_WORKERS", str(os.cpu_count() or 2)))
+PREFORK_BIND = os.getenv("PREFORK_BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+PREFORK_BACKLOG = int(os.getenv("PREFORK_BACKLOG", "128"))
+PREFORK_GRACEFUL_TIMEOUT = float(os.getenv("PREFORK_GRACEFUL_TIMEOUT", "30"))
+PREFORK_RELOAD_CHECK_TIMEOUT = float(os.getenv("PREFORK_RELOAD_CHECK_TIMEOUT", "60"))
+# A worker that exits sooner than this after starting is respawned with a delay.
+MIN_WORKER_UPTIME = 1.0
+
+# Handed from a master to its re-executed successor on SIGHUP.
+_ENV_FD = "PREFORK_FD"
+_ENV_OLD_WORKERS = "PREFORK_OLD_WORKERS"
+_ENV_STATE = "PREFORK_STATE"  # "<pid>:<authkey hex>:<socket path>"
+
+
+def parse_bind(bind):
+    host, _, port = bind.rpartition(":")
+    return host or "0.0.0.0", int(port)
+
+
+def open_listener(host, port, backlog=PREFORK_BACKLOG):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def worker_main(app_module, sock, shared_state=None):
+    from werkzeug.serving import make_server
+
+    # The master handles Ctrl-C / SIGHUP and tells workers to stop with SIGTERM.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    app_module.init_worker(*(shared_state or ()))
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, app_module.app, threaded=True, fd=sock.fileno())
+    # Track request threads so server_close() can wait for them.
+    server.daemon_threads = False
+    # shutdown() waits for serve_forever() to return, so it cannot run on this thread.
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+    logging.info("Worker %d serving on %s:%d", os.getpid(), host, port)
+    try:
+        server.serve_forever()
+
+        # Stopped accepting; let in-flight requests finish. Idle keep-alive
+        # connections would hold this forever, hence the timeout.
+        closer = threading.Thread(target=server.server_close, daemon=True)
+        closer.start()
+        closer.join(PREFORK_GRACEFUL_TIMEOUT)
+        if closer.is_alive():
+            logging.warning("Worker %d: requests still open after %.0fs, exiting", os.getpid(), PREFORK_GRACEFUL_TIMEOUT)
+    finally:
+        # Workers leave through os._exit(), so atexit hooks never run.
+        app_module.shutdown_worker()
+
+
+class Master:
+    def __init__(self, app_module, sock, workers, shared_state=True):
+        self.app_module = app_module
+        self.sock = sock
+        self.workers = workers
+        self.children = {}  # pid -> start time
+        self.retiring = set()  # previous generation's workers, draining after a reload
+        self.stopping = False
+        self.reloading = False
+        self.use_shared_state = shared_state
+        self.state_pid = None
+        self.state_address = None
+        self.state_authkey = None
+
+    # ------------------------------
+    # Shared state server
+    # ------------------------------
+    def start_shared_state(self):
+        import shared_state
+
+        inherited = os.environ.pop(_ENV_STATE, None)
+        if inherited:
+            pid, key, address = inherited.split(":", 2)
+            self.state_pid, self.state_authkey, self.state_address = int(pid), bytes.fromhex(key), address
+            return
+        # Kept across restarts of the server: workers already hold both.
+        self.state_address = self.state_address or shared_state.SHARED_STATE_SOCKET or os.path.join(
+            tempfile.gettempdir(), f"api-state-{os.getpid()}.sock"
+        )
+        self.state_authkey = self.state_authkey or shared_state.SHARED_STATE_AUTHKEY.encode() or os.urandom(32)
+        self.state_pid = shared_state.start_server(
+            self.state_address, self.state_authkey, self.app_module.shared_state_objects()
+        )
+        logging.info("Shared state server %d on %s", self.state_pid, self.state_address)
+
+    # ------------------------------
+    # Workers
+    # ------------------------------
+    def spawn(self):
+        shared = (self.state_address, self.state_authkey) if self.state_address else None
+        pid = os.fork()
+        if pid == 0:
+            # Drop the master's handlers before anything else can deliver a signal here.
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            code = 0
+            try:
+                worker_main(self.app_module, self.sock, shared)
+            except BaseException:
+                logging.exception("Worker %d crashed", os.getpid())
+                code = 1
+            finally:
+                # Never fall back into the master's loop.
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+        return pid
+
+    def _signal(self, pids, signum=signal.SIGTERM):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+        self._signal(list(self.children) + list(self.retiring))
+
+    def check_reload(self, argv):
+        # execve replaces the master in place: new code that fails to import
+        # would take the master, and with it every worker, down. So it is
+        # loaded in a child first; returns why that failed, or None.
+        try:
+            result = subprocess.run(argv + ["--check"], timeout=PREFORK_RELOAD_CHECK_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired) as err:
+            return str(err)
+        return f"exit status {result.returncode}" if result.returncode != 0 else None
+
+    def reload(self, signum=None, frame=None):
+        if self.stopping or self.reloading:
+            return
+        argv = [sys.executable, os.path.abspath(__file__)] + sys.argv[1:]
+        self.reloading = True
+        try:
+            failed = self.check_reload(argv)
+        finally:
+            self.reloading = False
+        if failed:
+            logging.error("Reload aborted, the new code did not load (%s); still serving the old code", failed)
+            return
+        if self.stopping:  # SIGTERM arrived during the check
+            return
+        logging.info("Reloading: re-executing master %d", os.getpid())
+        env = dict(os.environ)
+        env[_ENV_FD] = str(self.sock.fileno())
+        env[_ENV_OLD_WORKERS] = ",".join(str(pid) for pid in list(self.children) + list(self.retiring))
+        if self.state_pid:
+            env[_ENV_STATE] = f"{self.state_pid}:{self.state_authkey.hex()}:{self.state_address}"
+        # Same pid afterwards, so the running workers stay our children.
+        os.execve(sys.executable, argv, env)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, self.reload)
+        if self.use_shared_state:
+            self.start_shared_state()
+        for _ in range(self.workers):
+            self.spawn()
+        logging.info("Master %d started %d workers", os.getpid(), self.workers)
+
+        old = os.environ.pop(_ENV_OLD_WORKERS, "")
+        if old:
+            # New workers are up; the previous generation drains and exits.
+            self.retiring = {int(pid) for pid in old.split(",")}
+            self._signal(self.retiring)
+
+        while self.children or self.retiring:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                continue
+            if pid == self.state_pid:
+                if not self.stopping:
+                    logging.error("Shared state server exited (status %d); restarting it empty", status)
+                    self.state_pid = None
+                    os.environ.pop(_ENV_STATE, None)
+                    self.start_shared_state()
+                continue
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            logging.warning("Worker %d exited (status %d); restarting", pid, status)
+            if time.monotonic() - started < MIN_WORKER_UPTIME:
+                time.sleep(MIN_WORKER_UPTIME)
+            self.spawn()
+
+        if self.state_pid:
+            self._signal([self.state_pid])
+            try:
+                os.waitpid(self.state_pid, 0)
+            except ChildProcessError:
+                pass
+            if os.path.exists(self.state_address):
+                os.unlink(self.state_address)
+        logging.info("All workers stopped")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Run api.py with preforked workers.")
+    parser.add_argument("--workers", type=int, default=PREFORK_WORKERS)
+    parser.add_argument("--bind", default=PREFORK_BIND, help="host:port (default %(default)s)")
+    parser.add_argument("--no-shared-state", action="store_true",
+                        help="keep caches and rate limits per worker instead of shared")
+    parser.add_argument("--check", action="store_true",
+                        help="load and warm the app, then exit (run by the master before a reload)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    import api
+
+    api.warm_up()
+    if args.check:
+        return 0
+    inherited_fd = os.environ.pop(_ENV_FD, None)
+    if inherited_fd:
+        sock = socket.socket(fileno=int(inherited_fd))
+        sock.set_inheritable(True)
+    else:
+        sock = open_listener(*parse_bind(args.bind))
+    logging.info("Loaded and warmed app in %.0f ms", (time.perf_counter() - start) * 1000)
+    Master(api, sock, args.workers, shared_state=not args.no_shared_state).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
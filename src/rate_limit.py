@@ -0,0 +1,121 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+_PERIODS = {"s": 1, "second": 1, "m": 60, "minute": 60, "h": 3600, "hour": 3600, "d": 86400, "day": 86400}
+_LIMIT_PATTERN = re.compile(r"^\s*(\d+)\s*/\s*(\d*)\s*([a-z]+)\s*(?:burst\s*(\d+))?\s*$")
+
+
+class RateLimited(Exception):
+    def __init__(self, rule: str, retry_after: float):
+        super().__init__(f"rate limit '{rule}' exceeded; retry in {retry_after:.1f}s")
+        self.rule = rule
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Limit(NamedTuple):
+    rate: float  # tokens per second
+    burst: float  # bucket size
+
+
+def parse_limit(spec: Optional[str]) -> Optional[Limit]:
+    # "20/minute", "5/15m", "100/second burst 200"; "", "0" or "off" disables.
+    if not spec or spec.strip().lower() in ("0", "off", "none"):
+        return None
+    match = _LIMIT_PATTERN.match(spec.lower())
+    if not match or match.group(3) not in _PERIODS:
+        raise ValueError(f"invalid rate limit {spec!r} (expected e.g. '20/minute')")
+    count, multiple, unit, burst = match.groups()
+    period = int(multiple or 1) * _PERIODS[unit]
+    return Limit(int(count) / period, float(burst or count))
+
+
+class TokenBuckets:
+    # Token bucket per key: `burst` tokens at most, refilled at `rate` per second.
+    # Keys are kept LRU up to max_keys; dropping an idle key only forgets a bucket
+    # that would have refilled anyway. Under prefork one instance lives in the
+    # shared_state server so every worker draws from the same buckets.
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        # -> (allowed, seconds until `cost` tokens will be available)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                self.allowed += 1
+                allowed, retry_after = True, 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                self.limited += 1
+                allowed, retry_after = False, (cost - tokens) / rate if rate > 0 else float("inf")
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"keys": len(self._buckets), "allowed": self.allowed, "limited": self.limited}
+
+
+class AdmissionController:
+    # Caps requests in progress in this process. A request over the cap waits
+    # up to `max_wait` seconds for a slot and is then shed (Overloaded), so
+    # excess load is turned away cheaply instead of queueing on the DB pool
+    # until every request times out. max_in_flight <= 0 disables it.
+    def __init__(self, max_in_flight: int, max_wait: float = 0.0):
+        self.max_in_flight = max_in_flight
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight > 0 else None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+
+    def acquire(self) -> None:
+        if self._slots is None:
+            return
+        if self.max_wait > 0:
+            acquired = self._slots.acquire(timeout=self.max_wait)
+        else:
+            acquired = self._slots.acquire(blocking=False)
+        if not acquired:
+            with self._lock:
+                self.shed += 1
+            raise Overloaded(f"more than {self.max_in_flight} requests in progress")
+        with self._lock:
+            self.in_flight += 1
+            self.admitted += 1
+
+    def release(self) -> None:
+        if self._slots is None:
+            return
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self.in_flight,
+                "admitted": self.admitted,
+                "shed": self.shed,
+            }
@@ -0,0 +1,96 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    expires_at: float
+    tags: Tuple[str, ...]
+
+
+class ResponseCache:
+    # Serialized GET payloads keyed by path + query string. Entries are tagged
+    # with the tables they were read from so writes can drop exactly those.
+    # Each tag carries a generation counter; a response computed before a write
+    # to one of its tables is never stored after that write.
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 30.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def generation(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def put(self, key: str, body: bytes, tags: Tuple[str, ...], generation: Tuple[int, ...]) -> CachedResponse:
+        entry = CachedResponse(body, make_etag(body), time.monotonic() + self.ttl, tags)
+        self.store(key, entry, generation)
+        return entry
+
+    def store(self, key: str, entry: CachedResponse, generation: Tuple[int, ...]) -> bool:
+        # put() for an entry built elsewhere (shared_state clients hash bodies themselves).
+        if self.ttl <= 0 or len(entry.body) > self.max_bytes:
+            return False
+        with self._lock:
+            if tuple(self._generations.get(tag, 0) for tag in entry.tags) != generation:
+                return False
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self._bytes += len(entry.body)
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, *tags: str) -> None:
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            stale = [key for key, entry in self._entries.items() if set(entry.tags) & set(tags)]
+            for key in stale:
+                self._drop(key)
+            self.invalidations += len(stale)
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.body)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def make_etag(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()[:32]
@@ -0,0 +1,239 @@
+import logging
+import os
+import sys
+from typing import Callable, List, Sequence, Tuple
+
+# Ordered, append-only list of schema changes. Each migration runs once and is
+# recorded in `schema_migrations`; never edit or reorder an applied entry.
+#   python schema.py            apply pending migrations (uses DB_* env vars)
+#   python schema.py --status   list applied / pending migrations
+
+
+def index_exists(cursor, table: str, name: str, columns: Sequence[str]) -> bool:
+    # True if `name` exists or another index already leads with `columns`.
+    cursor.execute(
+        """
+        SELECT index_name, column_name
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s
+        ORDER BY index_name, seq_in_index
+        """,
+        (table,),
+    )
+    indexes = {}
+    for index_name, column_name in cursor.fetchall():
+        indexes.setdefault(index_name, []).append(column_name)
+    if name in indexes:
+        return True
+    return any(cols[:len(columns)] == list(columns) for cols in indexes.values())
+
+
+def create_index(table: str, name: str, columns: Sequence[str]) -> Callable:
+    def migrate(cursor):
+        if index_exists(cursor, table, name, columns):
+            logging.info("Index on %s(%s) already present, skipping %s", table, ", ".join(columns), name)
+            return
+        cursor.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+
+    return migrate
+
+
+def column_exists(cursor, table: str, column: str) -> bool:
+    cursor.execute(
+        """
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+        """,
+        (table, column),
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def add_column(table: str, column: str, definition: str) -> Callable:
+    def migrate(cursor):
+        if column_exists(cursor, table, column):
+            logging.info("Column %s.%s already present, skipping", table, column)
+            return
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    return migrate
+
+
+def create_fulltext_index(table: str, name: str, columns: Sequence[str]) -> Callable:
+    def migrate(cursor):
+        cursor.execute(
+            """
+            SELECT COUNT(*) FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+            """,
+            (table, name),
+        )
+        if cursor.fetchone()[0]:
+            logging.info("Full-text index %s already present, skipping", name)
+            return
+        # InnoDB rebuilds the table for its first FULLTEXT index; run off-peak on large tables.
+        cursor.execute(f"ALTER TABLE {table} ADD FULLTEXT INDEX {name} ({', '.join(columns)})")
+
+    return migrate
+
+
+def create_table(name: str, columns_sql: str) -> Callable:
+    def migrate(cursor):
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {name} ({columns_sql})")
+
+    return migrate
+
+
+def create_delete_trigger(table: str, key_columns: Sequence[str]) -> Callable:
+    # Records the key of every deleted row in the tombstone table.
+    name = f"trg_{table}_tombstone"
+
+    def migrate(cursor):
+        cursor.execute(
+            """
+            SELECT COUNT(*) FROM information_schema.triggers
+            WHERE trigger_schema = DATABASE() AND trigger_name = %s
+            """,
+            (name,),
+        )
+        if cursor.fetchone()[0]:
+            logging.info("Trigger %s already present, skipping", name)
+            return
+        key = ", ".join(f"'{column}', OLD.{column}" for column in key_columns)
+        cursor.execute(
+            f"CREATE TRIGGER {name} AFTER DELETE ON {table} FOR EACH ROW "
+            f"INSERT INTO {TOMBSTONE_TABLE} (table_name, row_key) VALUES ('{table}', JSON_OBJECT({key}))"
+        )
+
+    return migrate
+
+
+UPDATED_AT = "TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"
+# Every table incremental backups replay (incremental_backup.py), with its
+# primary key; each has an updated_at column and a delete trigger.
+ROW_KEYS = {
+    "users": ("id",),
+    "feature_requests": ("id",),
+    "comments": ("id",),
+    "votes": ("user_id", "feature_request_id"),
+    "audit_log": ("id",),
+}
+TOMBSTONE_TABLE = "row_tombstones"
+
+MIGRATIONS: List[Tuple[str, Callable]] = [
+    # Nested listings page by id within one parent: WHERE parent = ? AND id > ? ORDER BY id
+    ("0001_comments_by_feature_request", create_index("comments", "idx_comments_fr_id", ("feature_request_id", "id"))),
+    ("0002_feature_requests_by_user", create_index("feature_requests", "idx_feature_requests_user_id", ("user_id", "id"))),
+    # HMAC blind index of the email; fill existing rows with `python blind_index.py`
+    ("0003_users_email_blind_index", add_column("users", "email_bidx", "CHAR(64) NULL")),
+    ("0004_users_email_blind_index_idx", create_index("users", "idx_users_email_bidx", ("email_bidx",))),
+    # GET /search (search.py)
+    ("0005_feature_requests_fulltext", create_fulltext_index("feature_requests", "ft_feature_requests_text", ("title", "content"))),
+    ("0006_comments_fulltext", create_fulltext_index("comments", "ft_comments_content", ("content",))),
+    # Written in batches by audit.py when AUDIT_SINK=table; ids and actor are hash_for_log() digests
+    ("0007_audit_log", create_table("audit_log", """
+        id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        at DATETIME(6) NOT NULL,
+        request_id VARCHAR(64) NULL,
+        actor CHAR(10) NULL,
+        role VARCHAR(32) NULL,
+        action VARCHAR(16) NOT NULL,
+        resource VARCHAR(64) NOT NULL,
+        resource_id CHAR(10) NULL,
+        detail JSON NULL,
+        INDEX idx_audit_log_at (at),
+        INDEX idx_audit_log_resource (resource, resource_id)
+    """)),
+    # Change-tracking column for incremental backups (incremental_backup.py); MySQL
+    # maintains it on every UPDATE. Existing rows get the migration time, so the
+    # first increment afterwards carries every row once.
+    ("0008_users_updated_at", add_column("users", "updated_at", UPDATED_AT)),
+    ("0009_feature_requests_updated_at", add_column("feature_requests", "updated_at", UPDATED_AT)),
+    ("0010_comments_updated_at", add_column("comments", "updated_at", UPDATED_AT)),
+    ("0011_users_updated_at_idx", create_index("users", "idx_users_updated_at", ("updated_at",))),
+    ("0012_feature_requests_updated_at_idx",
+     create_index("feature_requests", "idx_feature_requests_updated_at", ("updated_at",))),
+    ("0013_comments_updated_at_idx", create_index("comments", "idx_comments_updated_at", ("updated_at",))),
+    ("0014_votes_updated_at", add_column("votes", "updated_at", UPDATED_AT)),
+    ("0015_audit_log_updated_at", add_column("audit_log", "updated_at", UPDATED_AT)),
+    ("0016_votes_updated_at_idx", create_index("votes", "idx_votes_updated_at", ("updated_at",))),
+    ("0017_audit_log_updated_at_idx", create_index("audit_log", "idx_audit_log_updated_at", ("updated_at",))),
+    # Deletes for incremental backups: a trigger per tracked table records the
+    # deleted row's key, and each increment replays the deletes in its window.
+    # With binary logging on, CREATE TRIGGER needs SUPER or log_bin_trust_function_creators=1.
+    ("0018_row_tombstones", create_table(TOMBSTONE_TABLE, """
+        id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        table_name VARCHAR(64) NOT NULL,
+        row_key JSON NOT NULL,
+        deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_row_tombstones_deleted_at (deleted_at)
+    """)),
+    ("0019_users_tombstone_trigger", create_delete_trigger("users", ROW_KEYS["users"])),
+    ("0020_feature_requests_tombstone_trigger", create_delete_trigger("feature_requests", ROW_KEYS["feature_requests"])),
+    ("0021_comments_tombstone_trigger", create_delete_trigger("comments", ROW_KEYS["comments"])),
+    ("0022_votes_tombstone_trigger", create_delete_trigger("votes", ROW_KEYS["votes"])),
+    ("0023_audit_log_tombstone_trigger", create_delete_trigger("audit_log", ROW_KEYS["audit_log"])),
+]
+
+
+def ensure_migrations_table(cursor) -> None:
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name VARCHAR(255) NOT NULL PRIMARY KEY,
+            applied_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+
+def applied_migrations(cursor) -> List[str]:
+    cursor.execute("SELECT name FROM schema_migrations ORDER BY name")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def apply_migrations(db) -> List[str]:
+    cursor = db.cursor()
+    ensure_migrations_table(cursor)
+    done = set(applied_migrations(cursor))
+    applied = []
+    for name, migrate in MIGRATIONS:
+        if name in done:
+            continue
+        logging.info("Applying migration %s", name)
+        migrate(cursor)
+        cursor.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
+        db.commit()
+        applied.append(name)
+    cursor.close()
+    return applied
+
+
+def main(argv: List[str]) -> int:
+    import mysql.connector
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    db = mysql.connector.connect(
+        host=os.getenv("DB_HOST", "localhost"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        database=os.getenv("DB_NAME"),
+    )
+    try:
+        if "--status" in argv:
+            cursor = db.cursor()
+            ensure_migrations_table(cursor)
+            done = set(applied_migrations(cursor))
+            cursor.close()
+            for name, _ in MIGRATIONS:
+                print(f"{'applied' if name in done else 'pending'}  {name}")
+            return 0
+        applied = apply_migrations(db)
+        print(f"Applied {len(applied)} migration(s).")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
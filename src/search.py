@@ -0,0 +1,113 @@
+import html
+import os
+import re
+from typing import Any, Dict, List, Sequence, Tuple
+
+# Full-text search over feature requests and comments, backed by the InnoDB
+# FULLTEXT indexes from schema.py (0005 / 0006). The user's text becomes a
+# boolean-mode query in which every word is required and the last one may be a
+# prefix ("dark mod" finds "dark mode"). Each table is ranked by MATCH()
+# relevance and cut to one page before the two are merged, so a search never
+# sorts more than a couple of pages of rows however many match. Snippets are
+# cut and highlighted here, from the row text.
+
+SEARCH_DEFAULT_LIMIT = int(os.getenv("SEARCH_DEFAULT_LIMIT", "20"))
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "100"))
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "1000"))  # deepest offset + limit served
+SEARCH_MAX_TERMS = 8
+SEARCH_SNIPPET_CHARS = int(os.getenv("SEARCH_SNIPPET_CHARS", "160"))
+
+# InnoDB skips these (default innodb_ft_min_token_size and stopword list); a
+# required "+the" would match nothing, so they are dropped from the query.
+MIN_TERM_LENGTH = 3
+STOPWORDS = frozenset(
+    "a about an are as at be by com de en for from how i in is it la of on or that the this to was what when "
+    "where who will with und www".split()
+)
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# result type -> (table, FULLTEXT columns, selected columns, snippet columns)
+SEARCH_SOURCES = {
+    "feature_request": (
+        "feature_requests",
+        ("title", "content"),
+        "id, title, content, user_id, NULL AS feature_request_id",
+        ("title", "content"),
+    ),
+    "comment": (
+        "comments",
+        ("content",),
+        "id, NULL AS title, content, user_id, feature_request_id",
+        ("content",),
+    ),
+}
+
+
+def query_terms(text: str) -> List[str]:
+    terms = []
+    for word in _WORD.findall(text.lower()):
+        if len(word) >= MIN_TERM_LENGTH and word not in STOPWORDS and word not in terms:
+            terms.append(word)
+    return terms[:SEARCH_MAX_TERMS]
+
+
+def boolean_query(terms: Sequence[str], prefix_last: bool = True) -> str:
+    # Words only come from \w+, so no boolean operator can be smuggled in.
+    parts = [f"+{term}" for term in terms]
+    if parts and prefix_last:
+        parts[-1] += "*"
+    return " ".join(parts)
+
+
+def search_sql(types: Sequence[str], query: str, offset: int, limit: int) -> Tuple[str, List[Any]]:
+    branches = []
+    params: List[Any] = []
+    for kind in types:
+        table, columns, select, _ = SEARCH_SOURCES[kind]
+        match = f"MATCH({', '.join(columns)}) AGAINST (%s IN BOOLEAN MODE)"
+        # Per-table LIMIT lets InnoDB return only the top rows by relevance.
+        branches.append(
+            f"(SELECT '{kind}' AS type, {select}, {match} AS score FROM {table} "
+            f"WHERE {match} ORDER BY score DESC LIMIT %s)"
+        )
+        params += [query, query, offset + limit]
+    sql = " UNION ALL ".join(branches) + " ORDER BY score DESC, type, id LIMIT %s OFFSET %s"
+    return sql, params + [limit, offset]
+
+
+def snippet(text: str, terms: Sequence[str], width: int = SEARCH_SNIPPET_CHARS) -> str:
+    # ~width characters around the first match, HTML-escaped, with matching
+    # words wrapped in <mark>. Text without a match is cut from the start.
+    if not text:
+        return ""
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(t) for t in terms) + r")\w*", re.IGNORECASE) if terms else None
+    first = pattern.search(text) if pattern else None
+    start = max(0, first.start() - width // 4) if first else 0
+    end = min(len(text), start + width)
+    if start > 0:
+        space = text.find(" ", start, first.start() if first else end)
+        start = space + 1 if space != -1 else start
+    if end < len(text):
+        space = text.rfind(" ", start, end)
+        end = space if space > start else end
+    window = text[start:end]
+
+    out = []
+    pos = 0
+    for match in pattern.finditer(window) if pattern else ():
+        out.append(html.escape(window[pos:match.start()]))
+        out.append(f"<mark>{html.escape(match.group())}</mark>")
+        pos = match.end()
+    out.append(html.escape(window[pos:]))
+    return ("…" if start > 0 else "") + "".join(out) + ("…" if end < len(text) else "")
+
+
+def format_hit(row: Dict[str, Any], terms: Sequence[str]) -> Dict[str, Any]:
+    kind = row["type"]
+    hit = {"type": kind, "id": row["id"], "score": round(float(row["score"]), 4), "user_id": row["user_id"]}
+    if kind == "feature_request":
+        hit["title"] = row["title"]
+    else:
+        hit["feature_request_id"] = row["feature_request_id"]
+    hit["highlights"] = {column: snippet(row[column] or "", terms) for column in SEARCH_SOURCES[kind][3]}
+    return hit
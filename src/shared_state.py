@@ -0,0 +1,280 @@
+import argparse
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from multiprocessing.connection import Client as _connect, Listener
+from typing import Any, Dict, Optional, Tuple
+
+from response_cache import CachedResponse, make_etag
+
+# State that must be the same in every worker process: the response cache,
+# token revocations and rate-limit buckets. One server process owns the
+# objects; workers call their methods over a Unix socket:
+#   conn.send((object name, method, args)) -> conn.recv() == (ok, result)
+# prefork.py starts the server and passes its address to each worker. Other
+# process managers can run `python shared_state.py --socket PATH` and set
+# SHARED_STATE_SOCKET / SHARED_STATE_AUTHKEY for the workers.
+# Clients degrade to "miss" / "not revoked" / "allowed" and log when the
+# server is unreachable, so a lost state server never takes the API down.
+
+SHARED_STATE_SOCKET = os.getenv("SHARED_STATE_SOCKET")
+SHARED_STATE_AUTHKEY = os.getenv("SHARED_STATE_AUTHKEY", "")
+SHARED_STATE_MAX_IDLE = int(os.getenv("SHARED_STATE_MAX_IDLE", "32"))  # pooled connections per worker
+WARN_INTERVAL = 30.0
+
+
+class SharedStateError(Exception):
+    pass
+
+
+# ============================================================
+# Server (one process, shared by all workers)
+# ============================================================
+def _handle(conn, objects):
+    with conn:
+        while True:
+            try:
+                name, method, args = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                if method.startswith("_"):
+                    raise AttributeError(method)
+                result = (True, getattr(objects[name], method)(*args))
+            except Exception as err:  # reported to the caller, server keeps going
+                result = (False, f"{type(err).__name__}: {err}")
+            try:
+                conn.send(result)
+            except (EOFError, OSError):
+                return
+
+
+def serve(address: str, authkey: bytes, objects: Dict[str, Any]) -> None:
+    if os.path.exists(address):
+        os.unlink(address)  # stale socket from a previous run
+    old_umask = os.umask(0o077)  # socket readable by this user only
+    try:
+        listener = Listener(address, family="AF_UNIX", authkey=authkey, backlog=128)
+    finally:
+        os.umask(old_umask)
+    logging.info("Shared state serving %s on %s", ", ".join(objects), address)
+    with listener:
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as err:  # failed handshake; keep accepting
+                logging.warning("Shared state: rejected connection (%s)", err)
+                continue
+            threading.Thread(target=_handle, args=(conn, objects), daemon=True).start()
+
+
+def start_server(address: str, authkey: bytes, objects: Dict[str, Any], timeout: float = 5.0) -> int:
+    # Forks the server process; returns its pid once the socket accepts connections.
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        code = 0
+        try:
+            serve(address, authkey, objects)
+        except BaseException:
+            logging.exception("Shared state server crashed")
+            code = 1
+        finally:
+            os._exit(code)
+
+    deadline = time.monotonic() + timeout
+    client = Client(address, authkey)
+    while True:
+        try:
+            client.ping()
+            client.close()
+            return pid
+        except SharedStateError:
+            if time.monotonic() > deadline:
+                os.kill(pid, signal.SIGTERM)
+                raise
+            time.sleep(0.02)
+
+
+# ============================================================
+# Client (one per worker process, thread-safe)
+# ============================================================
+class Client:
+    def __init__(self, address: str, authkey: bytes, max_idle: int = SHARED_STATE_MAX_IDLE):
+        self.address = address
+        self.authkey = authkey
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _open(self):
+        try:
+            return _connect(self.address, family="AF_UNIX", authkey=self.authkey)
+        except Exception as err:
+            raise SharedStateError(f"cannot connect to shared state at {self.address}: {err}") from err
+
+    def call(self, name: str, method: str, *args):
+        # A pooled connection may predate a server restart; if sending on it
+        # fails, the server never saw the call, so it is retried once on a
+        # fresh one. A failure after the send is never retried: the server may
+        # already have applied it, and take() / invalidate() must not run twice.
+        for attempt in range(2):
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            pooled = conn is not None
+            if conn is None:
+                conn = self._open()
+            try:
+                conn.send((name, method, args))
+            except (EOFError, OSError) as err:
+                conn.close()
+                if pooled and attempt == 0:
+                    continue
+                raise SharedStateError(f"shared state call {name}.{method} failed: {err}") from err
+            try:
+                ok, result = conn.recv()
+            except (EOFError, OSError) as err:
+                conn.close()
+                raise SharedStateError(f"shared state call {name}.{method} failed: {err}") from err
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+            if not ok:
+                raise SharedStateError(f"{name}.{method}: {result}")
+            return result
+
+    def ping(self) -> bool:
+        return self.call("revocations", "stats") is not None
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class _Remote:
+    # Base for the client-side stand-ins below; rate-limits the "unreachable" warning.
+    def __init__(self, client: Client, name: str):
+        self.client = client
+        self.name = name
+        self.errors = 0
+        self._warned_at = float("-inf")
+
+    def _failed(self, err: Exception) -> None:
+        self.errors += 1
+        now = time.monotonic()
+        if now - self._warned_at >= WARN_INTERVAL:
+            self._warned_at = now
+            logging.warning("Shared %s unavailable, degrading: %s", self.name, err)
+
+
+class SharedResponseCache(_Remote):
+    # Same interface as response_cache.ResponseCache; ETags are computed here so
+    # the server only stores bytes.
+    def __init__(self, client: Client, ttl: float, name: str = "response_cache"):
+        super().__init__(client, name)
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        try:
+            return self.client.call(self.name, "get", key)
+        except SharedStateError as err:
+            self._failed(err)
+            return None
+
+    def generation(self, tags) -> Optional[Tuple[int, ...]]:
+        try:
+            return self.client.call(self.name, "generation", tuple(tags))
+        except SharedStateError as err:
+            self._failed(err)
+            return None
+
+    def put(self, key: str, body: bytes, tags, generation) -> CachedResponse:
+        entry = CachedResponse(body, make_etag(body), time.monotonic() + self.ttl, tuple(tags))
+        if generation is not None:  # None: the generation read failed, so never store
+            try:
+                self.client.call(self.name, "store", key, entry, generation)
+            except SharedStateError as err:
+                self._failed(err)
+        return entry
+
+    def invalidate(self, *tags: str) -> None:
+        try:
+            self.client.call(self.name, "invalidate", *tags)
+        except SharedStateError as err:
+            # Other workers may serve stale pages until RESPONSE_CACHE_TTL runs out.
+            self._failed(err)
+
+    def stats(self) -> Dict[str, int]:
+        try:
+            return self.client.call(self.name, "stats")
+        except SharedStateError as err:
+            self._failed(err)
+            return {"errors": self.errors}
+
+
+class SharedRevocations(_Remote):
+    # Plugged into TokenCache.shared; local revocations still apply on failure.
+    def __init__(self, client: Client, name: str = "revocations"):
+        super().__init__(client, name)
+
+    def revoke_digest(self, digest: str, expires_at: Optional[float] = None) -> None:
+        try:
+            self.client.call(self.name, "revoke_digest", digest, expires_at)
+        except SharedStateError as err:
+            self._failed(err)
+
+    def is_revoked_digest(self, digest: str) -> bool:
+        try:
+            return self.client.call(self.name, "is_revoked_digest", digest)
+        except SharedStateError as err:
+            self._failed(err)
+            return False
+
+
+class SharedTokenBuckets(_Remote):
+    # Same interface as rate_limit.TokenBuckets; fails open.
+    def __init__(self, client: Client, name: str = "rate_limits"):
+        super().__init__(client, name)
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        try:
+            return tuple(self.client.call(self.name, "take", key, rate, burst, cost))
+        except SharedStateError as err:
+            self._failed(err)
+            return True, 0.0
+
+    def stats(self) -> Dict[str, int]:
+        try:
+            return self.client.call(self.name, "stats")
+        except SharedStateError as err:
+            self._failed(err)
+            return {"errors": self.errors}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Run the shared state server for API workers.")
+    parser.add_argument("--socket", default=SHARED_STATE_SOCKET, required=not SHARED_STATE_SOCKET)
+    args = parser.parse_args(argv)
+    if not SHARED_STATE_AUTHKEY:
+        print("ERROR: set SHARED_STATE_AUTHKEY (the same value in every worker).", file=sys.stderr)
+        return 2
+
+    import api
+
+    logging.info("Shared state server starting (pid %d)", os.getpid())
+    serve(args.socket, SHARED_STATE_AUTHKEY.encode(), api.shared_state_objects())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
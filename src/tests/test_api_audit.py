@@ -0,0 +1,169 @@
+import asyncio
+import os
+import sqlite3
+
+import pytest
+
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("JWT_SECRET", "test-secret-" + "x" * 32)
+
+import api  # noqa: E402
+from audit import AuditLog  # noqa: E402
+
+USERS_TABLE = (
+    "CREATE TABLE users (id TEXT PRIMARY KEY, email TEXT, email_bidx TEXT, password_hash TEXT,"
+    " full_name TEXT, role TEXT)"
+)
+
+
+class ListSink:
+    def __init__(self):
+        self.events = []
+
+    def write(self, events):
+        self.events.extend(events)
+
+    def close(self):
+        pass
+
+
+# ------------------------------
+# sqlite3 stand-in for a mysql.connector connection (%s placeholders)
+# ------------------------------
+class SqliteCursor:
+    def __init__(self, conn):
+        self._cursor = conn.cursor()
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(sql.replace("%s", "?"), tuple(params))
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+
+class SqliteConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, **_):
+        return SqliteCursor(self._conn)
+
+    def execute(self, sql):
+        return self._conn.execute(sql)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.execute(USERS_TABLE)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def audit_sink(monkeypatch):
+    sink = ListSink()
+    log = AuditLog(sink, flush_interval=0)
+    monkeypatch.setattr(api, "audit_log", log)
+    yield sink, log
+    log.close()
+
+
+def admin_headers():
+    return {"Authorization": "Bearer " + api.generate_token("admin1", "admin")}
+
+
+NEW_USER = {"id": "u2", "email": "b@example.com", "password": "pw", "full_name": "Bo C", "role": "admin"}
+
+
+def test_create_user_is_audited(db, audit_sink):
+    sink, log = audit_sink
+    api.configure_pool(factory=lambda: SqliteConnection(db), size=1)
+    response = api.app.test_client().post("/users", json=NEW_USER, headers=admin_headers())
+    assert response.status_code == 201, response.get_json()
+    assert db.execute("SELECT role FROM users WHERE id = 'u2'").fetchall() == [("admin",)]
+
+    log.close()
+    [event] = sink.events
+    assert (event["action"], event["resource"]) == ("create", "users")
+    assert event["role"] == "admin"  # the caller's role
+    assert event["detail"] == {"new_role": "admin"}  # the created user's role
+    assert event["resource_id"] == api.hash_for_log("u2")
+
+
+# ------------------------------
+# api_async.py, with an aiomysql-shaped pool over the same sqlite3 database
+# ------------------------------
+class AsyncCursor:
+    def __init__(self, conn):
+        self._cursor = SqliteCursor(conn)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self._cursor.close()
+
+    async def execute(self, sql, params=()):
+        self._cursor.execute(sql, params)
+
+
+class AsyncConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, cursor_class=None):
+        return AsyncCursor(self._conn)
+
+    async def commit(self):
+        self._conn.commit()
+
+
+class AsyncPool:
+    def __init__(self, conn):
+        self._conn = AsyncConnection(conn)
+
+    def acquire(self):
+        pool = self
+
+        class _Acquire:
+            async def __aenter__(self):
+                return pool._conn
+
+            async def __aexit__(self, *exc):
+                pass
+
+        return _Acquire()
+
+
+def test_async_create_user_is_audited(db, audit_sink, monkeypatch):
+    pytest.importorskip("quart")
+    pytest.importorskip("aiomysql")
+    import api_async
+
+    sink, log = audit_sink
+    monkeypatch.setattr(api_async, "audit_log", log)
+    monkeypatch.setattr(api_async.app, "db_pool", AsyncPool(db), raising=False)
+
+    async def post():
+        response = await api_async.app.test_client().post("/users", json=NEW_USER, headers=admin_headers())
+        return response.status_code, await response.get_json()
+
+    status, body = asyncio.run(post())
+    assert status == 201, body
+    log.close()
+    [event] = sink.events
+    assert event["role"] == "admin"
+    assert event["detail"] == {"new_role": "admin"}
@@ -0,0 +1,142 @@
+import json
+import threading
+import time
+
+import pytest
+
+from audit import AuditLog, FileSink, make_event
+
+
+class ListSink:
+    # Collects written events; write() blocks while `gate` is clear and raises
+    # while `failures` is positive.
+    def __init__(self, failures=0):
+        self.events = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.failures = failures
+        self.closed = False
+
+    def write(self, events):
+        self.gate.wait(5)
+        if self.failures:
+            self.failures -= 1
+            raise OSError("sink down")
+        self.events.extend(events)
+
+    def close(self):
+        self.closed = True
+
+
+def events(n, action="create"):
+    return [make_event(action, "users", f"u{i}", actor="admin") for i in range(n)]
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def stalled():
+    # A log whose flusher is stuck writing one event, with room for two more queued.
+    sink = ListSink()
+    log = AuditLog(sink, max_queue=2, batch_size=1, flush_interval=0, put_timeout=0.05)
+    sink.gate.clear()
+    assert log.record("login", "auth")
+    wait_until(lambda: log.stats()["queued"] == 0)  # taken by the flusher, which now waits on the gate
+    yield log, sink
+    sink.gate.set()
+    log.close()
+
+
+def test_make_event_fields():
+    event = make_event("update", "users", "u1", actor="a1", role="admin", request_id="r1", fields=["email"])
+    assert event["action"] == "update"
+    assert event["resource_id"] == "u1"
+    assert event["detail"] == {"fields": ["email"]}
+    assert make_event("delete", "comments")["detail"] is None
+
+
+def test_disabled_log_records_nothing():
+    log = AuditLog(None)
+    assert not log.enabled
+    assert log.record_many(events(3)) == 0
+    log.close()
+
+
+def test_queue_full_without_blocking_drops_at_once(stalled):
+    log, _ = stalled
+    start = time.monotonic()
+    assert log.record_many(events(5), block=False) == 2
+    assert time.monotonic() - start < 0.05
+    stats = log.stats()
+    assert (stats["recorded"], stats["dropped"], stats["blocked"]) == (3, 3, 0)
+
+
+def test_queue_full_blocks_once_per_call_then_drops(stalled):
+    log, _ = stalled
+    start = time.monotonic()
+    # Two fit; the rest share one put_timeout deadline instead of waiting each.
+    assert log.record_many(events(10)) == 2
+    elapsed = time.monotonic() - start
+    assert 0.05 <= elapsed < 0.5
+    stats = log.stats()
+    assert (stats["dropped"], stats["blocked"]) == (8, 1)
+    assert log.record("update", "users", "u9") is False
+
+
+def test_blocked_writer_proceeds_when_flusher_catches_up(stalled):
+    log, sink = stalled
+    log.put_timeout = 5
+    log.record_many(events(2))
+    threading.Timer(0.05, sink.gate.set).start()
+    assert log.record_many(events(2)) == 2
+    assert log.stats()["dropped"] == 0
+
+
+def test_close_drains_queue():
+    sink = ListSink()
+    log = AuditLog(sink, batch_size=3, flush_interval=10)
+    assert log.record_many(events(10)) == 10
+    log.close()
+    assert len(sink.events) == 10
+    assert [e["resource_id"] for e in sink.events] == [f"u{i}" for i in range(10)]
+    assert sink.closed
+    stats = log.stats()
+    assert (stats["written"], stats["queued"], stats["dropped"]) == (10, 0, 0)
+
+
+def test_failed_batch_is_retried_not_lost():
+    sink = ListSink(failures=2)
+    log = AuditLog(sink, flush_interval=0, retry_interval=0.01)
+    log.record_many(events(4))
+    wait_until(lambda: len(sink.events) == 4)
+    assert log.stats()["failures"] == 2
+    log.close()
+
+
+def test_close_spills_to_fallback_when_sink_refuses(tmp_path):
+    sink = ListSink(failures=10 ** 6)
+    fallback = FileSink(str(tmp_path / "audit-fallback.log"), fsync=False)
+    log = AuditLog(sink, fallback=fallback, flush_interval=0, retry_interval=60)
+    log.record_many(events(3))
+    wait_until(lambda: log.stats()["failures"] >= 1)
+    start = time.monotonic()
+    log.close(timeout=5)
+    assert time.monotonic() - start < 5  # the 60s retry wait is cut short
+    lines = (tmp_path / "audit-fallback.log").read_text().splitlines()
+    assert [json.loads(line)["resource_id"] for line in lines] == ["u0", "u1", "u2"]
+    stats = log.stats()
+    assert (stats["spilled"], stats["written"]) == (3, 0)
+
+
+def test_record_after_close_writes_inline():
+    sink = ListSink()
+    log = AuditLog(sink)
+    log.close()
+    assert log.record("delete", "users", "u1")
+    assert [e["resource_id"] for e in sink.events] == ["u1"]
+    log.close()  # second close is a no-op
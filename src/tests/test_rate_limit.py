@@ -0,0 +1,152 @@
+import threading
+import time
+
+import pytest
+
+import rate_limit
+from rate_limit import AdmissionController, Limit, Overloaded, TokenBuckets, parse_limit
+
+
+class FakeClock:
+    # Stands in for the `time` module inside rate_limit.
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", fake)
+    return fake
+
+
+# ------------------------------
+# parse_limit
+# ------------------------------
+@pytest.mark.parametrize("spec, expected", [
+    ("20/minute", Limit(20 / 60, 20.0)),
+    ("5/15m", Limit(5 / 900, 5.0)),
+    ("100/second burst 200", Limit(100.0, 200.0)),
+    (" 10 / 2 h ", Limit(10 / 7200, 10.0)),
+    ("3/DAY", Limit(3 / 86400, 3.0)),
+])
+def test_parse_limit(spec, expected):
+    assert parse_limit(spec) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("spec", [None, "", "0", "off", "OFF", " none "])
+def test_parse_limit_disabled(spec):
+    assert parse_limit(spec) is None
+
+
+@pytest.mark.parametrize("spec", ["20", "20/fortnight", "x/minute", "20/minute burst", "-1/s"])
+def test_parse_limit_invalid(spec):
+    with pytest.raises(ValueError, match="invalid rate limit"):
+        parse_limit(spec)
+
+
+# ------------------------------
+# TokenBuckets
+# ------------------------------
+def test_bucket_allows_burst_then_limits(clock):
+    buckets = TokenBuckets()
+    assert [buckets.take("k", rate=1.0, burst=3)[0] for _ in range(4)] == [True, True, True, False]
+    assert buckets.stats() == {"keys": 1, "allowed": 3, "limited": 1}
+
+
+def test_bucket_refills_at_rate_up_to_burst(clock):
+    buckets = TokenBuckets()
+    for _ in range(3):
+        buckets.take("k", rate=2.0, burst=3)
+    clock.now += 0.5  # one token back
+    assert buckets.take("k", rate=2.0, burst=3) == (True, 0.0)
+    assert buckets.take("k", rate=2.0, burst=3)[0] is False
+    clock.now += 3600  # refill stops at burst
+    assert [buckets.take("k", rate=2.0, burst=3)[0] for _ in range(4)] == [True, True, True, False]
+
+
+def test_retry_after_is_time_until_enough_tokens(clock):
+    buckets = TokenBuckets()
+    buckets.take("k", rate=0.5, burst=1)  # 1 token per 2s, now empty
+    allowed, retry_after = buckets.take("k", rate=0.5, burst=1)
+    assert not allowed
+    assert retry_after == pytest.approx(2.0)
+    clock.now += 1.5
+    allowed, retry_after = buckets.take("k", rate=0.5, burst=1)
+    assert not allowed
+    assert retry_after == pytest.approx(0.5)
+    # A refused take costs nothing: the token arrives on schedule.
+    clock.now += 0.5
+    assert buckets.take("k", rate=0.5, burst=1) == (True, 0.0)
+
+
+def test_retry_after_respects_cost(clock):
+    buckets = TokenBuckets()
+    allowed, retry_after = buckets.take("k", rate=1.0, burst=4, cost=5)
+    assert not allowed
+    assert retry_after == pytest.approx(1.0)
+
+
+def test_retry_after_zero_rate_is_infinite(clock):
+    buckets = TokenBuckets()
+    buckets.take("k", rate=0.0, burst=1)
+    assert buckets.take("k", rate=0.0, burst=1) == (False, float("inf"))
+
+
+def test_buckets_are_per_key_and_lru_bounded(clock):
+    buckets = TokenBuckets(max_keys=2)
+    buckets.take("a", rate=1.0, burst=1)
+    buckets.take("b", rate=1.0, burst=1)
+    assert buckets.take("a", rate=1.0, burst=1)[0] is False  # "a" is now most recent
+    buckets.take("c", rate=1.0, burst=1)  # evicts "b"
+    assert buckets.stats()["keys"] == 2
+    assert buckets.take("b", rate=1.0, burst=1)[0] is True  # forgotten, so full again
+    assert buckets.take("a", rate=1.0, burst=1)[0] is True  # evicted in turn by "b"
+    assert buckets.stats()["keys"] == 2
+
+
+# ------------------------------
+# AdmissionController
+# ------------------------------
+def test_admission_sheds_over_cap():
+    admission = AdmissionController(max_in_flight=2)
+    admission.acquire()
+    admission.acquire()
+    with pytest.raises(Overloaded):
+        admission.acquire()
+    assert admission.stats() == {"max_in_flight": 2, "in_flight": 2, "admitted": 2, "shed": 1}
+    admission.release()
+    admission.acquire()
+    assert admission.stats()["in_flight"] == 2
+    assert admission.stats()["admitted"] == 3
+
+
+def test_admission_waits_up_to_max_wait():
+    admission = AdmissionController(max_in_flight=1, max_wait=5.0)
+    admission.acquire()
+    threading.Timer(0.05, admission.release).start()
+    start = time.monotonic()
+    admission.acquire()  # gets the released slot instead of being shed
+    assert time.monotonic() - start < 5.0
+    assert admission.stats()["shed"] == 0
+
+
+def test_admission_sheds_after_max_wait():
+    admission = AdmissionController(max_in_flight=1, max_wait=0.05)
+    admission.acquire()
+    start = time.monotonic()
+    with pytest.raises(Overloaded):
+        admission.acquire()
+    assert time.monotonic() - start >= 0.05
+    assert admission.stats()["shed"] == 1
+
+
+def test_admission_disabled():
+    admission = AdmissionController(max_in_flight=0)
+    for _ in range(100):
+        admission.acquire()
+    admission.release()
+    assert admission.stats()["admitted"] == 0
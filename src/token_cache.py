@@ -0,0 +1,127 @@
+import hashlib
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+    # LRU of verified JWT payloads keyed by token digest; entries live until the
+    # token's own `exp` (capped by max_ttl) so a cached hit is never more
+    # permissive than jwt.decode would have been.
+    def __init__(self, max_entries: int = 10000, max_ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._revoked: Dict[str, float] = {}
+        # (expires_at, digest) min-heap, so expired revocations are dropped without a scan.
+        self._revoked_expiry: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+        # Optional revocation store shared with other processes (see shared_state.py).
+        self.shared = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        key = token_digest(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, token: str, payload: Dict[str, Any]) -> None:
+        if self.max_entries <= 0:
+            return
+        exp = payload.get("exp")
+        now = time.time()
+        expires_at = now + self.max_ttl
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        if expires_at <= now:
+            return
+
+        key = token_digest(token)
+        with self._lock:
+            if key in self._revoked:
+                return
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # ------------------------------
+    # Revocation
+    # ------------------------------
+    def revoke(self, token: str, expires_at: Optional[float] = None) -> None:
+        self.revoke_digest(token_digest(token), expires_at)
+
+    def revoke_digest(self, digest: str, expires_at: Optional[float] = None) -> None:
+        # Revocations are kept until the token would have expired anyway.
+        expires_at = expires_at if expires_at is not None else float("inf")
+        with self._lock:
+            self._prune_revoked(time.time())
+            self._revoked[digest] = expires_at
+            if expires_at != float("inf"):
+                heapq.heappush(self._revoked_expiry, (expires_at, digest))
+            self._entries.pop(digest, None)
+        if self.shared is not None:
+            self.shared.revoke_digest(digest, expires_at)
+
+    def _prune_revoked(self, now: float) -> None:
+        # Caller holds the lock. A digest revoked again with a later expiry keeps its entry.
+        heap = self._revoked_expiry
+        while heap and heap[0][0] <= now:
+            expires_at, digest = heapq.heappop(heap)
+            if self._revoked.get(digest) == expires_at:
+                del self._revoked[digest]
+
+    def load_revocations(self, digests: Iterable[str]) -> None:
+        for digest in digests:
+            digest = digest.strip()
+            if digest:
+                self.revoke_digest(digest)
+
+    def is_revoked(self, token: str) -> bool:
+        digest = token_digest(token)
+        if self.is_revoked_digest(digest):
+            return True
+        # Another worker may have revoked it.
+        return self.shared is not None and self.shared.is_revoked_digest(digest)
+
+    def is_revoked_digest(self, digest: str) -> bool:
+        now = time.time()
+        with self._lock:
+            self._prune_revoked(now)
+            expires_at = self._revoked.get(digest)
+            return expires_at is not None and expires_at > now
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "revoked": len(self._revoked),
+            }